@@ -1,17 +1,20 @@
 from fastapi import APIRouter
-from binance.client import Client
-import os
+from binance_client import binance
+from watcher.user_data_stream import account_view
 
 router = APIRouter()
 
-client = Client(
-    api_key=os.getenv("BINANCE_API_KEY"),
-    api_secret=os.getenv("BINANCE_API_SECRET")
-)
-
 @router.get("/account-info")
 async def get_account_info():
-    account = client.get_account()
+    # Из стрима пользовательских данных, пока он синхронизирован
+    if account_view.synced:
+        return {
+            "account": account_view.account,
+            "balances": account_view.get_balances(),
+            "updatedAt": account_view.updated_at
+        }
+
+    account = await binance.get_account()
     balances = [
         {
             "asset": b["asset"],
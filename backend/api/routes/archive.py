@@ -1,5 +1,8 @@
-from fastapi import APIRouter, Query
-from redis_client import redis_client
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+from redis_client import async_redis
+from trade_archive import ARCHIVE_KEY, get_range_stats, get_stats
 import json
 
 router = APIRouter()
@@ -7,23 +10,32 @@ router = APIRouter()
 @router.post("/archive")
 async def get_archive(
     symbol: str = Query(...),
-    page: int = Query(1),
-    limit: int = Query(50)
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=500),
+    start: str | None = Query(None, description="С дня, YYYY-MM-DD"),
+    end: str | None = Query(None, description="По день, YYYY-MM-DD")
 ):
-    key = f"archive:{symbol.upper()}"
-    start = (page - 1) * limit
-    end = start + limit - 1
-    raw = await redis_client.lrange(key, start, end)  # список JSON-строк
+    days = {}
+    for name, day in (("start", start), ("end", end)):
+        if day:
+            try:
+                days[name] = datetime.strptime(day, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid {name} date {day!r}, expected YYYY-MM-DD")
+    if len(days) == 2 and days["start"] > days["end"]:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+
+    key = ARCHIVE_KEY.format(symbol.upper())
+    offset = (page - 1) * limit
+    raw = await async_redis.lrange(key, offset, offset + limit - 1)  # список JSON-строк
 
     rows = [json.loads(item) for item in raw] if raw else []
 
-    # Здесь можно сделать простую агрегацию по прибыли и т.п. вручную
-    profit = sum(item.get('profit', 0) for item in rows)
-    trades = len(rows)
-    profitPercentage = (
-        (profit / sum(item.get('totalBuyQuoteQty', 1) for item in rows)) * 100
-        if rows else 0
-    )
+    # Итоги по всему архиву (или за период) из агрегатов, а не по строкам страницы
+    if start or end:
+        stats = await get_range_stats(symbol, start, end)
+    else:
+        stats = await get_stats(symbol)
 
     return {
         "success": True,
@@ -31,10 +43,6 @@ async def get_archive(
         "message": "OK",
         "data": {
             "rows": rows,
-            "stats": {
-                "profit": profit,
-                "profitPercentage": profitPercentage,
-                "trades": trades
-            }
+            "stats": stats
         }
     }
@@ -1,16 +1,109 @@
-from fastapi import APIRouter, Query
+from collections import OrderedDict
+
+from fastapi import APIRouter, Query, Request, Response
+from fastapi.responses import JSONResponse
 from redis import Redis
-import json
+from redis.asyncio import Redis as AsyncRedis
+from candle_store import MAX_CANDLES, candle_key, read_candles
+from watcher.ws_binance_client import KLINE_STREAMS_CHANNEL, KLINE_STREAMS_KEY
 
 router = APIRouter()
 redis = Redis(host="redis", port=6379, decode_responses=True)
+# Свечи хранятся в бинарном виде — отдельный клиент без декодирования строк
+redis_binary = AsyncRedis(host="redis", port=6379)
+
+CACHE_SIZE = 64
+
+
+class CandleCache:
+    """LRU уже декодированных закрытых свечей по ключам.
+
+    Закрытые свечи не меняются, поэтому на повторный запрос из Redis
+    дочитывается только хвост после последней закрытой свечи.
+    """
+
+    def __init__(self, size: int = CACHE_SIZE):
+        self.size = size
+        self.series: OrderedDict[str, list] = OrderedDict()
+
+    async def load(self, key: str) -> list:
+        closed = self.series.get(key)
+        if closed is None:
+            tail = await read_candles(redis_binary, key)
+            closed = []
+        else:
+            self.series.move_to_end(key)
+            since = closed[-1]['t'] + 1 if closed else None
+            tail = await read_candles(redis_binary, key, start=since)
+
+        # Пока ждали Redis, другой запрос мог уже дописать эти свечи
+        last = closed[-1]['t'] if closed else None
+        tail = [c for c in tail if last is None or c['t'] > last]
+
+        split = 0
+        while split < len(tail) and tail[split]['x']:
+            split += 1
+        if split:
+            closed = (closed + tail[:split])[-MAX_CANDLES:]
+        self.series[key] = closed
+        if len(self.series) > self.size:
+            self.series.popitem(last=False)
+
+        return closed + tail[split:]
+
+
+cache = CandleCache()
+
 
 @router.get("/candles")
-def get_candles(symbol: str = Query(...), interval: str = Query("1m")):
-    key = f"candles:{symbol}:{interval}"
+async def get_candles(
+    request: Request,
+    symbol: str = Query(...),
+    interval: str = Query("1m"),
+    start: int | None = Query(None, description="Open time от, мс"),
+    end: int | None = Query(None, description="Open time до, мс"),
+    limit: int | None = Query(None, ge=1, le=MAX_CANDLES)
+):
+    key = candle_key(symbol, interval)
     try:
-        raw_data = redis.zrange(key, 0, -1)
-        candles = [json.loads(item) for item in raw_data]
-        return candles
+        if start is not None or end is not None:
+            # Диапазон — запросом по score, в том числе за пределами кэша последних свечей
+            candles = await read_candles(redis_binary, key, start=start, end=end, limit=limit)
+        else:
+            candles = await cache.load(key)
+            if limit is not None:
+                candles = candles[-limit:]
     except Exception as e:
         return {"error": f"Failed to load candles: {str(e)}"}
+
+    # ETag по последней свече ответа и параметрам запроса: пока она не изменилась,
+    # графику нечего перерисовывать, а разные запросы не делят один валидатор
+    params = f"{key}:{start if start is not None else ''}:{end if end is not None else ''}:{limit or ''}"
+    last = f'{candles[-1]["t"]}-{candles[-1]["c"]}-{candles[-1]["v"]}' if candles else "empty"
+    etag = f'"{last}:{params}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+
+    response = JSONResponse(candles)
+    response.headers["ETag"] = etag
+    return response
+
+
+@router.get("/candles/streams")
+def get_candle_streams():
+    return {"streams": sorted(redis.smembers(KLINE_STREAMS_KEY))}
+
+@router.post("/candles/streams")
+def update_candle_streams(
+    symbol: str = Query(...),
+    interval: str = Query("1m"),
+    active: bool = Query(...)
+):
+    """Включить/выключить загрузку свечей по паре; воркер подхватит изменение сразу"""
+    pair = f"{symbol.upper()}:{interval}"
+    if active:
+        redis.sadd(KLINE_STREAMS_KEY, pair)
+    else:
+        redis.srem(KLINE_STREAMS_KEY, pair)
+    redis.publish(KLINE_STREAMS_CHANNEL, pair)
+    return {"success": True, "streams": sorted(redis.smembers(KLINE_STREAMS_KEY))}
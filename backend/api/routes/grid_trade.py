@@ -2,13 +2,17 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import List
 import json
-import asyncio
 from datetime import datetime
 from redis_client import (
+    EVENTS_MAXLEN,
+    EVENTS_STREAM,
+    async_redis,
     redis_client,
     save_grid,
     get_grid,
+    get_grid_changes,
     set_live_grid,
+    trigger_level,
     delete_live_grid,
     set_monitoring
 )
@@ -49,9 +53,11 @@ async def publish_event(event_type: str, symbol: str, data: dict = None):
             "data": data or {}
         }
 
-        # Публикуем в канал events (тот же, который слушает WebSocket сервер)
-        result = redis_client.publish("events", json.dumps(event))
-        logger.info(f"Published event {event_type} for {symbol}, subscribers: {result}")
+        # Пишем в стрим событий (его читают все воркеры WebSocket сервера)
+        event_id = await async_redis.xadd(
+            EVENTS_STREAM, {"event": json.dumps(event)}, maxlen=EVENTS_MAXLEN, approximate=True
+        )
+        logger.info(f"Published event {event_type} for {symbol}, id: {event_id}")
 
     except Exception as e:
         logger.error(f"Error publishing event: {e}")
@@ -60,7 +66,7 @@ async def publish_event(event_type: str, symbol: str, data: dict = None):
 @router.post("/grid-trade")
 async def set_grid_trade(request: GridTradeRequest):
     try:
-        save_grid(request.symbol, [level.dict() for level in request.levels])
+        await save_grid(request.symbol, [level.dict() for level in request.levels])
 
         # Публикуем событие о сохранении грида
         await publish_event(
@@ -79,10 +85,9 @@ async def set_grid_trade(request: GridTradeRequest):
 
 @router.get("/grid-trade")
 async def get_grid_trade(symbol: str = Query(...)):
-    key = f"grid:settings:{symbol.upper()}"
-    data = redis_client.get(key)
+    grid_data = await get_grid(symbol)
 
-    if not data:
+    if not grid_data:
         default_grid = [
             {
                 "triggered": False,
@@ -97,7 +102,7 @@ async def get_grid_trade(symbol: str = Query(...)):
                 "sell": {"price": "66000", "quantity": "0.001"},
             }
         ]
-        redis_client.set(key, json.dumps(default_grid))
+        await save_grid(symbol, default_grid)
 
         # Публикуем событие о создании дефолтного грида
         await publish_event(
@@ -108,18 +113,32 @@ async def get_grid_trade(symbol: str = Query(...)):
 
         return {"symbol": symbol.upper(), "gridTrade": default_grid}
 
-    return {"symbol": symbol.upper(), "gridTrade": json.loads(data)}
+    return {"symbol": symbol.upper(), "gridTrade": grid_data}
+
+
+@router.get("/grid-trade/changes")
+async def get_grid_trade_changes(
+    symbol: str = Query(...),
+    since: int = Query(0, ge=0, description="Версия грида, известная клиенту"),
+    live: bool = Query(True)
+):
+    """Только уровни, изменённые после версии since"""
+    version, count, levels, _ = await get_grid_changes(symbol, since, live)
+    return {
+        "symbol": symbol.upper(),
+        "version": version,
+        "levels_count": count,
+        "levels": {str(index): level for index, level in levels.items()}
+    }
 
 
 @router.post("/grid-trade/start")
 async def start_grid_trade(symbol: str = Query(...)):
-    settings_key = f"grid:settings:{symbol.upper()}"
-    data = redis_client.get(settings_key)
-    if not data:
+    grid_data = await get_grid(symbol)
+    if not grid_data:
         raise HTTPException(status_code=404, detail="Grid settings not found")
 
-    grid_data = json.loads(data)
-    set_live_grid(symbol, grid_data)
+    await set_live_grid(symbol, grid_data)
     set_monitoring(symbol, "1")
 
     # Публикуем событие о запуске грида
@@ -138,7 +157,7 @@ async def start_grid_trade(symbol: str = Query(...)):
 
 @router.post("/grid-trade/stop")
 async def stop_grid_trade(symbol: str = Query(...)):
-    delete_live_grid(symbol)
+    await delete_live_grid(symbol)
     set_monitoring(symbol, "0")
 
     # Публикуем событие об остановке грида
@@ -159,8 +178,9 @@ async def stop_grid_trade(symbol: str = Query(...)):
 async def trigger_grid_level(symbol: str = Query(...), level_index: int = Query(...), side: str = Query(...)):
     """Эндпоинт для триггера уровня грида (вызывается воркером или вручную)"""
     try:
-        # Здесь должна быть логика обновления статуса уровня
-        # Для примера просто публикуем событие
+        if await trigger_level(symbol, level_index, side) is None:
+            raise HTTPException(status_code=409, detail="Level not found or already triggered")
+
         await publish_event(
             event_type="grid-level-triggered",
             symbol=symbol,
@@ -172,6 +192,8 @@ async def trigger_grid_level(symbol: str = Query(...), level_index: int = Query(
         )
 
         return {"message": f"Level {level_index} {side} triggered for {symbol.upper()}"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -181,16 +203,16 @@ async def get_grid_status(symbol: str = Query(...)):
     """Получение текущего статуса грида"""
     try:
         monitoring_status = redis_client.get(f"monitoring:{symbol.upper()}")
-        live_grid = redis_client.get(f"grid:live:{symbol.upper()}")
-        settings_grid = redis_client.get(f"grid:settings:{symbol.upper()}")
+        live_grid = await get_grid(symbol, live=True)
+        settings_grid = await get_grid(symbol)
 
         status = {
             "symbol": symbol.upper(),
             "is_active": monitoring_status == "1",
-            "has_live_grid": live_grid is not None,
-            "has_settings": settings_grid is not None,
-            "live_grid_data": json.loads(live_grid) if live_grid else None,
-            "settings_data": json.loads(settings_grid) if settings_grid else None
+            "has_live_grid": bool(live_grid),
+            "has_settings": bool(settings_grid),
+            "live_grid_data": live_grid or None,
+            "settings_data": settings_grid or None
         }
 
         # Публикуем событие о запросе статуса (опционально)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import List
-from redis_client import redis
+from redis_client import get_grid, save_grid
 
 router = APIRouter()
 
@@ -21,8 +21,11 @@ class GridTradeSettingsRequest(BaseModel):
 @router.post("/grid-trade-settings")
 async def save_grid_trade_settings(request: GridTradeSettingsRequest):
     try:
-        key = f"grid:settings:{request.symbol.upper()}"
-        await redis.set(key, request.model_dump_json())
+        levels = [
+            {"triggered": False, "status": "", **level.model_dump()}
+            for level in request.levels
+        ]
+        await save_grid(request.symbol, levels)
         return {"message": "Settings saved", "levels": len(request.levels)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -30,12 +33,11 @@ async def save_grid_trade_settings(request: GridTradeSettingsRequest):
 
 @router.get("/grid-trade-settings")
 async def get_grid_trade_settings(symbol: str = Query(...)):
-    key = f"grid:settings:{symbol.upper()}"
-    data = await redis.get(key)
-    if not data:
-        return {"symbol": symbol.upper(), "gridTradeSettings": []}
     try:
-        obj = GridTradeSettingsRequest.model_validate_json(data)
-        return {"symbol": obj.symbol, "gridTradeSettings": obj.levels}
+        levels = await get_grid(symbol)
+        return {
+            "symbol": symbol.upper(),
+            "gridTradeSettings": [GridLevelSetting.model_validate(level) for level in levels]
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
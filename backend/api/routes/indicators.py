@@ -0,0 +1,41 @@
+import json
+
+from fastapi import APIRouter, Query
+from redis.asyncio import Redis as AsyncRedis
+
+from api.routes.candles import cache
+from candle_store import MAX_CANDLES, candle_key
+from indicators import compute_series, indicator_key, series_to_rows
+
+router = APIRouter()
+redis = AsyncRedis(host="redis", port=6379, decode_responses=True)
+
+
+@router.get("/indicators")
+async def get_indicators(
+    symbol: str = Query(...),
+    interval: str = Query("1m"),
+    limit: int | None = Query(None, ge=1, le=MAX_CANDLES, description="Вернуть ряд по последним limit свечам")
+):
+    """Последние значения индикаторов (их обновляет загрузчик свечей),
+    при limit — ещё и ряд по свечам из хранилища, посчитанный векторно"""
+    data = await redis.get(indicator_key(symbol, interval))
+    result = {
+        "symbol": symbol.upper(),
+        "interval": interval,
+        "latest": json.loads(data)["data"] if data else None
+    }
+
+    if limit is not None:
+        candles = await cache.load(candle_key(symbol, interval))
+        # Индикаторы прогреваются на всей истории, отдаются последние limit
+        series = compute_series(
+            [c['t'] for c in candles],
+            [c['h'] for c in candles],
+            [c['l'] for c in candles],
+            [c['c'] for c in candles],
+            [c['v'] for c in candles],
+        )
+        result["series"] = series_to_rows(series)[-limit:]
+
+    return result
@@ -1,21 +1,35 @@
 from fastapi import APIRouter, Query
-from redis_client import redis_client
+from redis.exceptions import ResponseError
+from redis_client import async_redis
+from trade_log import log_key, read_logs
 import json
 
 router = APIRouter()
 
 @router.get("/logs")
-def get_logs(symbol: str = Query(...)):
-    key = f"logs:{symbol.upper()}"
-    raw = redis_client.lrange(key, -100, -1)
-
-    logs = [json.loads(item) for item in raw] if raw else []
+async def get_logs(
+    symbol: str = Query(...),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = Query(None, description="next_cursor из предыдущей страницы"),
+    type: str | None = Query(None, description="Типы событий через запятую: BUY,SELL"),
+    start: int | None = Query(None, description="От, мс"),
+    end: int | None = Query(None, description="До, мс")
+):
+    types = {t.strip().upper() for t in type.split(",") if t.strip()} if type else None
+    try:
+        logs, next_cursor = await read_logs(async_redis, symbol, limit, cursor, types, start, end)
+    except ResponseError:
+        # Журнал ещё в старом формате (список) — до миграции отдаём хвост как раньше
+        raw = await async_redis.lrange(log_key(symbol), -limit, -1)
+        logs, next_cursor = [json.loads(item) for item in reversed(raw)], None
 
     return {
         "success": True,
         "status": 200,
         "message": "OK",
         "data": {
-            "rows": logs
+            # Как и раньше, от старых к новым
+            "rows": logs[::-1],
+            "next_cursor": next_cursor
         }
     }
@@ -1,30 +1,18 @@
 from fastapi import APIRouter, Query
-from redis import Redis
-import json
 
-router = APIRouter()
-redis = Redis(host="redis", port=6379, decode_responses=True)
+from redis_client import get_monitored_symbols, set_symbol_monitored
 
-MONITORING_KEY = "monitoring-symbols"
+router = APIRouter()
 
 @router.get("/monitoring")
-def get_monitored_symbols():
-    data = redis.get(MONITORING_KEY)
-    return {"symbols": json.loads(data) if data else []}
+def get_monitored_symbols_route():
+    return {"symbols": sorted(get_monitored_symbols())}
 
 @router.post("/monitoring")
 def update_monitored_symbols(
     symbol: str = Query(...),
     active: bool = Query(...)
 ):
-    data = redis.get(MONITORING_KEY)
-    current = set(json.loads(data)) if data else set()
-
-    symbol = symbol.upper()
-    if active:
-        current.add(symbol)
-    else:
-        current.discard(symbol)
-
-    redis.set(MONITORING_KEY, json.dumps(list(current)))
-    return {"success": True, "symbols": list(current)}
+    # SADD/SREM атомарны, GridWatcher узнаёт об изменении сразу через канал
+    set_symbol_monitored(symbol, active)
+    return {"success": True, "symbols": sorted(get_monitored_symbols())}
@@ -1,14 +1,13 @@
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
-from binance.client import Client
-import os
+import json
 
-router = APIRouter()
+from binance_client import binance
+from redis_client import async_redis
+from watcher.order_executor import LATENCY_KEY
+from watcher.user_data_stream import account_view
 
-client = Client(
-    api_key=os.getenv("BINANCE_API_KEY"),
-    api_secret=os.getenv("BINANCE_API_SECRET")
-)
+router = APIRouter()
 
 class CreateOrderRequest(BaseModel):
     symbol: str = Field(..., example="BTCUSDT")
@@ -20,13 +19,32 @@ class CreateOrderRequest(BaseModel):
 
 @router.get("/open-orders")
 async def get_open_orders(symbol: str = Query(..., description="Trading pair like BTCUSDT")):
+    if account_view.synced:
+        return {"symbol": symbol.upper(), "open_orders": account_view.get_open_orders(symbol.upper())}
     try:
-        orders = client.get_open_orders(symbol=symbol.upper())
+        orders = await binance.get_open_orders(symbol=symbol.upper())
         return {"symbol": symbol.upper(), "open_orders": orders}
     except Exception as e:
         return {"error": str(e)}
 
 
+@router.get("/order")
+async def get_order(
+    symbol: str = Query(..., description="Trading pair like BTCUSDT"),
+    clientOrderId: str = Query(..., description="Client order ID")
+):
+    """Статус ордера: из стрима пользовательских данных, иначе запросом к Binance"""
+    if account_view.synced:
+        order = account_view.order_status(clientOrderId)
+        if order is not None and order["symbol"] == symbol.upper():
+            return {"order": order}
+    try:
+        order = await binance.get_order(symbol.upper(), origClientOrderId=clientOrderId)
+        return {"order": order}
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/order")
 async def create_order(order: CreateOrderRequest):
     try:
@@ -42,7 +60,7 @@ async def create_order(order: CreateOrderRequest):
             params["price"] = str(order.price)
             params["timeInForce"] = order.timeInForce
 
-        response = client.create_order(**params)
+        response = await binance.create_order(**params)
         return {"message": "Order created", "order": response}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -53,7 +71,24 @@ async def cancel_order(
     orderId: int = Query(..., description="Binance order ID")
 ):
     try:
-        result = client.cancel_order(symbol=symbol.upper(), orderId=orderId)
+        result = await binance.cancel_order(symbol=symbol.upper(), orderId=orderId)
         return {"message": "Order canceled", "result": result}
     except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/orders/latency")
+async def get_order_latency(limit: int = Query(100, ge=1, le=1000)):
+    """Задержки от срабатывания уровня до ответа биржи по последним ордерам"""
+    entries = [json.loads(item) for item in await async_redis.lrange(LATENCY_KEY, 0, limit - 1)]
+    latencies = sorted(entry["latency_ms"] for entry in entries)
+
+    def percentile(p: float):
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else None
+
+    return {
+        "count": len(entries),
+        "p50_ms": percentile(0.5),
+        "p95_ms": percentile(0.95),
+        "max_ms": latencies[-1] if latencies else None,
+        "orders": entries
+    }
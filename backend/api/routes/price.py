@@ -1,15 +1,32 @@
-from fastapi import APIRouter
-from binance.client import Client
-import os
+from fastapi import APIRouter, HTTPException, Query
+from watcher.price_cache import price_cache
 
 router = APIRouter()
 
-client = Client(api_key=os.getenv("BINANCE_API_KEY"), api_secret=os.getenv("BINANCE_API_SECRET"))
-
 @router.get("/price")
-async def get_price(symbol: str = "BTCUSDT"):
-    ticker = client.get_symbol_ticker(symbol=symbol)
+async def get_price(
+    symbol: str = "BTCUSDT",
+    max_age: float | None = Query(None, ge=0, description="Допустимый возраст цены, сек")
+):
+    # Из кэша стрима; в Binance — только если цены нет или она устарела
+    ticker = await price_cache.get_price(symbol, max_age)
+    if ticker is None:
+        raise HTTPException(status_code=404, detail=f"Unknown symbol {symbol.upper()}")
     return {
         "symbol": ticker["symbol"],
         "price": ticker["price"]
     }
+
+
+@router.get("/prices")
+async def get_prices(
+    symbols: str | None = Query(None, description="Символы через запятую; без параметра — все"),
+    max_age: float | None = Query(None, ge=0, description="Допустимый возраст цены, сек")
+):
+    """Цены многих символов одним ответом: неизвестные символы — null"""
+    requested = [s.strip() for s in symbols.split(",") if s.strip()] if symbols else None
+    prices = await price_cache.get_prices(requested, max_age)
+    return {
+        "prices": {s: ticker["price"] if ticker else None for s, ticker in prices.items()},
+        "cache": price_cache.stats()
+    }
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+import json
+
+from rate_limiter import scheduler
+from redis_client import async_redis
+from telegram.alerts import STATS_KEY as ALERTS_STATS_KEY
+
+router = APIRouter()
+
+@router.get("/rate-limit")
+async def get_rate_limit_usage():
+    """Текущее использование лимитов Binance всеми процессами"""
+    return await scheduler.usage()
+
+@router.get("/rate-limit/alerts")
+async def get_alerts_usage():
+    """Очередь и счётчики отправки уведомлений в Telegram (из GridWatcher)"""
+    data = await async_redis.get(ALERTS_STATS_KEY)
+    return {"alerts": json.loads(data) if data else None}
@@ -0,0 +1,194 @@
+"""Бэктест грида на свечах из архива (см. kline_archive.py).
+
+    python backtest.py BTCUSDT --start 2024-01-01 --spacing 50,100,200 --levels 5,10,20
+
+Семантика срабатывания та же, что в grid_watcher.watch_symbol: уровень
+одноразовый, BUY при low <= buy, SELL при high >= sell, при пересечении
+обеих сторон в одной свече — BUY.
+"""
+import argparse
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from kline_archive import KLINE_ARCHIVE_DIR, load_klines
+from sync_candles import parse_time
+
+DEFAULT_FEE_RATE = 0.001  # 0.1% — базовая комиссия спота Binance
+
+
+def make_grid(center: float, spacing: float, count: int, quantity: float,
+              sell_offset: float | None = None) -> list[dict]:
+    """Грид в формате живого: покупки вниз от center с шагом spacing,
+    продажа каждого уровня на sell_offset выше покупки (по умолчанию 2 шага,
+    как в гриде по умолчанию)"""
+    if sell_offset is None:
+        sell_offset = 2 * spacing
+    levels = []
+    for i in range(count):
+        buy = center - i * spacing
+        levels.append({
+            "triggered": False,
+            "status": "",
+            "buy": {"price": str(buy), "quantity": str(quantity)},
+            "sell": {"price": str(buy + sell_offset), "quantity": str(quantity)},
+        })
+    return levels
+
+
+class Market:
+    """Свечи периода и их бегущие минимум/максимум.
+
+    Бегущий минимум low не возрастает, максимум high не убывает, поэтому
+    первая свеча, в которой цена дошла до уровня, находится бинарным поиском
+    сразу для всех уровней; считаются они один раз на весь перебор.
+    """
+
+    def __init__(self, open_time, open, high, low, close):
+        self.open_time = np.asarray(open_time)
+        self.open = np.asarray(open, dtype=np.float64)
+        self.close = np.asarray(close, dtype=np.float64)
+        # searchsorted нужен возрастающий массив — минимум берём со знаком минус
+        self.neg_running_low = -np.minimum.accumulate(np.asarray(low, dtype=np.float64))
+        self.running_high = np.maximum.accumulate(np.asarray(high, dtype=np.float64))
+
+    @classmethod
+    def from_archive(cls, symbol: str, interval: str = "1m", start: int | None = None,
+                     end: int | None = None, base_dir: str = KLINE_ARCHIVE_DIR):
+        data = load_klines(symbol, interval, start, end, base_dir)
+        return cls(data["open_time"], data["open"], data["high"], data["low"], data["close"])
+
+    def __len__(self):
+        return len(self.open_time)
+
+
+def backtest(market: Market, levels: list[dict], fee_rate: float = DEFAULT_FEE_RATE,
+             with_fills: bool = False) -> dict:
+    n = len(market)
+    if n == 0 or not levels:
+        return {"fills": 0, "buys": 0, "sells": 0, "pnl": 0.0, "fees": 0.0}
+
+    active = np.array([not level.get("triggered", False) for level in levels])
+    buy = np.array([float(level["buy"]["price"]) for level in levels])
+    sell = np.array([float(level["sell"]["price"]) for level in levels])
+    quantity = np.array([float(level["buy"]["quantity"]) for level in levels])
+
+    # Первая свеча, где low <= buy / high >= sell; n — не сработало
+    buy_at = np.searchsorted(market.neg_running_low, -buy, side="left")
+    sell_at = np.searchsorted(market.running_high, sell, side="left")
+    is_buy = buy_at <= sell_at
+    trigger_at = np.where(is_buy, buy_at, sell_at)
+    filled = active & (trigger_at < n)
+
+    idx = trigger_at[filled]
+    is_buy = is_buy[filled]
+    quantity = quantity[filled]
+    # Рыночный ордер: при гэпе через уровень исполнение по открытию свечи
+    candle_open = market.open[idx]
+    price = np.where(is_buy, np.minimum(buy[filled], candle_open), np.maximum(sell[filled], candle_open))
+
+    notional = price * quantity
+    fees = float(notional.sum() * fee_rate)
+    cash = float(notional[~is_buy].sum() - notional[is_buy].sum()) - fees
+    position = float(quantity[is_buy].sum() - quantity[~is_buy].sum())
+    last_price = float(market.close[-1])
+
+    result = {
+        "fills": int(filled.sum()),
+        "buys": int(is_buy.sum()),
+        "sells": int((~is_buy).sum()),
+        "volume": float(notional.sum()),
+        "fees": fees,
+        "cash": cash,
+        "position": position,
+        "last_price": last_price,
+        "pnl": cash + position * last_price,
+    }
+    if with_fills:
+        order = np.argsort(idx, kind="stable")
+        level_index = np.flatnonzero(filled)
+        result["fill_log"] = [
+            {
+                "time": int(market.open_time[idx[k]]),
+                "level": int(level_index[k]),
+                "side": "BUY" if is_buy[k] else "SELL",
+                "price": float(price[k]),
+                "quantity": float(quantity[k]),
+            }
+            for k in order
+        ]
+    return result
+
+
+# Перебор параметров: каждый процесс пула один раз открывает архив и считает Market
+
+_market: Market | None = None
+
+
+def _init_worker(symbol: str, interval: str, start, end, base_dir: str):
+    global _market
+    _market = Market.from_archive(symbol, interval, start, end, base_dir)
+
+
+def _run_config(config: dict) -> dict:
+    levels = make_grid(config["center"], config["spacing"], config["levels"],
+                       config["quantity"], config.get("sell_offset"))
+    result = backtest(_market, levels, config.get("fee_rate", DEFAULT_FEE_RATE))
+    return {**config, **result}
+
+
+def sweep(symbol: str, configs: list[dict], interval: str = "1m", start: int | None = None,
+          end: int | None = None, base_dir: str = KLINE_ARCHIVE_DIR, workers: int | None = None) -> list[dict]:
+    """Прогнать конфиги (center, spacing, levels, quantity) в пуле процессов"""
+    workers = workers or os.cpu_count()
+    chunksize = max(1, len(configs) // (workers * 4))
+    with ProcessPoolExecutor(workers, initializer=_init_worker,
+                             initargs=(symbol, interval, start, end, base_dir)) as pool:
+        return list(pool.map(_run_config, configs, chunksize=chunksize))
+
+
+def _floats(value: str) -> list[float]:
+    return [float(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бэктест и перебор параметров грида")
+    parser.add_argument("symbol")
+    parser.add_argument("--interval", default="1m")
+    parser.add_argument("--start", type=parse_time)
+    parser.add_argument("--end", type=parse_time)
+    parser.add_argument("--center", type=float, help="верхний уровень покупки; по умолчанию — открытие периода")
+    parser.add_argument("--spacing", type=_floats, required=True, help="шаги через запятую")
+    parser.add_argument("--levels", type=lambda v: [int(x) for x in v.split(",")], required=True)
+    parser.add_argument("--quantity", type=float, default=0.001)
+    parser.add_argument("--fee-rate", type=float, default=DEFAULT_FEE_RATE)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--data-dir", default=KLINE_ARCHIVE_DIR)
+    args = parser.parse_args()
+
+    center = args.center
+    if center is None:
+        opens = load_klines(args.symbol, args.interval, args.start, args.end, args.data_dir)["open"]
+        if len(opens) == 0:
+            parser.error("в архиве нет свечей за период — сначала sync_candles.py")
+        center = float(opens[0])
+
+    configs = [
+        {"center": center, "spacing": spacing, "levels": count,
+         "quantity": args.quantity, "fee_rate": args.fee_rate}
+        for spacing, count in itertools.product(args.spacing, args.levels)
+    ]
+    results = sweep(args.symbol.upper(), configs, args.interval, args.start, args.end,
+                    args.data_dir, args.workers)
+    results.sort(key=lambda r: r["pnl"], reverse=True)
+
+    print(f"{'spacing':>10} {'levels':>6} {'fills':>6} {'fees':>10} {'pnl':>12}")
+    for r in results[:args.top]:
+        print(f"{r['spacing']:>10g} {r['levels']:>6} {r['fills']:>6} {r['fees']:>10.4f} {r['pnl']:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
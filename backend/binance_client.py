@@ -0,0 +1,201 @@
+import hashlib
+import hmac
+import os
+import time
+from decimal import Decimal
+from urllib.parse import urlencode
+
+import httpx
+
+from rate_limiter import PRIORITY_MARKET, PRIORITY_ORDER, PRIORITY_UI, scheduler
+
+BINANCE_API_URL = os.getenv("BINANCE_API_URL", "https://api.binance.com")
+BINANCE_TIMEOUT = float(os.getenv("BINANCE_TIMEOUT", 10))
+BINANCE_MAX_CONNECTIONS = int(os.getenv("BINANCE_MAX_CONNECTIONS", 50))
+RECV_WINDOW = 5000
+
+
+class BinanceAPIError(Exception):
+    def __init__(self, status_code: int, code: int | None, message: str):
+        super().__init__(f"APIError(code={code}): {message}")
+        self.status_code = status_code
+        self.code = code
+        self.message = message
+
+
+def _format_param(value):
+    # Binance не принимает экспоненциальную запись (1e-05)
+    if isinstance(value, float):
+        return format(Decimal(str(value)), "f")
+    if isinstance(value, bool):
+        return str(value).lower()
+    return value
+
+
+class BinanceREST:
+    """Асинхронный REST-клиент Binance.
+
+    Один httpx.AsyncClient на процесс: keep-alive пул соединений, таймаут на
+    каждый вызов и параллельные запросы без блокировки event loop.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        api_secret: str | None = None,
+        base_url: str = BINANCE_API_URL,
+        timeout: float = BINANCE_TIMEOUT,
+        max_connections: int = BINANCE_MAX_CONNECTIONS,
+        scheduler=scheduler
+    ):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.scheduler = scheduler
+        self._client: httpx.AsyncClient | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            headers = {"X-MBX-APIKEY": self.api_key} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=headers,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60
+                )
+            )
+        return self._client
+
+    def _sign(self, params: dict) -> str:
+        params["timestamp"] = int(time.time() * 1000)
+        params.setdefault("recvWindow", RECV_WINDOW)
+        query = urlencode(params)
+        signature = hmac.new(self.api_secret.encode(), query.encode(), hashlib.sha256).hexdigest()
+        return f"{query}&signature={signature}"
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: dict | None = None,
+        signed: bool = False,
+        timeout: float | None = None,
+        weight: int = 1,
+        priority: int = PRIORITY_UI,
+        orders: int = 0
+    ):
+        if self.scheduler is not None:
+            await self.scheduler.acquire(weight, priority, orders)
+
+        params = {k: _format_param(v) for k, v in (params or {}).items() if v is not None}
+
+        if signed:
+            url = f"{path}?{self._sign(params)}"
+            params = None
+        else:
+            url = path
+
+        response = await self.client.request(
+            method,
+            url,
+            params=params,
+            timeout=timeout if timeout is not None else self.timeout
+        )
+
+        if self.scheduler is not None:
+            if response.status_code in (418, 429):
+                await self.scheduler.ban(float(response.headers.get("Retry-After", 60)))
+            else:
+                await self.scheduler.record(response.headers)
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {"msg": response.text}
+
+        if response.status_code >= 400:
+            raise BinanceAPIError(response.status_code, data.get("code"), data.get("msg", ""))
+        return data
+
+    # Веса запросов — по документации Binance Spot API
+
+    async def get_symbol_ticker(self, symbol: str, **kwargs):
+        kwargs.setdefault("weight", 2)
+        return await self.request("GET", "/api/v3/ticker/price", {"symbol": symbol}, **kwargs)
+
+    async def get_symbol_tickers(self, **kwargs):
+        """Цены всех символов одним запросом"""
+        kwargs.setdefault("weight", 4)
+        return await self.request("GET", "/api/v3/ticker/price", **kwargs)
+
+    async def get_klines(self, symbol: str, interval: str, limit: int = 500,
+                         start_time: int | None = None, end_time: int | None = None, **kwargs):
+        params = {
+            "symbol": symbol,
+            "interval": interval,
+            "limit": limit,
+            "startTime": start_time,
+            "endTime": end_time
+        }
+        kwargs.setdefault("weight", 2)
+        kwargs.setdefault("priority", PRIORITY_MARKET)
+        return await self.request("GET", "/api/v3/klines", params, **kwargs)
+
+    async def get_account(self, **kwargs):
+        kwargs.setdefault("weight", 20)
+        return await self.request("GET", "/api/v3/account", signed=True, **kwargs)
+
+    async def get_open_orders(self, symbol: str | None = None, **kwargs):
+        kwargs.setdefault("weight", 6 if symbol else 80)
+        return await self.request("GET", "/api/v3/openOrders", {"symbol": symbol}, signed=True, **kwargs)
+
+    async def create_order(self, timeout: float | None = None, priority: int = PRIORITY_ORDER, **params):
+        return await self.request(
+            "POST", "/api/v3/order", params, signed=True,
+            timeout=timeout, weight=1, priority=priority, orders=1
+        )
+
+    async def get_order(self, symbol: str, orderId: int | None = None,
+                        origClientOrderId: str | None = None, **kwargs):
+        params = {"symbol": symbol, "orderId": orderId, "origClientOrderId": origClientOrderId}
+        kwargs.setdefault("weight", 4)
+        kwargs.setdefault("priority", PRIORITY_ORDER)
+        return await self.request("GET", "/api/v3/order", params, signed=True, **kwargs)
+
+    async def cancel_order(self, symbol: str, orderId: int, **kwargs):
+        params = {"symbol": symbol, "orderId": orderId}
+        kwargs.setdefault("priority", PRIORITY_ORDER)
+        return await self.request("DELETE", "/api/v3/order", params, signed=True, **kwargs)
+
+    # listenKey стрима пользовательских данных: подпись не нужна, только API-ключ
+
+    async def create_listen_key(self, **kwargs) -> str:
+        kwargs.setdefault("weight", 2)
+        data = await self.request("POST", "/api/v3/userDataStream", **kwargs)
+        return data["listenKey"]
+
+    async def keepalive_listen_key(self, listen_key: str, **kwargs):
+        kwargs.setdefault("weight", 2)
+        return await self.request("PUT", "/api/v3/userDataStream", {"listenKey": listen_key}, **kwargs)
+
+    async def close_listen_key(self, listen_key: str, **kwargs):
+        kwargs.setdefault("weight", 2)
+        return await self.request("DELETE", "/api/v3/userDataStream", {"listenKey": listen_key}, **kwargs)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Общий клиент процесса
+binance = BinanceREST(
+    api_key=os.getenv("BINANCE_API_KEY"),
+    api_secret=os.getenv("BINANCE_API_SECRET")
+)
@@ -0,0 +1,86 @@
+import struct
+
+# Свеча фиксированной ширины (57 байт): open time, o, h, l, c, v, close time, closed
+CANDLE_FORMAT = struct.Struct("<q5dq?")
+MAX_CANDLES = 1000
+
+# Один слот на время открытия: незакрытая свеча заменяется на месте,
+# а не добавляется ещё одним членом zset с тем же score.
+# ARGV: max_candles, затем пары (open_time, packed candle)
+UPSERT_SCRIPT = """
+local key = KEYS[1]
+for i = 2, #ARGV, 2 do
+    redis.call('ZREMRANGEBYSCORE', key, ARGV[i], ARGV[i])
+    redis.call('ZADD', key, ARGV[i], ARGV[i + 1])
+end
+redis.call('ZREMRANGEBYRANK', key, 0, -(tonumber(ARGV[1]) + 1))
+return redis.call('ZCARD', key)
+"""
+
+_scripts = {}
+
+
+def candle_key(symbol: str, interval: str) -> str:
+    return f"klines:{symbol.upper()}:{interval}"
+
+
+def pack_candle(candle: dict) -> bytes:
+    return CANDLE_FORMAT.pack(
+        int(candle['t']),
+        float(candle['o']),
+        float(candle['h']),
+        float(candle['l']),
+        float(candle['c']),
+        float(candle['v']),
+        int(candle['T']),
+        bool(candle['x'])
+    )
+
+
+def unpack_candle(data: bytes) -> dict:
+    t, o, h, l, c, v, close_time, closed = CANDLE_FORMAT.unpack(data)
+    return {'t': t, 'o': o, 'h': h, 'l': l, 'c': c, 'v': v, 'T': close_time, 'x': closed}
+
+
+def from_rest_kline(kline: list, now_ms: int) -> dict:
+    """Свеча из ответа /api/v3/klines; закрыта, если её время уже прошло"""
+    return {
+        't': kline[0],
+        'o': kline[1],
+        'h': kline[2],
+        'l': kline[3],
+        'c': kline[4],
+        'v': kline[5],
+        'T': kline[6],
+        'x': kline[6] < now_ms,
+    }
+
+
+def upsert_candles(redis, key: str, candles: list, client=None, max_candles: int = MAX_CANDLES):
+    """Записать свечи в хранилище одним вызовом скрипта.
+
+    client — pipeline, если запись нужно объединить с другими командами.
+    Возвращает корутину/результат вызова скрипта, как и сам клиент Redis.
+    """
+    script = _scripts.get(id(redis))
+    if script is None:
+        script = _scripts[id(redis)] = redis.register_script(UPSERT_SCRIPT)
+
+    args = [max_candles]
+    for candle in candles:
+        args.append(int(candle['t']))
+        args.append(pack_candle(candle))
+    return script(keys=[key], args=args, client=client)
+
+
+async def read_candles(redis, key: str, start: int | None = None, end: int | None = None,
+                       limit: int | None = None) -> list:
+    """Свечи с open time в [start, end] по score, при limit — последние limit штук"""
+    low = start if start is not None else "-inf"
+    high = end if end is not None else "+inf"
+    if limit is None:
+        raw = await redis.zrangebyscore(key, low, high)
+    else:
+        raw = await redis.zrevrangebyscore(key, high, low, start=0, num=limit)
+        raw.reverse()
+    return [unpack_candle(item) for item in raw]
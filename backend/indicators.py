@@ -0,0 +1,287 @@
+import math
+import os
+from collections import deque
+
+import numpy as np
+
+from candle_store import candle_key, read_candles
+
+EMA_PERIODS = tuple(int(p) for p in os.getenv("INDICATOR_EMA_PERIODS", "9,21,50").split(","))
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+BB_PERIOD = 20
+BB_WIDTH = 2.0
+DAY_MS = 86400000
+
+# Сколько закрытых свечей из хранилища берём для прогрева ряда
+WARMUP_CANDLES = 500
+
+# Последние значения индикаторов ряда (JSON) и канал для WebSocket сервера
+INDICATORS_KEY = "indicators:{}:{}"
+MARKET_CHANNEL = "ws:market"
+INDICATORS_WS_CHANNEL = "indicators"
+
+_EMA_BLOCK = 128
+
+
+def indicator_key(symbol: str, interval: str) -> str:
+    return INDICATORS_KEY.format(symbol.upper(), interval)
+
+
+def _value(x: float):
+    return None if x is None or math.isnan(x) else x
+
+
+def ema_series(x: np.ndarray, alpha: float, seed: float | None = None) -> np.ndarray:
+    """y[i] = y[i-1] + alpha * (x[i] - y[i-1]), y[-1] = seed (по умолчанию x[0]).
+
+    Рекурсия раскрывается блоками: внутри блока это взвешенный cumsum,
+    блоки короткие, чтобы степени (1 - alpha) не переполнялись.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty_like(x)
+    if len(x) == 0:
+        return out
+    if alpha >= 1.0:
+        out[:] = x
+        return out
+
+    decay = 1.0 - alpha
+    prev = x[0] if seed is None else seed
+    for start in range(0, len(x), _EMA_BLOCK):
+        block = x[start:start + _EMA_BLOCK]
+        k = np.arange(len(block))
+        grow = decay ** -k
+        y = decay ** (k + 1) * prev + alpha * decay ** k * np.cumsum(block * grow)
+        out[start:start + len(block)] = y
+        prev = y[-1]
+    return out
+
+
+def compute_series(open_time, high, low, close, volume) -> dict:
+    """Индикаторы по всей истории сразу (векторно); NaN — пока не хватает свечей"""
+    t = np.asarray(open_time, dtype=np.int64)
+    h = np.asarray(high, dtype=np.float64)
+    l = np.asarray(low, dtype=np.float64)
+    c = np.asarray(close, dtype=np.float64)
+    v = np.asarray(volume, dtype=np.float64)
+    n = len(c)
+    idx = np.arange(n)
+    result = {"t": t}
+
+    for period in EMA_PERIODS:
+        result[f"ema{period}"] = ema_series(c, 2 / (period + 1))
+
+    # RSI и ATR — сглаживание Уайлдера (alpha = 1 / period)
+    rsi = np.full(n, np.nan)
+    if n > 1:
+        delta = np.diff(c)
+        avg_gain = ema_series(np.maximum(delta, 0), 1 / RSI_PERIOD)
+        avg_loss = ema_series(np.maximum(-delta, 0), 1 / RSI_PERIOD)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rsi[1:] = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+    else:
+        avg_gain = avg_loss = np.empty(0)
+    rsi[idx < RSI_PERIOD] = np.nan
+    result[f"rsi{RSI_PERIOD}"] = rsi
+
+    prev_close = np.r_[c[:1], c[:-1]]
+    tr = np.maximum(h - l, np.maximum(np.abs(h - prev_close), np.abs(l - prev_close)))
+    atr = ema_series(tr, 1 / ATR_PERIOD)
+    result[f"atr{ATR_PERIOD}"] = np.where(idx >= ATR_PERIOD - 1, atr, np.nan)
+
+    middle = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    if n >= BB_PERIOD:
+        windows = np.lib.stride_tricks.sliding_window_view(c, BB_PERIOD)
+        middle[BB_PERIOD - 1:] = windows.mean(axis=1)
+        std[BB_PERIOD - 1:] = windows.std(axis=1)
+    result["bb_middle"] = middle
+    result["bb_upper"] = middle + BB_WIDTH * std
+    result["bb_lower"] = middle - BB_WIDTH * std
+
+    # VWAP с начала суток UTC: накопленные суммы минус их значение на начало дня
+    pv = (h + l + c) / 3 * v
+    cum_pv = np.cumsum(pv)
+    cum_v = np.cumsum(v)
+    day = t // DAY_MS
+    day_start = np.maximum.accumulate(np.where(np.r_[True, day[1:] != day[:-1]], idx, 0)) if n else idx
+    day_pv = cum_pv - (cum_pv - pv)[day_start]
+    day_v = cum_v - (cum_v - v)[day_start]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        result["vwap"] = np.where(day_v > 0, day_pv / day_v, np.nan)
+
+    # Состояние после последней свечи — для продолжения потоком
+    result["_state"] = {
+        "count": n,
+        "last_t": int(t[-1]) if n else None,
+        "prev_close": float(c[-1]) if n else None,
+        "ema": {p: float(result[f"ema{p}"][-1]) for p in EMA_PERIODS} if n else {},
+        "avg_gain": float(avg_gain[-1]) if len(avg_gain) else None,
+        "avg_loss": float(avg_loss[-1]) if len(avg_loss) else None,
+        "atr": float(atr[-1]) if n else None,
+        "window": c[-BB_PERIOD:].tolist(),
+        "vwap_day": int(day[-1]) if n else None,
+        "vwap_pv": float(day_pv[-1]) if n else 0.0,
+        "vwap_v": float(day_v[-1]) if n else 0.0,
+    }
+    return result
+
+
+class StreamingIndicators:
+    """Индикаторы одного ряда свечей с O(1) работы на обновление.
+
+    Состояние хранится по закрытым свечам. Обновление открытой свечи
+    считается от него, не меняя его, поэтому сколько угодно обновлений
+    одной свечи дают тот же результат, что и одна закрытая свеча.
+    """
+
+    __slots__ = (
+        "count", "last_t", "prev_close", "ema", "avg_gain", "avg_loss", "atr",
+        "window", "bb_sum", "bb_sumsq", "vwap_day", "vwap_pv", "vwap_v"
+    )
+
+    def __init__(self, state: dict | None = None):
+        state = state or {}
+        self.count = state.get("count", 0)
+        self.last_t = state.get("last_t")
+        self.prev_close = state.get("prev_close")
+        self.ema = dict(state.get("ema", {}))
+        self.avg_gain = state.get("avg_gain")
+        self.avg_loss = state.get("avg_loss")
+        self.atr = state.get("atr")
+        self.window = deque(state.get("window", []), maxlen=BB_PERIOD)
+        self._resum()
+        self.vwap_day = state.get("vwap_day")
+        self.vwap_pv = state.get("vwap_pv", 0.0)
+        self.vwap_v = state.get("vwap_v", 0.0)
+
+    @classmethod
+    def from_history(cls, candles: list) -> "StreamingIndicators":
+        """Прогрев по закрытым свечам векторным расчётом"""
+        if not candles:
+            return cls()
+        series = compute_series(
+            [c['t'] for c in candles],
+            [c['h'] for c in candles],
+            [c['l'] for c in candles],
+            [c['c'] for c in candles],
+            [c['v'] for c in candles],
+        )
+        return cls(series["_state"])
+
+    def _resum(self):
+        # Пересчёт сумм окна с нуля, чтобы не копилась ошибка округления
+        self.bb_sum = math.fsum(self.window)
+        self.bb_sumsq = math.fsum(x * x for x in self.window)
+
+    def update(self, candle: dict) -> dict | None:
+        """Значения индикаторов на свече; None, если свеча старше уже закрытых"""
+        t = candle['t']
+        if self.last_t is not None and t <= self.last_t:
+            return None
+
+        h, l, c, v = float(candle['h']), float(candle['l']), float(candle['c']), float(candle['v'])
+        first = self.count == 0
+        count = self.count + 1
+        values = {"t": t, "x": bool(candle['x'])}
+
+        ema = {}
+        for period in EMA_PERIODS:
+            prev = self.ema.get(period)
+            ema[period] = c if prev is None else prev + 2 / (period + 1) * (c - prev)
+            values[f"ema{period}"] = ema[period]
+
+        avg_gain, avg_loss, rsi = self.avg_gain, self.avg_loss, None
+        if not first:
+            delta = c - self.prev_close
+            gain, loss = max(delta, 0.0), max(-delta, 0.0)
+            if avg_gain is None:
+                avg_gain, avg_loss = gain, loss
+            else:
+                avg_gain += (gain - avg_gain) / RSI_PERIOD
+                avg_loss += (loss - avg_loss) / RSI_PERIOD
+            if count > RSI_PERIOD:
+                rsi = 100.0 if avg_loss == 0 else 100 - 100 / (1 + avg_gain / avg_loss)
+        values[f"rsi{RSI_PERIOD}"] = rsi
+
+        if first:
+            tr = h - l
+            atr = tr
+        else:
+            pc = self.prev_close
+            tr = max(h - l, abs(h - pc), abs(l - pc))
+            atr = self.atr + (tr - self.atr) / ATR_PERIOD
+        values[f"atr{ATR_PERIOD}"] = atr if count >= ATR_PERIOD else None
+
+        full = len(self.window) == BB_PERIOD
+        oldest = self.window[0] if full else 0.0
+        bb_sum = self.bb_sum + c - oldest
+        bb_sumsq = self.bb_sumsq + c * c - oldest * oldest
+        if full or len(self.window) == BB_PERIOD - 1:
+            middle = bb_sum / BB_PERIOD
+            std = math.sqrt(max(bb_sumsq / BB_PERIOD - middle * middle, 0.0))
+            values["bb_middle"] = middle
+            values["bb_upper"] = middle + BB_WIDTH * std
+            values["bb_lower"] = middle - BB_WIDTH * std
+        else:
+            values["bb_middle"] = values["bb_upper"] = values["bb_lower"] = None
+
+        day = t // DAY_MS
+        vwap_pv, vwap_v = (self.vwap_pv, self.vwap_v) if day == self.vwap_day else (0.0, 0.0)
+        vwap_pv += (h + l + c) / 3 * v
+        vwap_v += v
+        values["vwap"] = vwap_pv / vwap_v if vwap_v > 0 else None
+
+        if candle['x']:
+            self.count = count
+            self.last_t = t
+            self.prev_close = c
+            self.ema = ema
+            self.avg_gain, self.avg_loss = avg_gain, avg_loss
+            self.atr = atr
+            self.window.append(c)
+            if count % BB_PERIOD == 0:
+                self._resum()
+            else:
+                self.bb_sum, self.bb_sumsq = bb_sum, bb_sumsq
+            self.vwap_day, self.vwap_pv, self.vwap_v = day, vwap_pv, vwap_v
+
+        return values
+
+
+class IndicatorEngine:
+    """Потоковые индикаторы по всем рядам, которые пишет загрузчик свечей"""
+
+    def __init__(self, redis_binary, warmup: int = WARMUP_CANDLES):
+        self.redis_binary = redis_binary
+        self.warmup = warmup
+        self.series: dict[tuple[str, str], StreamingIndicators] = {}
+
+    async def update(self, symbol: str, interval: str, candles: list) -> dict | None:
+        """Учесть обновления свечей ряда (по возрастанию t); последние значения"""
+        state = self.series.get((symbol, interval))
+        if state is None:
+            history = await read_candles(
+                self.redis_binary, candle_key(symbol, interval), end=candles[0]['t'] - 1, limit=self.warmup
+            )
+            state = self.series[(symbol, interval)] = StreamingIndicators.from_history(history)
+
+        values = None
+        for candle in candles:
+            values = state.update(candle) or values
+        return values
+
+
+def series_to_rows(series: dict) -> list[dict]:
+    """Ряды compute_series в список значений по свечам для JSON"""
+    names = [name for name in series if name not in ("t", "_state")]
+    columns = [series[name].tolist() for name in names]
+    return [
+        {"t": int(t), **{name: _value(column[i]) for name, column in zip(names, columns)}}
+        for i, t in enumerate(series["t"].tolist())
+    ]
+
+
+def latest_values(values: dict) -> dict:
+    return {name: _value(value) if isinstance(value, float) else value for name, value in values.items()}
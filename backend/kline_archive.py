@@ -0,0 +1,124 @@
+import json
+import os
+
+import numpy as np
+
+KLINE_ARCHIVE_DIR = os.getenv("KLINE_ARCHIVE_DIR", os.path.join(os.path.dirname(__file__), "data", "klines"))
+
+# Колонка -> (dtype, индекс поля в ответе /api/v3/klines)
+COLUMNS = {
+    "open_time": ("<i8", 0),
+    "open": ("<f8", 1),
+    "high": ("<f8", 2),
+    "low": ("<f8", 3),
+    "close": ("<f8", 4),
+    "volume": ("<f8", 5),
+    "quote_volume": ("<f8", 7),
+    "trades": ("<i8", 8),
+}
+
+# Интервалы Binance фиксированной длины. 1M (месяц) сюда не входит: у месячных
+# свечей нет постоянного шага, по которому архив режет историю на страницы
+INTERVALS_MS = {
+    "1s": 1000,
+    "1m": 60000, "3m": 180000, "5m": 300000, "15m": 900000, "30m": 1800000,
+    "1h": 3600000, "2h": 7200000, "4h": 14400000, "6h": 21600000, "8h": 28800000, "12h": 43200000,
+    "1d": 86400000, "3d": 259200000,
+    "1w": 604800000,
+}
+
+
+def interval_ms(interval: str) -> int:
+    """Длительность интервала Binance в мс: 1m, 15m, 4h, 1d, 1w"""
+    try:
+        return INTERVALS_MS[interval]
+    except KeyError:
+        raise ValueError(
+            f"Unsupported interval {interval!r}: expected one of {', '.join(INTERVALS_MS)}"
+        ) from None
+
+
+class KlineArchive:
+    """Колоночный архив свечей одного символа и интервала.
+
+    Каждая колонка — отдельный файл с сырым little-endian массивом, поэтому
+    читается через np.memmap без копирования и парсинга. Данные только
+    дописываются в конец; число строк фиксируется в meta.json после записи
+    колонок, так что оборванная запись обрезается при следующем открытии.
+    """
+
+    def __init__(self, symbol: str, interval: str, base_dir: str = KLINE_ARCHIVE_DIR):
+        self.symbol = symbol.upper()
+        self.interval = interval
+        self.path = os.path.join(base_dir, self.symbol, interval)
+        self.meta_path = os.path.join(self.path, "meta.json")
+        self.count = 0
+        self.last_open_time = None
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.count = meta["count"]
+            self.last_open_time = meta["last_open_time"]
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.bin")
+
+    def _write_meta(self):
+        meta = {
+            "symbol": self.symbol,
+            "interval": self.interval,
+            "count": self.count,
+            "last_open_time": self.last_open_time,
+            "columns": {name: dtype for name, (dtype, _) in COLUMNS.items()},
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.meta_path)
+
+    def append(self, klines: list) -> int:
+        """Дописать свечи из ответа Binance; свечи не новее последней пропускаются"""
+        if self.last_open_time is not None:
+            klines = [k for k in klines if k[0] > self.last_open_time]
+        if not klines:
+            return 0
+
+        os.makedirs(self.path, exist_ok=True)
+        for name, (dtype, field) in COLUMNS.items():
+            column = np.array([k[field] for k in klines], dtype=np.float64 if dtype == "<f8" else np.int64)
+            with open(self._column_path(name), "ab") as f:
+                # Хвост от прерванной записи, не учтённый в meta.json
+                f.truncate(self.count * np.dtype(dtype).itemsize)
+                f.write(column.astype(dtype, copy=False).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.count += len(klines)
+        self.last_open_time = int(klines[-1][0])
+        self._write_meta()
+        return len(klines)
+
+    def columns(self, start: int | None = None, end: int | None = None) -> dict:
+        """Колонки как np.memmap (без копирования), по open time в [start, end]"""
+        if self.count == 0:
+            return {name: np.empty(0, dtype=dtype) for name, (dtype, _) in COLUMNS.items()}
+
+        data = {
+            name: np.memmap(self._column_path(name), dtype=dtype, mode="r", shape=(self.count,))
+            for name, (dtype, _) in COLUMNS.items()
+        }
+        if start is None and end is None:
+            return data
+
+        open_time = data["open_time"]
+        lo = 0 if start is None else int(np.searchsorted(open_time, start, side="left"))
+        hi = self.count if end is None else int(np.searchsorted(open_time, end, side="right"))
+        return {name: column[lo:hi] for name, column in data.items()}
+
+
+def load_klines(symbol: str, interval: str, start: int | None = None, end: int | None = None,
+                base_dir: str = KLINE_ARCHIVE_DIR) -> dict:
+    return KlineArchive(symbol, interval, base_dir).columns(start, end)
@@ -1,7 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from telegram.bot import start_bot
 from watcher.grid_watcher import main
+from binance_client import binance
+from rate_limiter import RateLimitExceeded
+from watcher.user_data_stream import account_view
+from watcher.price_cache import price_cache
+from telegram.alerts import dispatcher as alert_dispatcher
 
 from api.routes import price
 from api.routes import account
@@ -12,6 +18,8 @@ from api.routes import candles
 from api.routes import monitoring
 from api.routes import logs
 from api.routes import archive
+from api.routes import rate_limit
+from api.routes import indicators
 
 app = FastAPI()
 
@@ -32,6 +40,17 @@ app.include_router(candles.router, prefix="/api")
 app.include_router(monitoring.router, prefix="/api")
 app.include_router(logs.router, prefix="/api")
 app.include_router(archive.router, prefix="/api")
+app.include_router(rate_limit.router, prefix="/api")
+app.include_router(indicators.router, prefix="/api")
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after) + 1)}
+    )
 
 
 @app.get("/")
@@ -44,3 +63,12 @@ async def startup_event():
     import asyncio
     asyncio.create_task(start_bot())  # Telegram
     asyncio.create_task(main())  # Grid-слежение
+    asyncio.create_task(price_cache.run())  # Цены из !miniTicker@arr
+    if binance.api_key:
+        asyncio.create_task(account_view.run())  # Ордера и балансы из user data stream
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await binance.close()
+    await alert_dispatcher.close()
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+
+from redis_client import async_redis
+
+# Приоритеты запросов к Binance: чем меньше, тем важнее
+PRIORITY_ORDER = 0
+PRIORITY_MARKET = 1
+PRIORITY_UI = 2
+PRIORITY_BACKFILL = 3
+
+PRIORITY_NAMES = {
+    PRIORITY_ORDER: "order",
+    PRIORITY_MARKET: "market",
+    PRIORITY_UI: "ui",
+    PRIORITY_BACKFILL: "backfill",
+}
+
+WEIGHT_LIMIT_1M = int(os.getenv("BINANCE_WEIGHT_LIMIT", 6000))
+ORDER_LIMIT_10S = int(os.getenv("BINANCE_ORDER_LIMIT_10S", 100))
+
+# Доля минутного бюджета, до которой может дойти приоритет.
+# Остаток резервируется для более важных запросов: рыночные данные
+# не съедят бюджет ордеров, обновления дашборда — бюджет рыночных данных,
+# а загрузка истории идёт только в остатке минуты.
+PRIORITY_SHARE = {
+    PRIORITY_ORDER: 1.0,
+    PRIORITY_MARKET: 0.85,
+    PRIORITY_UI: 0.6,
+    PRIORITY_BACKFILL: 0.4,
+}
+
+# Сколько запрос готов ждать в очереди, прежде чем будет отброшен (сек)
+PRIORITY_MAX_WAIT = {
+    PRIORITY_ORDER: 10.0,
+    PRIORITY_MARKET: 60.0,
+    PRIORITY_UI: 2.0,
+    PRIORITY_BACKFILL: 120.0,
+}
+
+WEIGHT_KEY = "binance:weight:{}"
+ORDERS_KEY = "binance:orders:{}"
+BAN_KEY = "binance:ban-until"
+
+# Атомарное резервирование веса (и ордеров) в текущих окнах Binance.
+# Возвращает {1, used} при успехе или {0, retry_after_ms}.
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local weight = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+local orders = tonumber(ARGV[4])
+local order_limit = tonumber(ARGV[5])
+
+local ban = tonumber(redis.call('GET', KEYS[3]) or '0')
+if ban > now then
+    return {0, ban - now}
+end
+
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+if used + weight > limit then
+    return {0, 60000 - now % 60000}
+end
+
+if orders > 0 then
+    local placed = tonumber(redis.call('GET', KEYS[2]) or '0')
+    if placed + orders > order_limit then
+        return {0, 10000 - now % 10000}
+    end
+    redis.call('INCRBY', KEYS[2], orders)
+    redis.call('PEXPIRE', KEYS[2], 20000)
+end
+
+used = redis.call('INCRBY', KEYS[1], weight)
+redis.call('PEXPIRE', KEYS[1], 120000)
+return {1, used}
+"""
+
+# Binance присылает фактический вес и число ордеров окна — подтягиваем счётчик, если он отстал
+# (запросы других клиентов с того же IP, запросы без планировщика)
+SYNC_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local reported = tonumber(ARGV[1])
+if reported > used then
+    redis.call('SET', KEYS[1], reported, 'PX', 120000)
+    return reported
+end
+return used
+"""
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, priority: int, retry_after: float):
+        super().__init__(
+            f"Binance rate limit budget exhausted for {PRIORITY_NAMES.get(priority, priority)} requests, "
+            f"retry after {retry_after:.1f}s"
+        )
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class WeightScheduler:
+    """Общий для всех процессов учёт веса запросов к Binance.
+
+    Счётчики живут в Redis и выровнены по окнам Binance (минута для веса,
+    10 секунд для ордеров). Перед запросом вызывается acquire(): если бюджет
+    приоритета исчерпан, запрос ждёт следующего окна или отбрасывается
+    с RateLimitExceeded, не доходя до 429 от биржи.
+    """
+
+    def __init__(self, redis=async_redis, weight_limit: int = WEIGHT_LIMIT_1M, order_limit: int = ORDER_LIMIT_10S):
+        self.redis = redis
+        self.weight_limit = weight_limit
+        self.order_limit = order_limit
+        self._reserve = redis.register_script(RESERVE_SCRIPT)
+        self._sync = redis.register_script(SYNC_SCRIPT)
+
+    @staticmethod
+    def _keys(now_ms: int) -> list[str]:
+        return [
+            WEIGHT_KEY.format(now_ms // 60000),
+            ORDERS_KEY.format(now_ms // 10000),
+            BAN_KEY,
+        ]
+
+    async def acquire(self, weight: int, priority: int = PRIORITY_UI, orders: int = 0):
+        limit = int(self.weight_limit * PRIORITY_SHARE[priority])
+        deadline = time.monotonic() + PRIORITY_MAX_WAIT[priority]
+
+        while True:
+            now_ms = int(time.time() * 1000)
+            try:
+                ok, value = await self._reserve(
+                    keys=self._keys(now_ms),
+                    args=[now_ms, weight, limit, orders, self.order_limit]
+                )
+            except Exception as e:
+                # Без Redis не блокируем торговлю — лимиты Binance всё равно вернут 429
+                print(f"[RateLimit] ❌ Redis недоступен, запрос без учёта веса: {e}")
+                return
+
+            if ok:
+                return
+
+            retry_after = value / 1000
+            if time.monotonic() + retry_after > deadline:
+                raise RateLimitExceeded(priority, retry_after)
+            await asyncio.sleep(retry_after)
+
+    async def record(self, headers):
+        """Сверить счётчики с заголовками X-MBX-USED-WEIGHT-1M / X-MBX-ORDER-COUNT-10S"""
+        weight_key, orders_key, _ = self._keys(int(time.time() * 1000))
+        try:
+            used = headers.get("x-mbx-used-weight-1m")
+            if used is not None:
+                await self._sync(keys=[weight_key], args=[int(used)])
+            placed = headers.get("x-mbx-order-count-10s")
+            if placed is not None:
+                await self._sync(keys=[orders_key], args=[int(placed)])
+        except Exception as e:
+            print(f"[RateLimit] ❌ Не удалось синхронизировать счётчики: {e}")
+
+    async def ban(self, retry_after: float):
+        """429/418 от Binance: все процессы ждут до окончания блокировки"""
+        until = int((time.time() + retry_after) * 1000)
+        try:
+            await self.redis.set(BAN_KEY, until, px=int(retry_after * 1000) + 1000)
+        except Exception as e:
+            print(f"[RateLimit] ❌ Не удалось сохранить бан: {e}")
+        print(f"[RateLimit] ⛔ Binance ограничил запросы на {retry_after:.0f}s")
+
+    async def usage(self) -> dict:
+        now_ms = int(time.time() * 1000)
+        weight_key, orders_key, ban_key = self._keys(now_ms)
+        used, orders, ban = await self.redis.mget(weight_key, orders_key, ban_key)
+        used = int(used or 0)
+        ban = int(ban or 0)
+
+        return {
+            "weight_used": used,
+            "weight_limit": self.weight_limit,
+            "weight_reset_in_ms": 60000 - now_ms % 60000,
+            "orders_10s": int(orders or 0),
+            "order_limit_10s": self.order_limit,
+            "banned_until": ban if ban > now_ms else None,
+            "budgets": {
+                PRIORITY_NAMES[p]: {
+                    "limit": int(self.weight_limit * share),
+                    "remaining": max(0, int(self.weight_limit * share) - used)
+                }
+                for p, share in PRIORITY_SHARE.items()
+            }
+        }
+
+
+scheduler = WeightScheduler()
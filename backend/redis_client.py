@@ -1,30 +1,283 @@
 import os
 import redis
 import json
+from redis.asyncio import Redis as AsyncRedis
+
+REDIS_HOST = os.getenv("REDIS_HOST", "redis")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
 
 # Синхронный клиент Redis
 redis_client = redis.Redis(
-    host=os.getenv("REDIS_HOST", "redis"),
-    port=int(os.getenv("REDIS_PORT", 6379)),
+    host=REDIS_HOST,
+    port=REDIS_PORT,
+    decode_responses=True
+)
+
+# Асинхронный клиент Redis для кода внутри event loop
+async_redis = AsyncRedis(
+    host=REDIS_HOST,
+    port=REDIS_PORT,
     decode_responses=True
 )
 
-def save_grid(symbol: str, grid_data: list):
-    key = f"grid:settings:{symbol.upper()}"
-    redis_client.set(key, json.dumps(grid_data))
+# Стрим событий для WebSocket сервера: ограниченный по длине журнал,
+# из которого переподключившиеся клиенты дочитывают пропущенное
+EVENTS_STREAM = "events:stream"
+EVENTS_MAXLEN = 10000
+
+# Канал изменений гридов: "live:SYMBOL:version" / "settings:SYMBOL:version".
+# По нему процессы обновляют закэшированные гриды, не перечитывая их на каждом тике.
+GRID_CHANGES_CHANNEL = "grid:changed"
+
+async def _publish_grid_change(symbol: str, live: bool, version: int):
+    scope = "live" if live else "settings"
+    try:
+        await async_redis.publish(GRID_CHANGES_CHANNEL, f"{scope}:{symbol.upper()}:{version}")
+    except Exception as e:
+        print(f"[Redis] ❌ Не удалось опубликовать изменение грида: {e}")
+
+def parse_grid_change(message: str) -> tuple[bool, str, int]:
+    scope, symbol, version = message.split(":")
+    return scope == "live", symbol, int(version)
+
+def _grid_key(symbol: str, live: bool = False) -> str:
+    return f"grid:{symbol.upper()}" if live else f"grid:settings:{symbol.upper()}"
+
+def _changes_key(key: str) -> str:
+    return f"{key}:changes"
+
+# Грид хранится хешем: n — число уровней, v — версия грида,
+# L:{i} — уровень (JSON), V:{i} — версия грида на момент последнего изменения уровня.
+# zset {key}:changes (индекс уровня → его версия) позволяет читать только изменённые уровни.
+
+# Полная замена грида. ARGV: уровни (JSON). Версия продолжает расти.
+SAVE_GRID_SCRIPT = """
+local version = 0
+if redis.call('TYPE', KEYS[1]).ok == 'hash' then
+    version = tonumber(redis.call('HGET', KEYS[1], 'v') or '0')
+end
+version = version + 1
+redis.call('DEL', KEYS[1], KEYS[2])
+redis.call('HSET', KEYS[1], 'v', version, 'n', #ARGV)
+for i = 1, #ARGV do
+    local index = i - 1
+    redis.call('HSET', KEYS[1], 'L:' .. index, ARGV[i], 'V:' .. index, version)
+    redis.call('ZADD', KEYS[2], version, index)
+end
+return version
+"""
+
+# Срабатывание уровня: compare-and-set по флагу triggered (и версии уровня, если задана).
+# ARGV: index, status, ожидаемая версия уровня или ''.
+# Возвращает {1, версия} или {0, текущая версия уровня}; {-1, 0} — уровня нет.
+TRIGGER_LEVEL_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], 'L:' .. ARGV[1])
+if not raw then
+    return {-1, 0}
+end
+local level_version = tonumber(redis.call('HGET', KEYS[1], 'V:' .. ARGV[1]) or '0')
+local level = cjson.decode(raw)
+if level['triggered'] == true or (ARGV[3] ~= '' and tonumber(ARGV[3]) ~= level_version) then
+    return {0, level_version}
+end
+level['triggered'] = true
+level['status'] = ARGV[2]
+local version = redis.call('HINCRBY', KEYS[1], 'v', 1)
+redis.call('HSET', KEYS[1], 'L:' .. ARGV[1], cjson.encode(level), 'V:' .. ARGV[1], version)
+redis.call('ZADD', KEYS[2], version, ARGV[1])
+return {1, version}
+"""
+
+# Откат срабатывания (ордер так и не был отправлен): только если уровень
+# не менялся после срабатывания с версией ARGV[2]. ARGV: index, версия уровня.
+RELEASE_LEVEL_SCRIPT = """
+local raw = redis.call('HGET', KEYS[1], 'L:' .. ARGV[1])
+if not raw or tonumber(redis.call('HGET', KEYS[1], 'V:' .. ARGV[1]) or '0') ~= tonumber(ARGV[2]) then
+    return {0, 0}
+end
+local level = cjson.decode(raw)
+level['triggered'] = false
+level['status'] = ''
+local version = redis.call('HINCRBY', KEYS[1], 'v', 1)
+redis.call('HSET', KEYS[1], 'L:' .. ARGV[1], cjson.encode(level), 'V:' .. ARGV[1], version)
+redis.call('ZADD', KEYS[2], version, ARGV[1])
+return {1, version}
+"""
+
+# Замена одного уровня при совпадении его версии. ARGV: index, уровень (JSON), ожидаемая версия или ''.
+UPDATE_LEVEL_SCRIPT = """
+local n = tonumber(redis.call('HGET', KEYS[1], 'n') or '0')
+if tonumber(ARGV[1]) >= n then
+    return {-1, 0}
+end
+local level_version = tonumber(redis.call('HGET', KEYS[1], 'V:' .. ARGV[1]) or '0')
+if ARGV[3] ~= '' and tonumber(ARGV[3]) ~= level_version then
+    return {0, level_version}
+end
+local version = redis.call('HINCRBY', KEYS[1], 'v', 1)
+redis.call('HSET', KEYS[1], 'L:' .. ARGV[1], ARGV[2], 'V:' .. ARGV[1], version)
+redis.call('ZADD', KEYS[2], version, ARGV[1])
+return {1, version}
+"""
+
+# Уровни, изменённые после версии ARGV[1]: {v, n, index, JSON, версия уровня, ...}
+GRID_CHANGES_SCRIPT = """
+local meta = redis.call('HMGET', KEYS[1], 'v', 'n')
+local result = {tonumber(meta[1] or '0'), tonumber(meta[2] or '0')}
+local changed = redis.call('ZRANGEBYSCORE', KEYS[2], '(' .. ARGV[1], '+inf', 'WITHSCORES')
+for i = 1, #changed, 2 do
+    table.insert(result, tonumber(changed[i]))
+    table.insert(result, redis.call('HGET', KEYS[1], 'L:' .. changed[i]))
+    table.insert(result, tonumber(changed[i + 1]))
+end
+return result
+"""
+
+# Гриды читают и пишут обработчики API и GridWatcher внутри event loop —
+# скрипты зарегистрированы на асинхронном клиенте
+_save_grid_script = async_redis.register_script(SAVE_GRID_SCRIPT)
+_trigger_level_script = async_redis.register_script(TRIGGER_LEVEL_SCRIPT)
+_release_level_script = async_redis.register_script(RELEASE_LEVEL_SCRIPT)
+_update_level_script = async_redis.register_script(UPDATE_LEVEL_SCRIPT)
+_grid_changes_script = async_redis.register_script(GRID_CHANGES_SCRIPT)
+
+async def save_grid(symbol: str, grid_data: list, live: bool = False) -> int:
+    """Записать грид целиком; возвращает новую версию"""
+    key = _grid_key(symbol, live)
+    version = await _save_grid_script(
+        keys=[key, _changes_key(key)],
+        args=[json.dumps(level) for level in grid_data]
+    )
+    await _publish_grid_change(symbol, live, version)
+    return version
+
+async def _migrate_grid(key: str, symbol: str, live: bool):
+    """Грид, сохранённый старой версией одной JSON-строкой, переписываем хешем"""
+    data = await async_redis.get(key)
+    levels = json.loads(data) if data else []
+    await save_grid(symbol, levels, live)
+
+async def get_grid_versioned(symbol: str, live: bool = False) -> tuple[int, list, list]:
+    """(версия грида, уровни, версии уровней) — версия уровня нужна для CAS в trigger_level"""
+    key = _grid_key(symbol, live)
+    try:
+        fields = await async_redis.hgetall(key)
+    except redis.ResponseError:
+        await _migrate_grid(key, symbol, live)
+        fields = await async_redis.hgetall(key)
+    if not fields:
+        return 0, [], []
+    count = int(fields.get("n", 0))
+    levels = [json.loads(fields[f"L:{i}"]) for i in range(count)]
+    level_versions = [int(fields.get(f"V:{i}", 0)) for i in range(count)]
+    return int(fields.get("v", 0)), levels, level_versions
+
+async def get_grid(symbol: str, live: bool = False):
+    return (await get_grid_versioned(symbol, live))[1]
+
+async def get_grid_changes(symbol: str, since: int, live: bool = False) -> tuple[int, int, dict, dict]:
+    """Изменения грида после версии since:
+    (версия, число уровней, {index: уровень}, {index: версия уровня}).
+
+    Если грид пересоздавался (версия меньше since), вернутся все уровни.
+    """
+    key = _grid_key(symbol, live)
+    version, count, *changed = await _grid_changes_script(keys=[key, _changes_key(key)], args=[since])
+    if version < since:
+        version, count, *changed = await _grid_changes_script(keys=[key, _changes_key(key)], args=[0])
+    levels = {int(changed[i]): json.loads(changed[i + 1]) for i in range(0, len(changed), 3)}
+    level_versions = {int(changed[i]): int(changed[i + 2]) for i in range(0, len(changed), 3)}
+    return version, count, levels, level_versions
+
+async def trigger_level(symbol: str, index: int, side: str, live: bool = True,
+                        expected_version: int | None = None) -> int | None:
+    """Атомарно пометить уровень сработавшим; None, если он уже сработал
+    (например, параллельно) или изменился после expected_version.
+
+    expected_version — версия уровня (V:{i}), с которой работал вызывающий:
+    если грид заменили, уровень с тем же индексом получил новую версию,
+    и срабатывание по устаревшей копии не пройдёт."""
+    key = _grid_key(symbol, live)
+    status = f"{side.lower()}-triggered"
+    expected = "" if expected_version is None else expected_version
+    ok, version = await _trigger_level_script(keys=[key, _changes_key(key)], args=[index, status, expected])
+    if ok != 1:
+        return None
+    await _publish_grid_change(symbol, live, version)
+    return version
+
+async def release_level(symbol: str, index: int, trigger_version: int, live: bool = True) -> int | None:
+    """Снять срабатывание уровня, если он не менялся после trigger_level,
+    вернувшего trigger_version; None, если уровень уже изменён"""
+    key = _grid_key(symbol, live)
+    ok, version = await _release_level_script(keys=[key, _changes_key(key)], args=[index, trigger_version])
+    if ok != 1:
+        return None
+    await _publish_grid_change(symbol, live, version)
+    return version
+
+async def update_level(symbol: str, index: int, level: dict, live: bool = False,
+                       expected_version: int | None = None) -> int | None:
+    """Заменить один уровень (CAS по версии уровня); None при конфликте или без уровня"""
+    key = _grid_key(symbol, live)
+    expected = "" if expected_version is None else expected_version
+    ok, version = await _update_level_script(keys=[key, _changes_key(key)], args=[index, json.dumps(level), expected])
+    if ok != 1:
+        return None
+    await _publish_grid_change(symbol, live, version)
+    return version
+
+async def set_live_grid(symbol: str, grid_data: list):
+    await save_grid(symbol, grid_data, live=True)
+
+async def delete_live_grid(symbol: str):
+    # Пустой грид вместо удаления ключа: версия продолжает расти,
+    # и закэшированные копии не пропустят следующий запуск
+    await save_grid(symbol, [], live=True)
+
+# Символы, за которыми следит GridWatcher: set + канал уведомлений об изменениях
+MONITORING_KEY = "monitoring-symbols"
+MONITORING_CHANNEL = "monitoring-symbols:changed"
 
-def get_grid(symbol: str):
-    key = f"grid:settings:{symbol.upper()}"
-    data = redis_client.get(key)
-    return json.loads(data) if data else []
+def get_monitored_symbols() -> set[str]:
+    try:
+        return redis_client.smembers(MONITORING_KEY)
+    except redis.ResponseError:
+        # Старый формат — JSON-список строкой; переписываем в set
+        data = redis_client.get(MONITORING_KEY)
+        symbols = set(json.loads(data)) if data else set()
+        pipe = redis_client.pipeline()
+        pipe.delete(MONITORING_KEY)
+        if symbols:
+            pipe.sadd(MONITORING_KEY, *symbols)
+        pipe.execute()
+        return symbols
 
-def set_live_grid(symbol: str, grid_data: list):
-    key = f"grid:{symbol.upper()}"
-    redis_client.set(key, json.dumps(grid_data))
+async def get_monitored_symbols_async() -> set[str]:
+    """get_monitored_symbols для кода в event loop (GridWatcher)"""
+    try:
+        return await async_redis.smembers(MONITORING_KEY)
+    except redis.ResponseError:
+        data = await async_redis.get(MONITORING_KEY)
+        symbols = set(json.loads(data)) if data else set()
+        pipe = async_redis.pipeline()
+        pipe.delete(MONITORING_KEY)
+        if symbols:
+            pipe.sadd(MONITORING_KEY, *symbols)
+        await pipe.execute()
+        return symbols
 
-def delete_live_grid(symbol: str):
-    key = f"grid:{symbol.upper()}"
-    redis_client.delete(key)
+def set_symbol_monitored(symbol: str, active: bool) -> bool:
+    """Добавить/убрать символ; True, если набор изменился"""
+    symbol = symbol.upper()
+    get_monitored_symbols()  # миграция старого формата, если нужна
+    if active:
+        changed = redis_client.sadd(MONITORING_KEY, symbol)
+    else:
+        changed = redis_client.srem(MONITORING_KEY, symbol)
+    if changed:
+        redis_client.publish(MONITORING_CHANNEL, f"{'+' if active else '-'}{symbol}")
+    return bool(changed)
 
 def set_monitoring(symbol: str, value: str):
     key = f"monitoring:{symbol.upper()}"
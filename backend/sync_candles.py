@@ -1,36 +1,149 @@
-import os
-import json
-import requests
-import redis
-
-symbol = "BTCUSDT"
-interval = "1m"
-limit = 100  # сколько свечей загрузить
-
-BINANCE_ENDPOINT = "https://api.binance.com/api/v3/klines"
-REDIS_KEY = f"candles:{symbol}:{interval}"
-
-# Подключение к Redis
-r = redis.Redis(host="localhost", port=6379, decode_responses=True)
-
-def fetch_candles():
-    params = {
-        "symbol": symbol,
-        "interval": interval,
-        "limit": limit
-    }
-    res = requests.get(BINANCE_ENDPOINT, params=params)
-    res.raise_for_status()
-    data = res.json()
-    candles = [
-        [c[0], c[1], c[2], c[3], c[4]] for c in data
-    ]
-    return candles
-
-def save_to_redis(candles):
-    r.set(REDIS_KEY, json.dumps(candles))
-    print(f"✅ Сохранено {len(candles)} свечей в Redis под ключем {REDIS_KEY}")
+"""Загрузка истории свечей в колоночный архив (см. kline_archive.py).
+
+    python sync_candles.py BTCUSDT ETHUSDT --interval 1m --start 2020-01-01
+
+Страницы по 1000 свечей запрашиваются параллельно, вес учитывается общим
+планировщиком с самым низким приоритетом. Прогресс — сам архив: повторный
+запуск продолжает с последней записанной свечи. --base-url позволяет
+загружать из локального фейкового /api/v3/klines.
+"""
+import argparse
+import asyncio
+import time
+from collections import deque
+from datetime import datetime, timezone
+
+import httpx
+
+from binance_client import BINANCE_API_URL, BinanceAPIError, BinanceREST
+from kline_archive import KLINE_ARCHIVE_DIR, KlineArchive, interval_ms
+from rate_limiter import PRIORITY_BACKFILL, RateLimitExceeded, scheduler
+
+PAGE_LIMIT = 1000
+MAX_RETRIES = 5
+
+
+def parse_time(value: str) -> int:
+    """Дата (2020-01-01, ISO) или время в мс"""
+    if value.isdigit():
+        return int(value)
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() * 1000)
+
+
+def parse_interval(value: str) -> str:
+    """Интервал с фиксированной длительностью (1M не поддерживается)"""
+    try:
+        interval_ms(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+
+async def fetch_page(client: BinanceREST, semaphore: asyncio.Semaphore, symbol: str, interval: str,
+                     start: int, end: int) -> list:
+    for attempt in range(MAX_RETRIES):
+        try:
+            async with semaphore:
+                return await client.get_klines(
+                    symbol, interval, limit=PAGE_LIMIT, start_time=start, end_time=end,
+                    priority=PRIORITY_BACKFILL
+                )
+        except RateLimitExceeded as e:
+            await asyncio.sleep(e.retry_after)
+        except (BinanceAPIError, httpx.HTTPError) as e:
+            if isinstance(e, BinanceAPIError) and e.status_code < 500 and e.status_code not in (418, 429):
+                raise
+            if attempt == MAX_RETRIES - 1:
+                raise
+            print(f"[Backfill] ⚠️ {symbol} {start}: {e}, повтор")
+            await asyncio.sleep(2 ** attempt)
+    raise RuntimeError(f"{symbol}: не удалось загрузить страницу {start}")
+
+
+async def first_open_time(client: BinanceREST, symbol: str, interval: str) -> int | None:
+    data = await client.get_klines(symbol, interval, limit=1, start_time=0, priority=PRIORITY_BACKFILL)
+    return data[0][0] if data else None
+
+
+async def backfill_symbol(client: BinanceREST, semaphore: asyncio.Semaphore, symbol: str, interval: str,
+                          start: int | None, end: int | None, concurrency: int, base_dir: str):
+    archive = KlineArchive(symbol, interval, base_dir)
+    step = interval_ms(interval)
+    page_span = PAGE_LIMIT * step
+
+    if archive.last_open_time is not None:
+        start = max(start or 0, archive.last_open_time + step)
+    elif start is None:
+        start = await first_open_time(client, symbol, interval)
+        if start is None:
+            print(f"[Backfill] ⚠️ {symbol} {interval}: свечей нет")
+            return
+
+    now_ms = int(time.time() * 1000)
+    end = min(end, now_ms) if end is not None else now_ms
+    total = 0
+    next_start = start
+
+    # Страницы запрашиваются параллельно, но пишутся строго по порядку:
+    # архив остаётся непрерывным, а прерванный запуск теряет только незаписанные страницы
+    pending = deque()
+    while pending or next_start <= end:
+        while next_start <= end and len(pending) < concurrency:
+            page_end = min(next_start + page_span - 1, end)
+            pending.append(asyncio.create_task(
+                fetch_page(client, semaphore, symbol, interval, next_start, page_end)
+            ))
+            next_start += page_span
+
+        try:
+            klines = await pending.popleft()
+        except Exception:
+            for task in pending:
+                task.cancel()
+            raise
+
+        # Незакрытая свеча в архив не попадает — её допишет следующий запуск
+        klines = [k for k in klines if k[6] < now_ms]
+        total += archive.append(klines)
+        if klines:
+            print(f"[Backfill] {symbol} {interval}: {archive.count} свечей, до {klines[-1][0]}")
+
+    print(f"✅ {symbol} {interval}: добавлено {total}, всего {archive.count} свечей в {archive.path}")
+
+
+async def backfill(symbols: list[str], interval: str, start: int | None, end: int | None,
+                   concurrency: int, base_url: str, base_dir: str, rate_limit: bool = True):
+    client = BinanceREST(base_url=base_url, scheduler=scheduler if rate_limit else None)
+    semaphore = asyncio.Semaphore(concurrency)
+    try:
+        await asyncio.gather(*(
+            backfill_symbol(client, semaphore, symbol.upper(), interval, start, end, concurrency, base_dir)
+            for symbol in symbols
+        ))
+    finally:
+        await client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Загрузка истории свечей Binance в колоночный архив")
+    parser.add_argument("symbols", nargs="*", default=["BTCUSDT"])
+    parser.add_argument("--interval", type=parse_interval, default="1m")
+    parser.add_argument("--start", type=parse_time, help="дата или мс; по умолчанию — с первой свечи символа")
+    parser.add_argument("--end", type=parse_time)
+    parser.add_argument("--concurrency", type=int, default=8, help="параллельных запросов страниц")
+    parser.add_argument("--base-url", default=BINANCE_API_URL)
+    parser.add_argument("--data-dir", default=KLINE_ARCHIVE_DIR)
+    parser.add_argument("--no-rate-limit", action="store_true", help="без общего планировщика веса (фейковый сервер)")
+    args = parser.parse_args()
+
+    asyncio.run(backfill(
+        args.symbols, args.interval, args.start, args.end,
+        args.concurrency, args.base_url, args.data_dir, rate_limit=not args.no_rate_limit
+    ))
+
 
 if __name__ == "__main__":
-    candles = fetch_candles()
-    save_to_redis(candles)
+    main()
@@ -1,23 +1,213 @@
+import asyncio
+import json
 import os
+import time
+from collections import deque
+
 import httpx
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# Приоритеты уведомлений: при переполнении очереди первыми отбрасываются менее важные
+PRIORITY_CRITICAL = 0
+PRIORITY_TRADE = 1
+PRIORITY_INFO = 2
+
+# Telegram ограничивает отправку в один чат примерно сообщением в секунду
+TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", 1))
+TELEGRAM_BURST = int(os.getenv("TELEGRAM_BURST", 3))
+MAX_QUEUE = 1000
+# Сколько ждём остальные уведомления пачки, прежде чем отправить
+COALESCE_WINDOW = 0.5
+MESSAGE_LIMIT = 4096
+TIMEOUT = 10
+# Пауза перед повтором после сетевой ошибки: удваивается до MAX_BACKOFF
+MAX_BACKOFF = 60
+# Счётчики диспетчера процесса-отправителя для API (/api/rate-limit/alerts)
+STATS_KEY = "alerts:stats"
+STATS_INTERVAL = 10
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def take(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AlertDispatcher:
+    """Фоновая отправка уведомлений в Telegram.
+
+    enqueue() только кладёт текст в очередь своего приоритета и никогда не
+    ждёт сеть. Фоновая задача отправляет через один httpx-клиент с keep-alive,
+    не чаще token bucket; всё, что накопилось к моменту отправки, уходит
+    одним сообщением-сводкой.
+    """
+
+    def __init__(self, token: str | None = TELEGRAM_BOT_TOKEN, chat_id: str | None = TELEGRAM_CHAT_ID,
+                 api_url: str = TELEGRAM_API_URL, rate: float = TELEGRAM_RATE, burst: int = TELEGRAM_BURST):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url
+        self.bucket = TokenBucket(rate, burst)
+        self.queues = {priority: deque() for priority in (PRIORITY_CRITICAL, PRIORITY_TRADE, PRIORITY_INFO)}
+        self.size = 0
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self._wakeup = asyncio.Event()
+        self._client: httpx.AsyncClient | None = None
+        self._task: asyncio.Task | None = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.api_url,
+                timeout=httpx.Timeout(TIMEOUT),
+                limits=httpx.Limits(max_connections=2, keepalive_expiry=120)
+            )
+        return self._client
+
+    def enqueue(self, message: str, priority: int = PRIORITY_TRADE):
+        if not self.token or not self.chat_id:
+            print("[Telegram] ❌ Не настроены переменные окружения")
+            return
+
+        self.queues[priority].append(message)
+        self.size += 1
+        if self.size > MAX_QUEUE:
+            self._drop()
+        self._wakeup.set()
+        self._ensure_started()
+
+    def _drop(self):
+        """Отбросить самое старое уведомление наименьшего приоритета"""
+        for priority in sorted(self.queues, reverse=True):
+            if self.queues[priority]:
+                self.queues[priority].popleft()
+                self.size -= 1
+                self.dropped += 1
+                return
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self.run())
+            except RuntimeError:
+                # Нет event loop — отправится, когда диспетчер запустят явно
+                pass
+
+    def _take_batch(self) -> list[tuple[int, str]]:
+        """Накопленные уведомления (приоритет, текст), сколько влезет в одно сообщение"""
+        batch, length = [], 0
+        for priority in sorted(self.queues):
+            queue = self.queues[priority]
+            while queue and (not batch or length + len(queue[0]) + 1 <= MESSAGE_LIMIT - 100):
+                message = queue.popleft()
+                self.size -= 1
+                batch.append((priority, message))
+                length += len(message) + 1
+        return batch
+
+    def _requeue(self, batch: list[tuple[int, str]]):
+        """Вернуть неотправленную пачку в начало очередей её же приоритетов"""
+        for priority, message in reversed(batch):
+            self.queues[priority].appendleft(message)
+        self.size += len(batch)
+        while self.size > MAX_QUEUE:
+            self._drop()
+
+    @staticmethod
+    def _format(batch: list[tuple[int, str]]) -> str:
+        if len(batch) == 1:
+            return batch[0][1][:MESSAGE_LIMIT]
+        return (f"📋 {len(batch)} событий:\n" + "\n".join(message for _, message in batch))[:MESSAGE_LIMIT]
+
+    async def _send(self, text: str) -> float | None:
+        """Отправить сообщение; при 429 — через сколько секунд повторить"""
+        response = await self.client.post(
+            f"/bot{self.token}/sendMessage",
+            json={"chat_id": self.chat_id, "text": text, "parse_mode": "HTML"}
+        )
+        if response.status_code == 429:
+            return float(response.json().get("parameters", {}).get("retry_after", 1))
+        if response.status_code >= 400:
+            print(f"[Telegram] ❌ Ошибка отправки: {response.status_code} {response.text}")
+        return None
+
+    async def run(self):
+        backoff = 1
+        while True:
+            if not self.size:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # Даём пачке уведомлений (несколько уровней за тик) собраться
+                await asyncio.sleep(COALESCE_WINDOW)
+
+            await self.bucket.take()
+            batch = self._take_batch()
+            if not batch:
+                continue
+
+            try:
+                retry_after = await self._send(self._format(batch))
+            except asyncio.CancelledError:
+                self._requeue(batch)
+                raise
+            except Exception as e:
+                # Сеть недоступна — пачка ждёт в своих очередях, повтор с нарастающей паузой
+                print(f"[Telegram] ❌ Ошибка отправки, повтор через {backoff} с: {e}")
+                self._requeue(batch)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, MAX_BACKOFF)
+                continue
+
+            if retry_after is not None:
+                # Повтор через столько, сколько попросил Telegram
+                self._requeue(batch)
+                await asyncio.sleep(retry_after)
+                continue
+            backoff = 1
+            self.sent += 1
+            self.coalesced += len(batch) - 1
+
+    def stats(self) -> dict:
+        return {"queued": self.size, "sent": self.sent, "coalesced": self.coalesced, "dropped": self.dropped}
+
+    async def report(self, redis):
+        """Периодически публиковать stats() в Redis; ключ истекает, если процесс остановился"""
+        while True:
+            try:
+                await redis.set(STATS_KEY, json.dumps(self.stats()), ex=STATS_INTERVAL * 3)
+            except Exception as e:
+                print(f"[Telegram] ❌ Ошибка записи статистики: {e}")
+            await asyncio.sleep(STATS_INTERVAL)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+dispatcher = AlertDispatcher()
+
 
-async def send_alert(message: str):
-    if not TELEGRAM_BOT_TOKEN or not TELEGRAM_CHAT_ID:
-        print("[Telegram] ❌ Не настроены переменные окружения")
-        return
-
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TELEGRAM_CHAT_ID,
-        "text": message,
-        "parse_mode": "HTML"
-    }
-
-    try:
-        async with httpx.AsyncClient() as client:
-            await client.post(url, json=payload)
-    except Exception as e:
-        print(f"[Telegram] ❌ Ошибка отправки: {e}")
+def send_alert(message: str, priority: int = PRIORITY_TRADE):
+    """Поставить уведомление в очередь; не блокирует и не ждёт отправки"""
+    dispatcher.enqueue(message, priority)
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+from watcher import ws_server
+
+
+class FakeWebSocket:
+    query_params = {}
+
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, payload):
+        self.sent.append(json.loads(payload))
+
+    async def send_bytes(self, payload):
+        raise AssertionError("unexpected binary frame")
+
+
+def event(event_id):
+    return event_id, {"event": json.dumps({"type": "test", "symbol": "BTCUSDT", "data": {}})}
+
+
+class FakeRedis:
+    """Стрим 1-0..3-0; пока идёт XRANGE досылки, публикуется 4-0"""
+
+    def __init__(self):
+        self.entries = [event("1-0"), event("2-0"), event("3-0")]
+
+    async def xrange(self, stream, min="-", count=None):
+        if min == "-":
+            return self.entries[:count]
+        await ws_server.broadcast_event(json.loads(event("4-0")[1]["event"]), "4-0")
+        self.entries.append(event("4-0"))
+        start = min.lstrip("(")
+        return [e for e in self.entries if ws_server._stream_id(e[0]) > ws_server._stream_id(start)][:count]
+
+
+def test_live_events_during_replay_arrive_in_order(monkeypatch):
+    monkeypatch.setattr(ws_server, "redis_client", FakeRedis())
+    monkeypatch.setattr(ws_server, "manager", ws_server.ConnectionManager())
+
+    async def scenario():
+        websocket = FakeWebSocket()
+        await ws_server.manager.connect(websocket)
+        # 3-0 опубликован после подключения, но до подписки с last_event_id
+        await ws_server.broadcast_event(json.loads(event("3-0")[1]["event"]), "3-0")
+        result = await ws_server.replay_events(websocket, "1-0")
+        # 5-0 — уже после досылки
+        await ws_server.broadcast_event(json.loads(event("5-0")[1]["event"]), "5-0")
+        await asyncio.sleep(0.01)
+        ws_server.manager.disconnect(websocket)
+        return result, [m["event_id"] for m in websocket.sent if "event_id" in m]
+
+    result, received = asyncio.run(scenario())
+
+    assert received == ["2-0", "3-0", "4-0", "5-0"]
+    assert result == {"replayed": 3, "resync_required": False}
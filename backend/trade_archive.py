@@ -0,0 +1,159 @@
+import json
+import time
+from datetime import datetime, timezone
+
+from redis.exceptions import WatchError
+
+from redis_client import async_redis
+
+# archive:{SYMBOL} — завершённые циклы грида (JSON), рядом — их агрегаты:
+# archive:stats:{SYMBOL} — итоги по всем записям,
+# archive:daily:{SYMBOL} — поля "{день}:{метрика}", archive:days:{SYMBOL} — zset дней (score — начало дня, мс)
+ARCHIVE_KEY = "archive:{}"
+STATS_KEY = "archive:stats:{}"
+DAILY_KEY = "archive:daily:{}"
+DAYS_KEY = "archive:days:{}"
+
+METRICS = ("profit", "quote_volume", "records", "trades", "wins")
+DAY_MS = 86400000
+
+
+def _keys(symbol: str) -> list[str]:
+    symbol = symbol.upper()
+    return [ARCHIVE_KEY.format(symbol), STATS_KEY.format(symbol), DAILY_KEY.format(symbol), DAYS_KEY.format(symbol)]
+
+
+def _day(row: dict) -> tuple[str, int]:
+    """День записи (UTC) по archivedAt, без него — текущий"""
+    try:
+        moment = datetime.fromisoformat(str(row["archivedAt"]).replace("Z", "+00:00"))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        ms = int(moment.timestamp() * 1000)
+    except (KeyError, ValueError):
+        ms = int(time.time() * 1000)
+    day_start = ms - ms % DAY_MS
+    return datetime.fromtimestamp(day_start / 1000, tz=timezone.utc).strftime("%Y-%m-%d"), day_start
+
+
+def _row_values(row: dict) -> tuple:
+    """(profit, quote_volume, trades, win, день, начало дня) одной записи"""
+    profit = float(row.get("profit", 0))
+    day, day_start = _day(row)
+    return (
+        profit,
+        float(row.get("totalBuyQuoteQty", 0)),
+        int(row.get("trades", 1)),
+        1 if profit > 0 else 0,
+        day,
+        day_start
+    )
+
+
+def _aggregate(raw: list) -> tuple[dict, dict, dict]:
+    """Суммы по записям архива: (итоги, дневные поля, {день: начало дня})"""
+    stats = dict.fromkeys(METRICS, 0.0)
+    daily, days = {}, {}
+    for item in raw:
+        profit, quote_volume, trades, win, day, day_start = _row_values(json.loads(item))
+        values = {"profit": profit, "quote_volume": quote_volume, "records": 1, "trades": trades, "wins": win}
+        for metric, value in values.items():
+            stats[metric] += value
+            daily[f"{day}:{metric}"] = daily.get(f"{day}:{metric}", 0.0) + value
+        days[day] = day_start
+    return stats, daily, days
+
+
+async def sync_stats(symbol: str, redis=async_redis, rebuild: bool = False):
+    """Довести агрегаты до текущего состояния списка.
+
+    Агрегаты учитывают первые stats.records записей. Записи, дописанные
+    в список после последнего подсчёта, досчитываются по порядку; если
+    список стал короче (удаление, обрезка) или rebuild=True — агрегаты
+    пересчитываются целиком. Список под WATCH: если во время пересчёта в него
+    что-то дописали, транзакция повторяется.
+    """
+    archive_key, stats_key, daily_key, days_key = _keys(symbol)
+    async with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(archive_key, stats_key)
+                length = await pipe.llen(archive_key)
+                records = int(float(await pipe.hget(stats_key, "records") or 0))
+                if length == records and not rebuild:
+                    return
+                reset = rebuild or length < records
+                start = 0 if reset else records
+                stats, daily, days = _aggregate(await pipe.lrange(archive_key, start, length - 1))
+
+                pipe.multi()
+                if reset:
+                    pipe.delete(stats_key, daily_key, days_key)
+                    pipe.hset(stats_key, mapping=stats)
+                    if daily:
+                        pipe.hset(daily_key, mapping=daily)
+                else:
+                    for metric, value in stats.items():
+                        pipe.hincrbyfloat(stats_key, metric, value)
+                    for field, value in daily.items():
+                        pipe.hincrbyfloat(daily_key, field, value)
+                if days:
+                    pipe.zadd(days_key, days)
+                await pipe.execute()
+                return
+            except WatchError:
+                continue
+
+
+async def rebuild_stats(symbol: str, redis=async_redis):
+    """Пересчитать агрегаты по всему архиву"""
+    await sync_stats(symbol, redis, rebuild=True)
+
+
+def _summary(values: dict) -> dict:
+    profit = float(values.get("profit") or 0)
+    quote_volume = float(values.get("quote_volume") or 0)
+    records = int(float(values.get("records") or 0))
+    return {
+        "profit": profit,
+        "profitPercentage": profit / quote_volume * 100 if quote_volume else 0,
+        "quoteVolume": quote_volume,
+        "trades": int(float(values.get("trades") or 0)),
+        "records": records,
+        "winRate": int(float(values.get("wins") or 0)) / records * 100 if records else 0
+    }
+
+
+async def get_stats(symbol: str, redis=async_redis) -> dict:
+    """Итоги по всему архиву — чтение хеша (и досчёт новых записей)"""
+    _, stats_key, _, _ = _keys(symbol)
+    await sync_stats(symbol, redis)
+    return _summary(await redis.hgetall(stats_key))
+
+
+async def get_range_stats(symbol: str, start: str | None = None, end: str | None = None,
+                          redis=async_redis) -> dict:
+    """Итоги за дни [start, end] (YYYY-MM-DD) из дневных агрегатов, с разбивкой по дням"""
+    _, _, daily_key, days_key = _keys(symbol)
+    await sync_stats(symbol, redis)
+
+    def day_ms(day: str) -> int:
+        return int(datetime.strptime(day, "%Y-%m-%d").replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+    low = day_ms(start) if start else "-inf"
+    high = day_ms(end) if end else "+inf"
+    days = await redis.zrangebyscore(days_key, low, high)
+    if not days:
+        return {**_summary({}), "days": []}
+
+    fields = [f"{day}:{metric}" for day in days for metric in METRICS]
+    values = await redis.hmget(daily_key, fields)
+
+    total = dict.fromkeys(METRICS, 0.0)
+    per_day = []
+    for i, day in enumerate(days):
+        day_values = dict(zip(METRICS, values[i * len(METRICS):(i + 1) * len(METRICS)]))
+        for metric in METRICS:
+            total[metric] += float(day_values[metric] or 0)
+        per_day.append({"day": day, **_summary(day_values)})
+    return {**_summary(total), "days": per_day}
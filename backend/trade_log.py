@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+# Журнал событий грида: Redis Stream на символ. ID записи — время добавления,
+# поэтому по нему же работают курсор и фильтр по времени.
+LOG_KEY = "logs:{}"
+LOG_MAXLEN = int(os.getenv("LOG_MAXLEN", 100000))
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", 90))
+
+FLUSH_INTERVAL = 0.1
+FLUSH_BATCH = 500
+RETENTION_INTERVAL = 3600
+
+
+def log_key(symbol: str) -> str:
+    return LOG_KEY.format(symbol.upper())
+
+
+def entry_from_fields(entry_id: str, fields: dict) -> dict:
+    entry = {key: fields[key] for key in fields}
+    if "price" in entry:
+        entry["price"] = float(entry["price"])
+    entry["id"] = entry_id
+    return entry
+
+
+class TradeLogWriter:
+    """Буферизованная запись журнала: события копятся в памяти и уходят
+    в Redis одним pipeline раз в FLUSH_INTERVAL, стримы обрезаются по длине
+    при записи и по возрасту раз в час — все logs:*, а не только те, в которые
+    писал этот процесс."""
+
+    def __init__(self, redis, maxlen: int = LOG_MAXLEN, retention_days: int = LOG_RETENTION_DAYS):
+        self.redis = redis
+        self.maxlen = maxlen
+        self.retention_ms = retention_days * 86400000
+        self.buffer: list[tuple[str, dict]] = []
+        self._wakeup = asyncio.Event()
+
+    def append(self, symbol: str, event_type: str, price: float, **extra):
+        """Добавить событие, не дожидаясь записи"""
+        fields = {
+            "type": event_type,
+            "price": price,
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            **extra
+        }
+        self.buffer.append((symbol.upper(), fields))
+        if len(self.buffer) >= FLUSH_BATCH:
+            self._wakeup.set()
+
+    async def flush(self):
+        if not self.buffer:
+            return
+        buffer, self.buffer = self.buffer, []
+
+        pipe = self.redis.pipeline(transaction=False)
+        for symbol, fields in buffer:
+            pipe.xadd(log_key(symbol), fields, maxlen=self.maxlen, approximate=True)
+        try:
+            await pipe.execute()
+        except Exception:
+            # Не теряем события при кратковременной недоступности Redis
+            self.buffer[:0] = buffer
+            raise
+
+    async def trim(self):
+        min_id = int(time.time() * 1000) - self.retention_ms
+        pipe = self.redis.pipeline(transaction=False)
+        async for key in self.redis.scan_iter(match=LOG_KEY.format("*"), _type="stream"):
+            pipe.xtrim(key, minid=min_id, approximate=True)
+        await pipe.execute()
+
+    async def run(self):
+        await migrate_legacy_logs(self.redis)
+        last_trim = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if time.monotonic() - last_trim > RETENTION_INTERVAL:
+                    last_trim = time.monotonic()
+                    await self.trim()
+            except Exception as e:
+                print(f"[TradeLog] ❌ Ошибка записи журнала: {e}")
+                await asyncio.sleep(1)
+
+
+def _timestamp_ms(entry: dict, default: int) -> int:
+    try:
+        moment = datetime.fromisoformat(entry["timestamp"].rstrip("Z")).replace(tzinfo=timezone.utc)
+        return int(moment.timestamp() * 1000)
+    except Exception:
+        return default
+
+
+async def migrate_legacy_logs(redis):
+    """Журналы старого формата (список JSON) переносятся в стримы с ID по времени событий"""
+    async for key in redis.scan_iter(match="logs:*", _type="list"):
+        raw = await redis.lrange(key, 0, -1)
+        tmp_key = f"{key}:migrating"
+        pipe = redis.pipeline(transaction=False)
+        pipe.delete(tmp_key)
+        last_ms, seq = 0, 0
+        for item in raw:
+            entry = json.loads(item)
+            ms = max(_timestamp_ms(entry, last_ms), last_ms)
+            seq = seq + 1 if ms == last_ms else 0
+            # 0-0 стрим не принимает: у первых записей без времени ID начинается с 0-1
+            if ms == 0 and seq == 0:
+                seq = 1
+            last_ms = ms
+            fields = {k: v for k, v in entry.items() if v is not None}
+            pipe.xadd(tmp_key, fields, id=f"{ms}-{seq}")
+        if raw:
+            pipe.rename(tmp_key, key)
+        else:
+            pipe.delete(key)
+        await pipe.execute()
+        print(f"[TradeLog] Журнал {key} перенесён в стрим ({len(raw)} записей)")
+
+
+async def read_logs(redis, symbol: str, limit: int = 100, cursor: str | None = None,
+                    types: set[str] | None = None, start: int | None = None,
+                    end: int | None = None, max_scan: int = 10000) -> tuple[list[dict], str | None]:
+    """Страница журнала от новых к старым.
+
+    cursor — ID последней просмотренной записи: следующая страница начинается
+    сразу после неё, без чтения с начала. При фильтре по типу просматривается
+    не больше max_scan записей; возвращённый курсор продолжает с места остановки.
+    Возвращает (записи, курсор следующей страницы или None, если дальше пусто).
+    """
+    key = log_key(symbol)
+    high = f"({cursor}" if cursor else (str(end) if end is not None else "+")
+    low = str(start) if start is not None else "-"
+
+    rows = []
+    scanned = 0
+    batch = limit if not types else min(max(limit * 4, 100), 1000)
+    while len(rows) < limit and scanned < max_scan:
+        page = await redis.xrevrange(key, max=high, min=low, count=batch)
+        if not page:
+            return rows, None
+        for entry_id, fields in page:
+            scanned += 1
+            high = f"({entry_id}"
+            if not types or fields.get("type") in types:
+                rows.append(entry_from_fields(entry_id, fields))
+                if len(rows) == limit:
+                    break
+        if len(page) < batch and len(rows) < limit:
+            return rows, None
+
+    return rows, high[1:]
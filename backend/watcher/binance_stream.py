@@ -0,0 +1,119 @@
+import asyncio
+import json
+import logging
+import os
+
+import websockets
+
+BINANCE_STREAM_URL = os.getenv("BINANCE_STREAM_URL", "wss://stream.binance.com:9443/stream")
+
+# Binance принимает не больше 5 управляющих сообщений в секунду на соединение
+SUBSCRIBE_BATCH = 100
+SUBSCRIBE_INTERVAL = 0.25
+
+logger = logging.getLogger(__name__)
+
+
+class BinanceStream:
+    """Одно комбинированное соединение с Binance и динамический набор стримов.
+
+    on_message(stream, data) вызывается для каждого сообщения из подписанных стримов.
+    Подписки меняются через set_streams() без переподключения, при обрыве
+    соединение восстанавливается и подписки отправляются заново.
+    streams — желаемый набор, subscribed — то, что реально отправлено на
+    текущее соединение: неотправленная пачка повторится при следующем
+    set_streams() или переподключении.
+    """
+
+    def __init__(self, on_message, url: str = BINANCE_STREAM_URL, name: str = "BinanceStream"):
+        self.on_message = on_message
+        self.url = url
+        self.name = name
+        self.streams: set[str] = set()
+        self.subscribed: set[str] = set()
+        self._ws = None
+        self._request_id = 0
+        self._send_lock = asyncio.Lock()
+
+    @property
+    def connected(self) -> bool:
+        return self._ws is not None
+
+    async def set_streams(self, streams):
+        """Привести подписки к заданному набору стримов"""
+        self.streams = set(streams)
+        if self._ws is None:
+            # Подпишемся при следующем подключении
+            return
+        await self._sync()
+
+    async def _sync(self):
+        """Отправить разницу между желаемыми и отправленными подписками"""
+        added = self.streams - self.subscribed
+        removed = self.subscribed - self.streams
+
+        try:
+            if removed:
+                await self._send("UNSUBSCRIBE", removed)
+            if added:
+                await self._send("SUBSCRIBE", added)
+        except Exception as e:
+            logger.warning(f"[{self.name}] Failed to update subscriptions: {e}")
+
+    async def _send(self, method: str, streams):
+        params = sorted(streams)
+        async with self._send_lock:
+            for i in range(0, len(params), SUBSCRIBE_BATCH):
+                batch = params[i:i + SUBSCRIBE_BATCH]
+                self._request_id += 1
+                await self._ws.send(json.dumps({
+                    "method": method,
+                    "params": batch,
+                    "id": self._request_id
+                }))
+                # Учитываем только пачки, которые действительно ушли
+                if method == "SUBSCRIBE":
+                    self.subscribed.update(batch)
+                else:
+                    self.subscribed.difference_update(batch)
+                logger.info(f"[{self.name}] {method} {len(batch)} streams")
+                await asyncio.sleep(SUBSCRIBE_INTERVAL)
+
+    async def run(self):
+        """Основной цикл: подключение, чтение и переподключение с backoff"""
+        backoff = 1
+        while True:
+            try:
+                async with websockets.connect(self.url, ping_interval=20, ping_timeout=20) as ws:
+                    self._ws = ws
+                    self.subscribed = set()
+                    backoff = 1
+                    logger.info(f"[{self.name}] Connected to {self.url}")
+
+                    # Новое соединение — подписываемся на весь желаемый набор
+                    if self.streams:
+                        await self._sync()
+
+                    async for message in ws:
+                        data = json.loads(message)
+                        stream = data.get("stream")
+                        if stream is None:
+                            # Ответы на SUBSCRIBE/UNSUBSCRIBE
+                            if data.get("error"):
+                                logger.error(f"[{self.name}] Stream error: {data['error']}")
+                            continue
+                        try:
+                            await self.on_message(stream, data["data"])
+                        except Exception as e:
+                            logger.error(f"[{self.name}] Error handling {stream}: {e}")
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[{self.name}] Connection lost: {e}. Reconnecting in {backoff}s")
+            finally:
+                self._ws = None
+                self.subscribed = set()
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
@@ -0,0 +1,161 @@
+import os
+
+from candle_store import candle_key, read_candles
+
+MINUTE_MS = 60000
+INTERVAL_MS = {
+    "3m": 3 * MINUTE_MS,
+    "5m": 5 * MINUTE_MS,
+    "15m": 15 * MINUTE_MS,
+    "30m": 30 * MINUTE_MS,
+    "1h": 60 * MINUTE_MS,
+    "2h": 120 * MINUTE_MS,
+    "4h": 240 * MINUTE_MS,
+    "1d": 1440 * MINUTE_MS,
+}
+AGGREGATE_INTERVALS = os.getenv("AGGREGATE_INTERVALS", "3m,5m,15m,1h,4h,1d")
+
+# Минутных свечей храним не меньше суток, чтобы после перезапуска
+# можно было восстановить текущую дневную свечу
+MINUTE_CANDLES = 1500
+
+
+class Bucket:
+    """Текущая свеча старшего интервала, собираемая из минутных.
+
+    Закрытые минуты сворачиваются в (o, h, l, c, v), текущая открытая минута
+    хранится отдельно и при каждом обновлении просто заменяется, так что
+    обновление стоит O(1) независимо от длины интервала.
+    """
+
+    __slots__ = ("open_time", "interval_ms", "o", "h", "l", "c", "v", "folded_until", "minute")
+
+    def __init__(self, open_time: int, interval_ms: int):
+        self.open_time = open_time
+        self.interval_ms = interval_ms
+        self.o = self.h = self.l = self.c = None
+        self.v = 0.0
+        self.folded_until = open_time - 1
+        self.minute = None  # (t, o, h, l, c, v) открытой минуты
+
+    def _fold(self, minute: tuple):
+        t, o, h, l, c, v = minute
+        if self.o is None:
+            self.o, self.h, self.l = o, h, l
+        else:
+            self.h = max(self.h, h)
+            self.l = min(self.l, l)
+        self.c = c
+        self.v += v
+        self.folded_until = t
+
+    def update(self, candle: dict) -> bool:
+        """Учесть обновление минутной свечи; False, если оно устарело"""
+        t = candle['t']
+        if t <= self.folded_until or (self.minute is not None and t < self.minute[0]):
+            return False
+
+        minute = (
+            t,
+            float(candle['o']),
+            float(candle['h']),
+            float(candle['l']),
+            float(candle['c']),
+            float(candle['v'])
+        )
+        if self.minute is not None and self.minute[0] < t:
+            # Закрытие предыдущей минуты могло не прийти — берём её последнее состояние
+            self._fold(self.minute)
+        if candle['x']:
+            self._fold(minute)
+            self.minute = None
+        else:
+            self.minute = minute
+        return True
+
+    def finish(self):
+        if self.minute is not None:
+            self._fold(self.minute)
+            self.minute = None
+
+    @property
+    def closed(self) -> bool:
+        return self.minute is None and self.folded_until >= self.open_time + self.interval_ms - MINUTE_MS
+
+    def candle(self, closed: bool | None = None) -> dict:
+        o, h, l, c, v = self.o, self.h, self.l, self.c, self.v
+        if self.minute is not None:
+            _, mo, mh, ml, mc, mv = self.minute
+            if o is None:
+                o, h, l = mo, mh, ml
+            else:
+                h = max(h, mh)
+                l = min(l, ml)
+            c = mc
+            v += mv
+
+        return {
+            't': self.open_time,
+            'o': o,
+            'h': h,
+            'l': l,
+            'c': c,
+            'v': v,
+            'T': self.open_time + self.interval_ms - 1,
+            'x': self.closed if closed is None else closed,
+        }
+
+
+class CandleAggregator:
+    """Строит свечи старших интервалов из минутного потока.
+
+    На каждое обновление минутной свечи пересчитывается только текущая свеча
+    каждого интервала. При старте посреди интервала свеча восстанавливается
+    одним чтением минутных свечей из хранилища.
+    """
+
+    def __init__(self, redis_binary, intervals=AGGREGATE_INTERVALS):
+        self.redis_binary = redis_binary
+        if isinstance(intervals, str):
+            intervals = [i.strip() for i in intervals.split(",") if i.strip()]
+        self.intervals = {interval: INTERVAL_MS[interval] for interval in intervals}
+        self.buckets: dict[tuple[str, str], Bucket] = {}
+
+    async def _warm_up(self, bucket: Bucket, symbol: str, until: int):
+        minutes = await read_candles(
+            self.redis_binary, candle_key(symbol, "1m"), start=bucket.open_time, end=until - 1
+        )
+        for minute in minutes:
+            minute['x'] = True
+            bucket.update(minute)
+
+    async def update(self, symbol: str, candle: dict, skip=()) -> list[tuple[str, dict]]:
+        """Обновлённые свечи старших интервалов: [(interval, candle)]"""
+        t = candle['t']
+        updated = []
+
+        for interval, interval_ms in self.intervals.items():
+            if interval in skip:
+                continue
+
+            start = t - t % interval_ms
+            bucket = self.buckets.get((symbol, interval))
+
+            if bucket is None or bucket.open_time < start:
+                if bucket is not None and not bucket.closed:
+                    # Интервал кончился — фиксируем предыдущую свечу закрытой
+                    bucket.finish()
+                    updated.append((interval, bucket.candle(closed=True)))
+
+                bucket = Bucket(start, interval_ms)
+                if t > start:
+                    await self._warm_up(bucket, symbol, t)
+                self.buckets[(symbol, interval)] = bucket
+
+            elif bucket.open_time > start:
+                continue
+
+            if bucket.update(candle):
+                updated.append((interval, bucket.candle()))
+
+        return updated
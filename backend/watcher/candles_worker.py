@@ -1,24 +1,28 @@
 import asyncio
-import aiohttp
 import redis.asyncio as redis
-import json
 import time
 
+from binance_client import binance
+from candle_store import MAX_CANDLES, candle_key, from_rest_kline, upsert_candles
+from watcher.candle_aggregator import MINUTE_CANDLES
+
 SYMBOL = "BTCUSDT"
 INTERVAL = "1m"
 LIMIT = 100
-REDIS_KEY = f"candles:{SYMBOL}:{INTERVAL}"
+REDIS_KEY = candle_key(SYMBOL, INTERVAL)
+# Минутных свечей храним больше — из них после перезапуска собирается 1d
+MAX_STORED = MINUTE_CANDLES if INTERVAL == "1m" else MAX_CANDLES
 
 r = redis.Redis(host="redis", port=6379, decode_responses=True)
 
 async def fetch_candles():
-    url = f"https://api.binance.com/api/v3/klines?symbol={SYMBOL}&interval={INTERVAL}&limit={LIMIT}"
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as res:
-            data = await res.json()
-            candles = [[c[0], c[1], c[2], c[3], c[4]] for c in data]
-            await r.set(REDIS_KEY, json.dumps(candles))
-            print(f"[✓] Updated {len(candles)} candles at {time.strftime('%H:%M:%S')}")
+    # Запрос идёт через общий планировщик веса (приоритет рыночных данных)
+    data = await binance.get_klines(SYMBOL, INTERVAL, limit=LIMIT)
+    now_ms = int(time.time() * 1000)
+    candles = [from_rest_kline(c, now_ms) for c in data]
+    # Те же слоты, что пишет стрим: свечи с тем же временем открытия заменяются
+    await upsert_candles(r, REDIS_KEY, candles, max_candles=MAX_STORED)
+    print(f"[✓] Updated {len(candles)} candles at {time.strftime('%H:%M:%S')}")
 
 async def worker():
     while True:
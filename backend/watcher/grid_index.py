@@ -0,0 +1,94 @@
+from bisect import bisect_left, bisect_right
+
+
+def _parse_level(level: dict):
+    """(buy, sell, quantity) уровня в числах или None, если уровень уже сработал"""
+    if level.get("triggered", False):
+        return None
+    return (
+        float(level["buy"]["price"]),
+        float(level["sell"]["price"]),
+        float(level["buy"]["quantity"])  # предполагаем, что одинаково
+    )
+
+
+class GridIndex:
+    """Скомпилированный индекс уровней живого грида для проверки на каждом тике.
+
+    Цены покупки и продажи несработавших уровней хранятся уже распарсенными
+    в отсортированных массивах, поэтому все пересечённые уровни находятся
+    бинарным поиском, а не обходом всего грида.
+    """
+
+    __slots__ = ("levels", "parsed", "buy_prices", "buy_levels", "sell_prices", "sell_levels")
+
+    def __init__(self, levels: list):
+        self.levels = levels
+        self.parsed = [_parse_level(level) for level in levels]
+        self._sort()
+
+    def _sort(self):
+        buys = sorted((p[0], i) for i, p in enumerate(self.parsed) if p is not None)
+        sells = sorted((p[1], i) for i, p in enumerate(self.parsed) if p is not None)
+        self.buy_prices = [price for price, _ in buys]
+        self.buy_levels = [i for _, i in buys]
+        self.sell_prices = [price for price, _ in sells]
+        self.sell_levels = [i for _, i in sells]
+
+    def update(self, levels: list):
+        """Пересобрать индекс под новый грид, не парся заново неизменившиеся уровни"""
+        if levels is self.levels:
+            return
+
+        old_levels, old_parsed = self.levels, self.parsed
+        parsed = []
+        for i, level in enumerate(levels):
+            if i < len(old_levels) and old_levels[i] == level:
+                parsed.append(old_parsed[i])
+            else:
+                parsed.append(_parse_level(level))
+
+        self.levels = levels
+        self.parsed = parsed
+        self._sort()
+
+    def crossed(self, low: float, high: float) -> list[tuple[int, str, float, float]]:
+        """Уровни, пересечённые ценой в диапазоне [low, high]: (index, side, price, quantity).
+
+        Как и раньше, покупка проверяется первой: если у уровня пересечены
+        обе стороны, срабатывает BUY.
+        """
+        hits = {}
+        for i in self.buy_levels[bisect_left(self.buy_prices, low):]:
+            hits[i] = "BUY"
+        for i in self.sell_levels[:bisect_right(self.sell_prices, high)]:
+            hits.setdefault(i, "SELL")
+
+        result = []
+        for i in sorted(hits):
+            buy, sell, quantity = self.parsed[i]
+            side = hits[i]
+            result.append((i, side, buy if side == "BUY" else sell, quantity))
+        return result
+
+    def mark_triggered(self, index: int):
+        """Убрать сработавший уровень из индекса (уровни одноразовые)"""
+        parsed = self.parsed[index]
+        if parsed is None:
+            return
+        self.parsed[index] = None
+        self._remove(self.buy_prices, self.buy_levels, parsed[0], index)
+        self._remove(self.sell_prices, self.sell_levels, parsed[1], index)
+
+    @staticmethod
+    def _remove(prices: list, levels: list, price: float, index: int):
+        pos = bisect_left(prices, price)
+        while pos < len(prices) and prices[pos] == price:
+            if levels[pos] == index:
+                del prices[pos]
+                del levels[pos]
+                return
+            pos += 1
+
+    def __len__(self):
+        return len(self.buy_levels)
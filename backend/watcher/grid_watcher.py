@@ -1,128 +1,290 @@
 import asyncio
 import os
-import json
-from datetime import datetime
-from binance.client import Client
 from redis.asyncio import Redis
-from redis_client import get_grid, save_grid
-from telegram.alerts import send_alert
-
-client = Client(
-    api_key=os.getenv("BINANCE_API_KEY"),
-    api_secret=os.getenv("BINANCE_API_SECRET")
+from redis_client import (
+    GRID_CHANGES_CHANNEL,
+    MONITORING_CHANNEL,
+    get_grid_changes,
+    get_grid_versioned,
+    get_monitored_symbols_async,
+    parse_grid_change,
+    trigger_level
 )
-
-REAL_TRADING = os.getenv("REAL_TRADING", "false").lower() == "true"
+from telegram.alerts import dispatcher as alert_dispatcher, send_alert
+from trade_log import TradeLogWriter
+from watcher.binance_stream import BinanceStream
+from watcher.grid_index import GridIndex
+from watcher.order_executor import OrderExecutor, OrderIntent
 
 redis = Redis(host="redis", port=6379, decode_responses=True)
-MONITORING_KEY = "monitoring-symbols"
+# Полная сверка набора символов на случай пропущенного уведомления (сек)
+RECONCILE_INTERVAL = 60
+# Дополнительно слушать keyspace-уведомления Redis по grid:* — ловит и изменения
+# в обход redis_client (например, из redis-cli)
+GRID_KEYSPACE_NOTIFICATIONS = os.getenv("GRID_KEYSPACE_NOTIFICATIONS", "false").lower() == "true"
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+executor = OrderExecutor(redis)
+trade_log = TradeLogWriter(redis)
+
+
+class PriceTicks:
+    """Цены символа из стрима: low/high/last с момента последнего чтения.
+
+    Между двумя проверками грида может прийти много сделок — храним диапазон,
+    чтобы не пропустить уровень, который цена пересекла и тут же покинула.
+    """
+
+    __slots__ = ("low", "high", "last", "event")
+
+    def __init__(self):
+        self.low = None
+        self.high = None
+        self.last = None
+        self.event = asyncio.Event()
+
+    def push(self, price: float):
+        if self.low is None or price < self.low:
+            self.low = price
+        if self.high is None or price > self.high:
+            self.high = price
+        self.last = price
+        self.event.set()
+
+    async def pull(self) -> tuple[float, float, float]:
+        await self.event.wait()
+        self.event.clear()
+        low, high, last = self.low, self.high, self.last
+        self.low = self.high = None
+        return low, high, last
+
+
+ticks: dict[str, PriceTicks] = {}
+
+
+def stream_name(symbol: str) -> str:
+    return f"{symbol.lower()}@aggTrade"
+
+
+async def on_trade(stream: str, data: dict):
+    feed = ticks.get(data["s"])
+    if feed is not None:
+        feed.push(float(data["p"]))
+
+
+stream = BinanceStream(on_trade, name="GridWatcher")
+
+# Закэшированные живые гриды: скомпилированный индекс, версия грида и версии
+# уровней в Redis. На тиках Redis не читается; кэш обновляется по событиям из
+# GRID_CHANGES_CHANNEL. Версия уровня передаётся в trigger_level: срабатывание
+# по устаревшей копии (грид уже заменили) не пройдёт.
+grid_indexes: dict[str, GridIndex] = {}
+grid_versions: dict[str, int] = {}
+level_versions: dict[str, list[int]] = {}
+
+
+async def load_grid(symbol: str) -> GridIndex:
+    version, levels, versions = await get_grid_versioned(symbol, live=True)
+    index = grid_indexes[symbol] = GridIndex(levels)
+    grid_versions[symbol] = version
+    level_versions[symbol] = versions
+    return index
+
+
+async def refresh_grid(symbol: str, version: int | None = None):
+    """Дочитать изменённые уровни, если закэшированная версия устарела"""
+    index = grid_indexes.get(symbol)
+    if index is None:
+        return
+    cached = grid_versions.get(symbol, 0)
+    if version is not None and version <= cached:
+        return
+
+    new_version, count, changed, changed_versions = await get_grid_changes(symbol, cached, live=True)
+    if new_version == cached:
+        return
+    levels = index.levels[:count]
+    levels.extend([None] * (count - len(levels)))
+    versions = level_versions.get(symbol, [])[:count]
+    versions.extend([0] * (count - len(versions)))
+    for i, level in changed.items():
+        if i < count:
+            levels[i] = level
+            versions[i] = changed_versions[i]
+    if any(level is None for level in levels):
+        await load_grid(symbol)
+        return
+
+    index.update(levels)
+    grid_versions[symbol] = new_version
+    level_versions[symbol] = versions
+
+
+# Флаги keyspace-уведомлений, нужные grid_listener: K — канал __keyspace@*__,
+# g — DEL/RENAME и т.п., h — команды хешей, $ — строки (гриды старого формата)
+KEYSPACE_FLAGS = "Kgh$"
 
-async def execute_order(symbol: str, side: str, quantity: float):
-    if not REAL_TRADING:
-        print(f"[SIMULATION] 💸 {side} {quantity} {symbol}")
-        return {"simulated": True, "side": side, "quantity": quantity}
-
-    try:
-        print(f"[REAL] 💰 Sending {side} order for {symbol}...")
-        order = client.create_order(
-            symbol=symbol,
-            side=side.upper(),
-            type="MARKET",
-            quantity=quantity
-        )
-        print(f"[REAL] ✅ Order filled: {order}")
-        return order
-    except Exception as e:
-        print(f"[REAL] ❌ Order failed: {e}")
-        return {"error": str(e)}
-
-async def check_price(symbol: str) -> float | None:
-    try:
-        ticker = client.get_symbol_ticker(symbol=symbol)
-        return float(ticker["price"])
-    except:
-        return None
+
+async def enable_keyspace_notifications():
+    """Добавить нужные флаги к notify-keyspace-events, не затирая настроенные на сервере"""
+    current = (await redis.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+    # A — псевдоним для "g$lshzxetd", в нём уже есть g, h и $
+    missing = "".join(
+        flag for flag in KEYSPACE_FLAGS
+        if flag not in current and not (flag in "gh$" and "A" in current)
+    )
+    if missing:
+        await redis.config_set("notify-keyspace-events", current + missing)
+
+
+async def grid_listener():
+    """Обновляет кэш гридов по событиям изменений (и keyspace-уведомлениям)"""
+    while True:
+        try:
+            pubsub = redis.pubsub()
+            await pubsub.subscribe(GRID_CHANGES_CHANNEL)
+            if GRID_KEYSPACE_NOTIFICATIONS:
+                try:
+                    await enable_keyspace_notifications()
+                except Exception as e:
+                    print(f"[GridWatcher] ⚠️ Не удалось включить keyspace-уведомления: {e}")
+                await pubsub.psubscribe("__keyspace@*__:grid:*")
+
+            # Пока не были подписаны, события могли потеряться
+            for symbol in list(grid_indexes):
+                await refresh_grid(symbol)
+
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    live, symbol, version = parse_grid_change(message["data"])
+                    if live:
+                        await refresh_grid(symbol, version)
+                elif message["type"] == "pmessage":
+                    # __keyspace@0__:grid:SYMBOL — только живые гриды, без версии
+                    key = message["channel"].split(":", 1)[1]
+                    parts = key.split(":")
+                    if len(parts) == 2:
+                        await refresh_grid(parts[1])
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"[GridWatcher] ❌ Ошибка подписки на изменения гридов: {e}")
+            await asyncio.sleep(5)
 
 
 async def log_event(symbol: str, event_type: str, price: float):
-    log = {
-        "type": event_type,
-        "price": price,
-        "timestamp": datetime.utcnow().isoformat() + "Z"
-    }
-    await redis.rpush(f"logs:{symbol.upper()}", json.dumps(log))
-    await send_alert(f"📉 {symbol} {event_type} @ {price}")
+    trade_log.append(symbol, event_type, price)
+    send_alert(f"📉 {symbol} {event_type} @ {price}")
 
 
 async def watch_symbol(symbol: str):
     print(f"[GridWatcher] 🟢 Следим за {symbol}")
+    feed = ticks.setdefault(symbol, PriceTicks())
     while True:
         try:
-            price = await check_price(symbol)
-            if price is None:
-                await asyncio.sleep(5)
+            low, high, price = await feed.pull()
+
+            index = grid_indexes.get(symbol)
+            if index is None:
+                index = await load_grid(symbol)
+
+            hits = index.crossed(low, high)
+            if not hits:
                 continue
 
-            levels = get_grid(symbol, live=True)
-            updated = False
-
-            for level in levels:
-                if not level.get("triggered", False):
-                    buy = float(level["buy"]["price"])
-                    sell = float(level["sell"]["price"])
-                    quantity = float(level["buy"]["quantity"])  # предполагаем, что одинаково
-
-                    if price <= buy:
-                        print(f"💥 BUY triggered at {buy} (now: {price})")
-                        level["triggered"] = True
-                        level["status"] = "buy-triggered"
-                        await log_event(symbol, "BUY", price)
-                        await execute_order(symbol, "BUY", quantity)
-                        updated = True
-
-                    elif price >= sell:
-                        print(f"💥 SELL triggered at {sell} (now: {price})")
-                        level["triggered"] = True
-                        level["status"] = "sell-triggered"
-                        await log_event(symbol, "SELL", price)
-                        await execute_order(symbol, "SELL", quantity)
-                        updated = True
-
-            if updated:
-                save_grid(symbol, levels, live=True)
+            levels = index.levels
+            versions = level_versions[symbol]
+            triggered = []
+            stale = False
+            for i, side, level_price, quantity in hits:
+                # Атомарно в Redis, CAS по версии уровня: уровень, уже сработавший
+                # в другом месте или заменённый вместе с гридом, не исполняем
+                version = await trigger_level(symbol, i, side, expected_version=versions[i])
+                if version is None:
+                    stale = True
+                    continue
+                index.mark_triggered(i)
+                versions[i] = version
+                # Своё изменение без пропусков версий — перечитывать нечего
+                if version == grid_versions.get(symbol, 0) + 1:
+                    grid_versions[symbol] = version
+
+                # Ордер — в очередь исполнения сразу, до логов и уведомлений
+                executor.submit(OrderIntent(symbol, side, quantity, i, version))
+                levels[i]["triggered"] = True
+                levels[i]["status"] = f"{side.lower()}-triggered"
+                triggered.append((side, level_price, low if side == "BUY" else high))
+
+            # Кэш разошёлся с Redis — дочитать изменения, не дожидаясь уведомления
+            if stale:
+                await refresh_grid(symbol)
 
+            for side, level_price, price in triggered:
+                print(f"💥 {side} triggered at {level_price} (now: {price})")
+                await log_event(symbol, side, price)
+
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
             print(f"[{symbol}] ❌ Ошибка: {e}")
 
-        await asyncio.sleep(10)
 
+tasks: dict[str, asyncio.Task] = {}
 
-async def main():
-    tasks = {}
 
-    while True:
-        try:
-            raw = await redis.get(MONITORING_KEY)
-            symbols = json.loads(raw) if raw else []
+async def reconcile():
+    """Привести задачи watch_symbol и подписку на сделки к набору monitoring-symbols"""
+    symbols = await get_monitored_symbols_async()
+
+    for s in symbols:
+        if s not in tasks:
+            tasks[s] = asyncio.create_task(watch_symbol(s))
+
+    for s in list(tasks):
+        if s not in symbols:
+            tasks[s].cancel()
+            del tasks[s]
+            ticks.pop(s, None)
+            grid_indexes.pop(s, None)
+            grid_versions.pop(s, None)
+            level_versions.pop(s, None)
+            print(f"[GridWatcher] 🛑 Остановили {s}")
 
-            for s in symbols:
-                if s not in tasks:
-                    tasks[s] = asyncio.create_task(watch_symbol(s))
+    await stream.set_streams(stream_name(s) for s in tasks)
 
-            for s in list(tasks):
-                if s not in symbols:
-                    tasks[s].cancel()
-                    del tasks[s]
-                    print(f"[GridWatcher] 🛑 Остановили {s}")
 
+async def main():
+    asyncio.create_task(stream.run())
+    asyncio.create_task(grid_listener())
+    executor.start()
+    asyncio.create_task(trade_log.run())
+    asyncio.create_task(alert_dispatcher.report(redis))
+
+    pubsub = None
+    while True:
+        try:
+            if pubsub is None:
+                pubsub = redis.pubsub()
+                await pubsub.subscribe(MONITORING_CHANNEL)
+            await reconcile()
         except Exception as e:
             print(f"[GridWatcher] ❌ Ошибка цикла: {e}")
+            pubsub = None
+            await asyncio.sleep(5)
+            continue
 
-        await asyncio.sleep(15)
+        # Ждём уведомление об изменении набора, но не дольше RECONCILE_INTERVAL
+        try:
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=RECONCILE_INTERVAL)
+            # Пачку изменений сверяем за один раз
+            while message is not None:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=0)
+        except Exception as e:
+            print(f"[GridWatcher] ❌ Ошибка подписки на monitoring-symbols: {e}")
+            pubsub = None
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+
+from binance_client import BinanceAPIError, binance
+from rate_limiter import RateLimitExceeded
+from redis_client import release_level
+
+REAL_TRADING = os.getenv("REAL_TRADING", "false").lower() == "true"
+ORDER_WORKERS = int(os.getenv("ORDER_WORKERS", 4))
+ORDER_TIMEOUT = float(os.getenv("ORDER_TIMEOUT", 5))
+MAX_ATTEMPTS = 3
+
+# Последние задержки исполнения (JSON), для /api/orders/latency
+LATENCY_KEY = "orders:latency"
+LATENCY_HISTORY = 1000
+
+# Binance: ордер с таким clientOrderId не найден
+UNKNOWN_ORDER_CODE = -2013
+
+# После неизвестного исхода отправки ордер ищется повторно с нарастающей паузой.
+# Окно длиннее recvWindow: отправленный запрос, не принятый к этому времени,
+# биржа уже отклонит по timestamp, поэтому «не найден» в конце окна означает,
+# что ордера нет и повторная отправка не приведёт к двойному исполнению.
+LOOKUP_DELAYS = (0.25, 0.5, 1, 2, 4)
+# Исходы, которые не удалось выяснить за окно: досверяются в фоне
+UNKNOWN_ORDERS_KEY = "orders:unknown"
+RECONCILE_INTERVAL = 30
+# Намерение, не отправленное из-за лимита запросов, ждёт не дольше (сек);
+# дальше рыночный ордер устарел — срабатывание уровня снимается
+MAX_ORDER_DELAY = float(os.getenv("MAX_ORDER_DELAY", 30))
+
+
+def client_order_id(symbol: str, level: int, version: int, side: str) -> str:
+    """Детерминированный newClientOrderId срабатывания уровня.
+
+    Версия грида после срабатывания уникальна для каждого триггера, поэтому
+    повторная отправка того же намерения получает тот же id.
+    """
+    digest = hashlib.sha1(f"{symbol}:{level}:{version}:{side}".encode()).hexdigest()
+    return f"grid-{digest[:31]}"
+
+
+class OrderIntent:
+    """Намерение исполнить ордер по сработавшему уровню"""
+
+    __slots__ = ("symbol", "side", "quantity", "level", "version", "client_order_id", "triggered_at", "attempts")
+
+    def __init__(self, symbol: str, side: str, quantity: float, level: int, version: int):
+        self.symbol = symbol
+        self.side = side.upper()
+        self.quantity = quantity
+        self.level = level
+        self.version = version
+        self.client_order_id = client_order_id(symbol, level, version, self.side)
+        self.triggered_at = time.monotonic()
+        self.attempts = 0
+
+
+class OrderExecutor:
+    """Очередь намерений и пул воркеров, отправляющих ордера на биржу.
+
+    Триггер только кладёт намерение в очередь и не ждёт сети; ордера от
+    нескольких уровней одного тика отправляются параллельно разными
+    воркерами. После таймаута ордер ищется по clientOrderId в течение
+    окна LOOKUP_DELAYS и отправляется заново, только если биржа точно его
+    не приняла; если выяснить не удалось, исход остаётся неизвестным и
+    досверяется в фоне. clientOrderId сам по себе от двойного исполнения
+    не защищает: Binance отклоняет дубликат, только пока первый ордер открыт.
+    """
+
+    def __init__(self, redis, client=binance, workers: int = ORDER_WORKERS):
+        self.redis = redis
+        self.client = client
+        self.workers = workers
+        self.queue: asyncio.Queue[OrderIntent] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        # Отложенные из-за лимита запросов намерения
+        self._delayed: set[asyncio.Task] = set()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+            self._tasks.append(asyncio.create_task(self._reconciler()))
+
+    def submit(self, intent: OrderIntent):
+        self.queue.put_nowait(intent)
+
+    async def _worker(self, number: int):
+        while True:
+            intent = await self.queue.get()
+            try:
+                result = await self._execute(intent)
+                if result is not None:
+                    await self._record(intent, result)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Orders] ❌ Воркер {number}: {intent.client_order_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    async def _send(self, intent: OrderIntent) -> dict:
+        return await self.client.create_order(
+            symbol=intent.symbol,
+            side=intent.side,
+            type="MARKET",
+            quantity=intent.quantity,
+            newClientOrderId=intent.client_order_id,
+            timeout=ORDER_TIMEOUT
+        )
+
+    async def _find(self, intent: OrderIntent) -> dict | None:
+        try:
+            return await self.client.get_order(intent.symbol, origClientOrderId=intent.client_order_id)
+        except BinanceAPIError as e:
+            if e.code == UNKNOWN_ORDER_CODE:
+                return None
+            raise
+
+    async def _lookup(self, intent: OrderIntent) -> tuple[bool, dict | None]:
+        """Поиск ордера после неизвестного исхода: (выяснили ли, ордер или None).
+
+        «Не найден» засчитывается только в конце окна: до этого запрос
+        на создание может быть ещё в пути.
+        """
+        found_missing = False
+        for delay in LOOKUP_DELAYS:
+            await asyncio.sleep(delay)
+            try:
+                order = await self._find(intent)
+            except Exception as e:
+                print(f"[REAL] ⚠️ Lookup {intent.client_order_id} failed: {e}")
+                found_missing = False
+                continue
+            if order is not None:
+                return True, order
+            found_missing = True
+        return found_missing, None
+
+    async def _requeue_later(self, intent: OrderIntent, delay: float):
+        await asyncio.sleep(delay)
+        self.queue.put_nowait(intent)
+
+    async def _release(self, intent: OrderIntent, reason: str):
+        """Ордер не отправлен — вернуть уровень в грид, чтобы он мог сработать снова"""
+        try:
+            released = await release_level(intent.symbol, intent.level, intent.version)
+        except Exception as e:
+            print(f"[Orders] ❌ Не удалось снять срабатывание уровня {intent.level} {intent.symbol}: {e}")
+            return
+        if released is None:
+            print(f"[Orders] ⚠️ Уровень {intent.level} {intent.symbol} уже изменён, срабатывание не снято")
+        else:
+            print(f"[Orders] ↩️ Уровень {intent.level} {intent.symbol} снова активен: {reason}")
+
+    async def _execute(self, intent: OrderIntent) -> dict | None:
+        """Ответ биржи, {"error": ...} или None, если намерение отложено до снятия лимита"""
+        if not REAL_TRADING:
+            intent.attempts = 1
+            print(f"[SIMULATION] 💸 {intent.side} {intent.quantity} {intent.symbol} ({intent.client_order_id})")
+            return {"simulated": True, "side": intent.side, "quantity": intent.quantity}
+
+        print(f"[REAL] 💰 Sending {intent.side} order for {intent.symbol} ({intent.client_order_id})...")
+        while True:
+            intent.attempts += 1
+            try:
+                order = await self._send(intent)
+                print(f"[REAL] ✅ Order filled: {order}")
+                return order
+            except (httpx.TimeoutException, httpx.TransportError) as e:
+                error = e
+            except RateLimitExceeded as e:
+                # Запрос не ушёл на биржу — отправим позже, пока ордер не устарел
+                waited = time.monotonic() - intent.triggered_at
+                if waited + e.retry_after <= MAX_ORDER_DELAY:
+                    intent.attempts -= 1
+                    print(f"[REAL] ⏳ Order delayed {e.retry_after:.1f}s by rate limit: {intent.client_order_id}")
+                    task = asyncio.create_task(self._requeue_later(intent, e.retry_after))
+                    self._delayed.add(task)
+                    task.add_done_callback(self._delayed.discard)
+                    return None
+                print(f"[REAL] ❌ Order not sent: {e}")
+                await self._release(intent, "rate limit")
+                return {"error": str(e)}
+            except BinanceAPIError as e:
+                if e.status_code < 500:
+                    print(f"[REAL] ❌ Order rejected: {e}")
+                    return {"error": str(e)}
+                error = e
+
+            # Исход неизвестен: ордер мог дойти до биржи
+            resolved, order = await self._lookup(intent)
+            if order is not None:
+                return order
+            if not resolved:
+                print(f"[REAL] ❓ Order outcome unknown after {intent.attempts} attempts: {error}")
+                await self._mark_unknown(intent, error)
+                return {"error": str(error), "status": "UNKNOWN"}
+            if intent.attempts >= MAX_ATTEMPTS:
+                print(f"[REAL] ❌ Order failed after {intent.attempts} attempts: {error}")
+                await self._release(intent, "order failed")
+                return {"error": str(error)}
+
+    async def _mark_unknown(self, intent: OrderIntent, error: Exception):
+        entry = {
+            "symbol": intent.symbol,
+            "side": intent.side,
+            "level": intent.level,
+            "version": intent.version,
+            "error": str(error),
+            "timestamp": int(time.time() * 1000)
+        }
+        try:
+            await self.redis.hset(UNKNOWN_ORDERS_KEY, intent.client_order_id, json.dumps(entry))
+        except Exception as e:
+            print(f"[Orders] ❌ Не удалось сохранить ордер с неизвестным исходом: {e}")
+
+    async def reconcile_unknown(self):
+        """Выяснить исход ордеров, которые не удалось найти сразу после отправки"""
+        for order_id, raw in (await self.redis.hgetall(UNKNOWN_ORDERS_KEY)).items():
+            entry = json.loads(raw)
+            try:
+                order = await self.client.get_order(entry["symbol"], origClientOrderId=order_id)
+            except BinanceAPIError as e:
+                if e.code != UNKNOWN_ORDER_CODE:
+                    continue
+                order = None
+            except Exception:
+                continue
+
+            if order is not None:
+                print(f"[Orders] ✅ {order_id}: {order.get('status')}")
+            else:
+                # Давно за пределами recvWindow — ордер биржей не принят
+                intent = OrderIntent(entry["symbol"], entry["side"], 0, entry["level"], entry["version"])
+                await self._release(intent, "order not found")
+            await self.redis.hdel(UNKNOWN_ORDERS_KEY, order_id)
+
+    async def _reconciler(self):
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL)
+            try:
+                await self.reconcile_unknown()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Orders] ❌ Ошибка сверки ордеров: {e}")
+
+    async def _record(self, intent: OrderIntent, result: dict):
+        """Задержка от срабатывания уровня до ответа биржи"""
+        latency_ms = (time.monotonic() - intent.triggered_at) * 1000
+        entry = {
+            "client_order_id": intent.client_order_id,
+            "symbol": intent.symbol,
+            "side": intent.side,
+            "level": intent.level,
+            "attempts": intent.attempts,
+            "status": result.get("status", "error") if "error" in result else result.get("status", "SIMULATED"),
+            "latency_ms": round(latency_ms, 2),
+            "timestamp": int(time.time() * 1000)
+        }
+        print(f"[Orders] ⏱ {intent.client_order_id} {entry['status']} за {entry['latency_ms']} мс")
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.lpush(LATENCY_KEY, json.dumps(entry))
+            pipe.ltrim(LATENCY_KEY, 0, LATENCY_HISTORY - 1)
+            await pipe.execute()
+        except Exception as e:
+            print(f"[Orders] ❌ Не удалось сохранить задержку: {e}")
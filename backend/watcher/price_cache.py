@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import time
+
+from binance_client import BinanceAPIError, binance
+from watcher.binance_stream import BinanceStream
+
+# Стрим всего рынка: раз в секунду — символы, у которых изменилась цена
+PRICE_STREAM = "!miniTicker@arr"
+# Сколько секунд цена считается актуальной (для цен из стрима — пока стрим жив)
+PRICE_MAX_AGE = float(os.getenv("PRICE_MAX_AGE", 5))
+# Binance: неизвестный символ
+INVALID_SYMBOL_CODE = -1121
+
+logger = logging.getLogger(__name__)
+
+
+class PriceCache:
+    """Последние цены всех символов из !miniTicker@arr.
+
+    Стрим присылает только изменившиеся символы, поэтому цена из стрима
+    актуальна, пока сам стрим получает сообщения не реже max_age. Если
+    стрим молчит или символа нет в кэше — цена берётся из REST и кэшируется
+    на max_age; одновременные промахи ждут один общий запрос.
+    """
+
+    def __init__(self, client=binance, max_age: float = PRICE_MAX_AGE):
+        self.client = client
+        self.max_age = max_age
+        # symbol -> (цена, время события Binance, мс, monotonic получения, из стрима ли)
+        self.prices: dict[str, tuple[str, int, float, bool]] = {}
+        self.stream_at = 0.0
+        self.rest_requests = 0
+        self._inflight: dict[str | None, asyncio.Future] = {}
+        self.stream = BinanceStream(self.on_message, name="PriceCache")
+
+    async def on_message(self, stream: str, data: list[dict]):
+        now = time.monotonic()
+        self.stream_at = now
+        for ticker in data:
+            self.prices[ticker["s"]] = (ticker["c"], ticker["E"], now, True)
+
+    def _fresh(self, entry, now: float, max_age: float) -> bool:
+        _, _, received, from_stream = entry
+        if from_stream and self.stream.connected and now - self.stream_at <= max_age:
+            return True
+        return now - received <= max_age
+
+    def get_cached(self, symbol: str, max_age: float | None = None) -> dict | None:
+        entry = self.prices.get(symbol.upper())
+        if entry is None or not self._fresh(entry, time.monotonic(), self.max_age if max_age is None else max_age):
+            return None
+        return {"symbol": symbol.upper(), "price": entry[0], "time": entry[1]}
+
+    async def _fetch(self, symbol: str | None):
+        """REST-запрос цены символа (или всех при symbol=None), один на все ожидающие"""
+        future = self._inflight.get(symbol)
+        if future is not None:
+            return await future
+
+        future = self._inflight[symbol] = asyncio.get_running_loop().create_future()
+        try:
+            self.rest_requests += 1
+            if symbol is None:
+                tickers = await self.client.get_symbol_tickers()
+            else:
+                tickers = [await self.client.get_symbol_ticker(symbol=symbol)]
+            now = time.monotonic()
+            event_time = int(time.time() * 1000)
+            for ticker in tickers:
+                # Свежую цену из стрима ответ REST не перезаписывает
+                entry = self.prices.get(ticker["symbol"])
+                if entry is None or not entry[3] or not self._fresh(entry, now, self.max_age):
+                    self.prices[ticker["symbol"]] = (ticker["price"], event_time, now, False)
+            future.set_result(None)
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение получит вызывающий; ожидающих может и не быть
+            future.exception()
+            raise
+        finally:
+            del self._inflight[symbol]
+            if not future.done():
+                # Ведущий запрос отменён — ожидающие получат CancelledError, а не зависнут
+                future.cancel()
+
+    async def get_price(self, symbol: str, max_age: float | None = None) -> dict | None:
+        """Цена символа; None, если биржа такого символа не знает (или он снят с торгов)"""
+        symbol = symbol.upper()
+        price = self.get_cached(symbol, max_age)
+        if price is None:
+            try:
+                await self._fetch(symbol)
+            except BinanceAPIError as e:
+                if e.code == INVALID_SYMBOL_CODE:
+                    return None
+                raise
+            entry = self.prices.get(symbol)
+            if entry is None:
+                return None
+            price = {"symbol": symbol, "price": entry[0], "time": entry[1]}
+        return price
+
+    async def get_prices(self, symbols: list[str] | None = None, max_age: float | None = None) -> dict[str, dict]:
+        """Цены набора символов (все известные при symbols=None).
+
+        Промахи добираются одним запросом всех цен — вес у него как у запроса
+        двух символов, а неизвестный символ не роняет всю пачку.
+        """
+        if symbols is None:
+            if not self.prices or not self.stream.connected:
+                await self._fetch(None)
+            symbols = list(self.prices)
+
+        symbols = [s.upper() for s in symbols]
+        result = {s: self.get_cached(s, max_age) for s in symbols}
+        missing = [s for s, price in result.items() if price is None]
+        if missing:
+            if len(missing) == 1:
+                try:
+                    await self._fetch(missing[0])
+                except Exception as e:
+                    logger.warning(f"[PriceCache] Failed to fetch {missing[0]}: {e}")
+            else:
+                await self._fetch(None)
+            for s in missing:
+                entry = self.prices.get(s)
+                result[s] = {"symbol": s, "price": entry[0], "time": entry[1]} if entry else None
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "symbols": len(self.prices),
+            "streamConnected": self.stream.connected,
+            "streamAge": round(time.monotonic() - self.stream_at, 3) if self.stream_at else None,
+            "restRequests": self.rest_requests,
+        }
+
+    async def run(self):
+        await self.stream.set_streams([PRICE_STREAM])
+        await self.stream.run()
+
+
+# Общий кэш процесса API
+price_cache = PriceCache()
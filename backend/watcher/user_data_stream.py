@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+
+import websockets
+
+from binance_client import binance
+from redis_client import async_redis
+
+BINANCE_USER_STREAM_URL = os.getenv("BINANCE_USER_STREAM_URL", "wss://stream.binance.com:9443/ws")
+# listenKey живёт 60 минут без продления
+KEEPALIVE_INTERVAL = 30 * 60
+FILLS_HISTORY = 500
+ORDERS_HISTORY = 1000
+
+# Зеркало в Redis для других процессов
+BALANCES_KEY = "account:balances"
+OPEN_ORDERS_KEY = "account:open-orders"
+FILLS_KEY = "account:fills"
+ACCOUNT_KEY = "account:info"
+
+CLOSED_STATUSES = {"FILLED", "CANCELED", "REJECTED", "EXPIRED", "EXPIRED_IN_MATCH"}
+
+logger = logging.getLogger(__name__)
+
+
+def order_from_report(event: dict) -> dict:
+    """executionReport в формате ордера из /api/v3/openOrders"""
+    return {
+        "symbol": event["s"],
+        "orderId": event["i"],
+        "clientOrderId": event["c"],
+        "price": event["p"],
+        "origQty": event["q"],
+        "executedQty": event["z"],
+        "cummulativeQuoteQty": event["Z"],
+        "status": event["X"],
+        "timeInForce": event["f"],
+        "type": event["o"],
+        "side": event["S"],
+        "stopPrice": event.get("P", "0"),
+        "time": event.get("O", event["T"]),
+        "updateTime": event["T"],
+    }
+
+
+class AccountView:
+    """Открытые ордера, сделки и балансы из стрима пользовательских данных.
+
+    Начальное состояние берётся одним REST-снимком, дальше обновляется
+    событиями executionReport / outboundAccountPosition / balanceUpdate.
+    События, пришедшие до снимка, копятся и применяются после него. Балансовые
+    события с временем не позже updateTime счёта отбрасываются — иначе дельта
+    balanceUpdate учлась бы дважды; executionReport сверяется с ордером из
+    снимка по его собственному updateTime. Чтение — из памяти этого процесса,
+    копия состояния лежит в Redis.
+    """
+
+    def __init__(self, client=binance, redis=async_redis, url: str = BINANCE_USER_STREAM_URL):
+        self.client = client
+        self.redis = redis
+        self.url = url
+        self.account: dict = {}
+        self.balances: dict[str, dict] = {}
+        self.open_orders: dict[int, dict] = {}
+        self.fills: deque = deque(maxlen=FILLS_HISTORY)
+        # Последний статус ордера по clientOrderId — исполнился ли ордер грида
+        self.orders: OrderedDict[str, dict] = OrderedDict()
+        self.synced = False
+        self.updated_at = None
+        # Время, по которое изменения балансов уже учтены в снимке (мс)
+        self.snapshot_time = 0
+
+    # Чтение
+
+    def get_open_orders(self, symbol: str | None = None) -> list[dict]:
+        orders = self.open_orders.values()
+        if symbol:
+            orders = [order for order in orders if order["symbol"] == symbol]
+        return sorted(orders, key=lambda order: order["time"])
+
+    def get_balances(self, non_zero: bool = True) -> list[dict]:
+        return [
+            {"asset": asset, **balance}
+            for asset, balance in sorted(self.balances.items())
+            if not non_zero or float(balance["free"]) > 0 or float(balance["locked"]) > 0
+        ]
+
+    def order_status(self, client_order_id: str) -> dict | None:
+        """Последнее известное состояние ордера, в том числе уже закрытого"""
+        order = self.orders.get(client_order_id)
+        if order is None:
+            order = next((o for o in self.open_orders.values() if o["clientOrderId"] == client_order_id), None)
+        return order
+
+    def _is_stale(self, order: dict) -> bool:
+        """Состояние ордера из события не новее уже известного (например, из снимка)"""
+        current = self.open_orders.get(order["orderId"])
+        if current is None:
+            return False
+        current_time = current.get("updateTime", 0)
+        if order["updateTime"] != current_time:
+            return order["updateTime"] < current_time
+        # В одну миллисекунду: новее, если исполнено больше или ордер закрылся
+        return (float(order["executedQty"]), order["status"] in CLOSED_STATUSES) <= \
+            (float(current["executedQty"]), False)
+
+    # Снимок и события
+
+    async def snapshot(self):
+        account, open_orders = await asyncio.gather(self.client.get_account(), self.client.get_open_orders())
+        self.account = {
+            key: account[key]
+            for key in ("makerCommission", "takerCommission", "canTrade", "canWithdraw", "canDeposit")
+            if key in account
+        }
+        self.balances = {b["asset"]: {"free": b["free"], "locked": b["locked"]} for b in account["balances"]}
+        self.open_orders = {order["orderId"]: order for order in open_orders}
+        self.synced = True
+        self.updated_at = int(time.time() * 1000)
+        # updateTime — время биржи (как и E у событий) последнего изменения счёта,
+        # уже отражённого в балансах снимка; локальные часы здесь не годятся
+        self.snapshot_time = account.get("updateTime", 0)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(ACCOUNT_KEY, json.dumps(self.account))
+        pipe.delete(BALANCES_KEY, OPEN_ORDERS_KEY)
+        if self.balances:
+            pipe.hset(BALANCES_KEY, mapping={a: json.dumps(b) for a, b in self.balances.items()})
+        if self.open_orders:
+            pipe.hset(OPEN_ORDERS_KEY, mapping={str(i): json.dumps(o) for i, o in self.open_orders.items()})
+        await pipe.execute()
+        logger.info(f"[UserData] Snapshot: {len(self.balances)} balances, {len(self.open_orders)} open orders")
+
+    async def handle(self, event: dict):
+        event_type = event.get("e")
+        if event_type == "listenKeyExpired":
+            raise ConnectionError("listenKey expired")
+        if event_type in ("outboundAccountPosition", "balanceUpdate") and event.get("E", 0) <= self.snapshot_time:
+            # Уже учтено в балансах снимка
+            return
+        pipe = self.redis.pipeline(transaction=False)
+
+        if event_type == "executionReport":
+            order = order_from_report(event)
+            order_id = order["orderId"]
+            if not self._is_stale(order):
+                if order["status"] in CLOSED_STATUSES:
+                    self.open_orders.pop(order_id, None)
+                    pipe.hdel(OPEN_ORDERS_KEY, str(order_id))
+                else:
+                    self.open_orders[order_id] = order
+                    pipe.hset(OPEN_ORDERS_KEY, str(order_id), json.dumps(order))
+
+                self.orders[order["clientOrderId"]] = order
+                self.orders.move_to_end(order["clientOrderId"])
+                if len(self.orders) > ORDERS_HISTORY:
+                    self.orders.popitem(last=False)
+
+            if event["x"] == "TRADE":
+                fill = {
+                    "symbol": event["s"],
+                    "orderId": order_id,
+                    "clientOrderId": event["c"],
+                    "tradeId": event["t"],
+                    "side": event["S"],
+                    "price": event["L"],
+                    "qty": event["l"],
+                    "commission": event["n"],
+                    "commissionAsset": event["N"],
+                    "time": event["T"],
+                }
+                self.fills.appendleft(fill)
+                pipe.lpush(FILLS_KEY, json.dumps(fill))
+                pipe.ltrim(FILLS_KEY, 0, FILLS_HISTORY - 1)
+
+        elif event_type == "outboundAccountPosition":
+            # Полные значения изменившихся балансов
+            for balance in event["B"]:
+                self.balances[balance["a"]] = {"free": balance["f"], "locked": balance["l"]}
+                pipe.hset(BALANCES_KEY, balance["a"], json.dumps(self.balances[balance["a"]]))
+
+        elif event_type == "balanceUpdate":
+            # Депозит/вывод: приходит дельта, итог придёт и в outboundAccountPosition
+            balance = self.balances.setdefault(event["a"], {"free": "0", "locked": "0"})
+            balance["free"] = str(float(balance["free"]) + float(event["d"]))
+            pipe.hset(BALANCES_KEY, event["a"], json.dumps(balance))
+
+        else:
+            return
+
+        self.updated_at = event.get("E", int(time.time() * 1000))
+        await pipe.execute()
+
+    # Жизненный цикл listenKey и соединения
+
+    async def _keepalive(self, listen_key: str):
+        while True:
+            await asyncio.sleep(KEEPALIVE_INTERVAL)
+            try:
+                await self.client.keepalive_listen_key(listen_key)
+            except Exception as e:
+                logger.warning(f"[UserData] listenKey keepalive failed: {e}")
+
+    @staticmethod
+    async def _read(ws, queue: asyncio.Queue):
+        """Складывает события в очередь, пока снимок ещё загружается; None — конец стрима"""
+        try:
+            async for message in ws:
+                queue.put_nowait(json.loads(message))
+        finally:
+            queue.put_nowait(None)
+
+    async def run(self):
+        backoff = 1
+        while True:
+            listen_key = None
+            keepalive = None
+            reader = None
+            try:
+                listen_key = await self.client.create_listen_key()
+                async with websockets.connect(f"{self.url}/{listen_key}", ping_interval=20, ping_timeout=20) as ws:
+                    keepalive = asyncio.create_task(self._keepalive(listen_key))
+                    # Читаем стрим сразу, а снимок берём после подключения: события
+                    # до и во время снимка ждут в очереди и не теряются
+                    queue: asyncio.Queue = asyncio.Queue()
+                    reader = asyncio.create_task(self._read(ws, queue))
+                    await self.snapshot()
+                    backoff = 1
+                    logger.info("[UserData] Connected to user data stream")
+
+                    while (event := await queue.get()) is not None:
+                        try:
+                            await self.handle(event)
+                        except ConnectionError:
+                            raise
+                        except Exception as e:
+                            logger.error(f"[UserData] Error handling event: {e}")
+                    # Стрим закрылся: ошибка чтения, если была, уходит в лог переподключения
+                    await reader
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"[UserData] Stream lost: {e}. Reconnecting in {backoff}s")
+            finally:
+                self.synced = False
+                if reader is not None:
+                    reader.cancel()
+                if keepalive is not None:
+                    keepalive.cancel()
+                if listen_key is not None:
+                    try:
+                        await self.client.close_listen_key(listen_key)
+                    except Exception:
+                        pass
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+
+# Общее представление процесса API
+account_view = AccountView()
@@ -1,52 +1,158 @@
 import asyncio
 import json
-import websockets
+import os
 from redis.asyncio import Redis
 import logging
 
-BINANCE_WS_URL = "wss://stream.binance.com:9443/ws/btcusdt@kline_1m"
-REDIS_URL = "redis://redis:6379"
-REDIS_KEY = "candles:BTCUSDT:1m"
+from candle_store import MAX_CANDLES, candle_key, upsert_candles
+from indicators import INDICATORS_WS_CHANNEL, MARKET_CHANNEL, IndicatorEngine, indicator_key, latest_values
+from watcher.binance_stream import BinanceStream
+from watcher.candle_aggregator import MINUTE_CANDLES, CandleAggregator
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
+
+# Набор пар "SYMBOL:interval" для загрузки; меняется на лету через Redis
+KLINE_STREAMS_KEY = "candles:streams"
+KLINE_STREAMS_CHANNEL = "candles:streams:changed"
+DEFAULT_STREAMS = os.getenv("KLINE_STREAMS", "BTCUSDT:1m")
+CONFIG_RELOAD_INTERVAL = 30
+
+FLUSH_INTERVAL = 0.25
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def save_candle_to_redis(redis, candle_data):
-    kline = candle_data['k']
-    candle = {
-        't': kline['t'],
-        'o': kline['o'],
-        'h': kline['h'],
-        'l': kline['l'],
-        'c': kline['c'],
-        'v': kline['v'],
-        'T': kline['T'],
-        'x': kline['x'],
-    }
 
-    key = REDIS_KEY
-    score = kline['t']
+def parse_pair(pair: str) -> tuple[str, str]:
+    symbol, _, interval = pair.partition(":")
+    return symbol.upper(), interval or "1m"
+
+
+class KlineIngestor:
+    """Загрузка свечей по любому набору символов и интервалов через один стрим.
+
+    Обновления свечей копятся в буфере (для каждой свечи — только последнее)
+    и раз в FLUSH_INTERVAL записываются в хранилище свечей одним pipeline
+    с upsert-скриптом на каждый ключ. Из минутных свечей тут же строятся
+    старшие интервалы, которые не загружаются отдельным стримом, и по всем
+    рядам обновляются индикаторы.
+    """
+
+    def __init__(self, redis: Redis, redis_binary: Redis):
+        self.redis = redis
+        self.stream = BinanceStream(self.on_message, name="KlineIngestor")
+        self.aggregator = CandleAggregator(redis_binary)
+        self.indicators = IndicatorEngine(redis_binary)
+        self.pairs: set[tuple[str, str]] = set()
+        self.buffer: dict[tuple[str, str, int], dict] = {}
+
+    async def on_message(self, stream: str, data: dict):
+        if data.get("e") != "kline":
+            return
 
-    key_type = await redis.type(key)
-    if key_type != 'zset' and key_type != 'none':
-        await redis.delete(key)
+        kline = data['k']
+        candle = {
+            't': kline['t'],
+            'o': kline['o'],
+            'h': kline['h'],
+            'l': kline['l'],
+            'c': kline['c'],
+            'v': kline['v'],
+            'T': kline['T'],
+            'x': kline['x'],
+        }
+        self.buffer[(data['s'], kline['i'], kline['t'])] = candle
 
-    await redis.zadd(key, {json.dumps(candle): score})
-    await redis.zremrangebyrank(key, 0, -1001)
+    async def flush(self):
+        if not self.buffer:
+            return
 
-    logger.info(f"Updated candle: {candle['t']} (final: {candle['x']})")
+        buffer, self.buffer = self.buffer, {}
+        try:
+            by_pair: dict[tuple[str, str], dict] = {}
+            for (symbol, interval, open_time), candle in sorted(buffer.items(), key=lambda item: item[0][2]):
+                by_pair.setdefault((symbol, interval), {})[open_time] = candle
+                if interval == "1m":
+                    # Интервалы с собственным стримом не агрегируем
+                    skip = {i for s, i in self.pairs if s == symbol}
+                    for aggregated_interval, aggregated in await self.aggregator.update(symbol, candle, skip):
+                        by_pair.setdefault((symbol, aggregated_interval), {})[aggregated['t']] = aggregated
 
+            pipe = self.redis.pipeline(transaction=False)
+            for (symbol, interval), candles in by_pair.items():
+                candles = list(candles.values())
+                max_candles = MINUTE_CANDLES if interval == "1m" else MAX_CANDLES
+                await upsert_candles(self.redis, candle_key(symbol, interval), candles, client=pipe, max_candles=max_candles)
+
+                try:
+                    values = await self.indicators.update(symbol, interval, candles)
+                except Exception as e:
+                    logger.error(f"Error updating indicators for {symbol} {interval}: {e}")
+                    continue
+                if values is not None:
+                    payload = json.dumps({
+                        "type": "indicator-update",
+                        "symbol": symbol,
+                        "interval": interval,
+                        "data": latest_values(values)
+                    })
+                    pipe.set(indicator_key(symbol, interval), payload)
+                    pipe.publish(MARKET_CHANNEL, f"{INDICATORS_WS_CHANNEL}\n{symbol}:{interval}\n{payload}")
+            await pipe.execute()
+        except BaseException:
+            # Пачку не теряем: вернём в буфер, более новые обновления тех же свечей важнее
+            buffer.update(self.buffer)
+            self.buffer = buffer
+            raise
+
+        logger.debug(f"Flushed {len(buffer)} candle updates for {len(by_pair)} series")
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing candles: {e}")
+
+    async def load_pairs(self) -> set[tuple[str, str]]:
+        members = await self.redis.smembers(KLINE_STREAMS_KEY)
+        if not members:
+            members = [pair for pair in DEFAULT_STREAMS.split(",") if pair.strip()]
+        return {parse_pair(pair.strip()) for pair in members}
+
+    async def apply_config(self):
+        pairs = await self.load_pairs()
+        if pairs != self.pairs:
+            logger.info(f"Kline streams: {sorted(f'{s}:{i}' for s, i in pairs)}")
+        self.pairs = pairs
+        await self.stream.set_streams(f"{symbol.lower()}@kline_{interval}" for symbol, interval in pairs)
+
+    async def config_loop(self):
+        """Перечитывает конфигурацию по уведомлению и периодически"""
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(KLINE_STREAMS_CHANNEL)
+        while True:
+            try:
+                await self.apply_config()
+            except Exception as e:
+                logger.error(f"Error applying kline config: {e}")
+            try:
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=CONFIG_RELOAD_INTERVAL)
+            except Exception as e:
+                logger.error(f"Config channel error: {e}")
+                await asyncio.sleep(5)
+
+    async def run(self):
+        await self.apply_config()
+        await asyncio.gather(self.stream.run(), self.flush_loop(), self.config_loop())
 
 
 async def listen_to_binance():
     redis = Redis.from_url(REDIS_URL, decode_responses=True)
-    async with websockets.connect(BINANCE_WS_URL) as ws:
-        logger.info("Connected to Binance WebSocket")
-
-        async for message in ws:
-            data = json.loads(message)
-            if data.get("e") == "kline":
-                await save_candle_to_redis(redis, data)
+    # Чтение бинарных свечей (восстановление агрегатов) — без декодирования
+    redis_binary = Redis.from_url(REDIS_URL)
+    await KlineIngestor(redis, redis_binary).run()
 
 if __name__ == "__main__":
     asyncio.run(listen_to_binance())
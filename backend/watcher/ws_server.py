@@ -2,12 +2,27 @@
 import asyncio
 import json
 import logging
-from typing import List
+import os
+import socket
+import time
+import zlib
+from collections import deque
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from redis.asyncio import Redis
+from redis.exceptions import ResponseError
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 # Настройка логирования
 logging.basicConfig(
@@ -18,124 +33,486 @@ logger = logging.getLogger(__name__)
 
 # Глобальные переменные для управления задачами
 redis_task = None
+broadcast_task = None
+heartbeat_task = None
 redis_client = None
 
+# Несколько процессов-воркеров на одном порту: у каждого свой индекс подключений
+# и своя подписка на Redis, общая статистика собирается через ws:workers
+WS_WORKERS = int(os.getenv("WS_WORKERS", 1))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+WORKERS_KEY = "ws:workers"
+BROADCAST_CHANNEL = "ws:broadcast"
+# Рыночные данные (индикаторы и т.п.): "канал\nSYMBOL:interval\npayload",
+# получают только клиенты, подписанные на этот канал
+MARKET_CHANNEL = "ws:market"
+HEARTBEAT_INTERVAL = 5
+WORKER_TTL = 15
+
+# Стрим событий (тот же, что redis_client.EVENTS_STREAM в API). Каждый воркер
+# читает его целиком простым XREAD от последнего доставленного ID — без consumer
+# group: пропущенное при перезапуске клиенты дочитывают через last_event_id
+EVENTS_STREAM = "events:stream"
+EVENTS_MAXLEN = 10000
+# Больше событий не досылаем — клиенту проще перезагрузить состояние
+MAX_REPLAY = 1000
+# События стрима новому клиенту придерживаются до его первой подписки (в ней
+# может прийти last_event_id), но не дольше HOLD_TIMEOUT секунд
+HOLD_TIMEOUT = 2.0
+
+
+# Сколько ждём отправку одному клиенту, прежде чем считать его отвалившимся
+SEND_TIMEOUT = 5.0
+# Размер исходящей очереди клиента; сверх него сообщения отбрасываются
+MAX_QUEUE_SIZE = 1000
+# Клиент с очередью длиннее LAG_THRESHOLD дольше LAG_GRACE секунд отключается
+LAG_THRESHOLD = 200
+LAG_GRACE = 10.0
+SLOW_CONSUMER_CLOSE_CODE = 4008
+
+# Частые сообщения, для которых клиенту важно только последнее значение по символу
+CONFLATE_TYPES = {"price-update", "candle-update"}
+
+# Кодировки, которые клиент может выбрать (?encoding=... или в subscribe).
+# json — по умолчанию и без изменений формата; json-compact и msgpack
+# передают события массивами по схеме из сообщения schema.
+ENCODING_JSON = "json"
+ENCODING_COMPACT_JSON = "json-compact"
+ENCODING_MSGPACK = "msgpack"
+
+# Сжатие только крупных сообщений (снимки грида с уровнями и т.п.): клиент
+# включает его через ?compress=1 или 'compress' в subscribe, и сообщения от
+# COMPRESS_THRESHOLD байт приходят бинарным кадром zlib (первый байт 0x78 —
+# не пересекается с msgpack-сообщениями), мелкие — как обычно, без затрат на
+# сжатие. Транспортный permessage-deflate выключен: он сжимает все кадры подряд.
+COMPRESS_THRESHOLD = int(os.getenv("WS_COMPRESS_THRESHOLD", 1024))
+COMPRESS_LEVEL = 6
+
+
+def _dumps_json(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj)
+
+
+ENCODERS = {
+    ENCODING_JSON: _dumps_json,
+    ENCODING_COMPACT_JSON: _dumps_json,
+}
+if msgpack is not None:
+    ENCODERS[ENCODING_MSGPACK] = lambda obj: msgpack.packb(obj, use_bin_type=True)
+
+
+def negotiate_encoding(requested: str | None) -> str:
+    return requested if requested in ENCODERS else ENCODING_JSON
+
+
+class Outbound:
+    """Исходящее сообщение, которое кодируется не более одного раза на кодировку.
+
+    data — полный словарь (JSON по умолчанию), compact — компактное представление
+    события для json-compact/msgpack. Сообщение из готового текста декодируется
+    только если его запросит клиент с другой кодировкой.
+    """
+
+    __slots__ = ("data", "compact", "_cache")
+
+    def __init__(self, data=None, compact=None):
+        self.data = data
+        self.compact = compact
+        self._cache = {}
+
+    @classmethod
+    def from_text(cls, text: str) -> "Outbound":
+        message = cls()
+        message._cache[ENCODING_JSON] = text
+        return message
+
+    def encode(self, encoding: str, compress: bool = False):
+        if compress:
+            packed = self._cache.get((encoding, "zlib"))
+            if packed is None:
+                payload = self.encode(encoding)
+                raw = payload.encode() if isinstance(payload, str) else payload
+                packed = zlib.compress(raw, COMPRESS_LEVEL) if len(raw) >= COMPRESS_THRESHOLD else payload
+                self._cache[(encoding, "zlib")] = packed
+            return packed
+
+        payload = self._cache.get(encoding)
+        if payload is not None:
+            return payload
+
+        if self.data is None:
+            try:
+                self.data = json.loads(self._cache[ENCODING_JSON])
+            except ValueError:
+                return self._cache[ENCODING_JSON]
+
+        body = self.compact if encoding != ENCODING_JSON and self.compact is not None else self.data
+        payload = self._cache[encoding] = ENCODERS[encoding](body)
+        return payload
+
+
+class ClientState:
+    """Состояние одного подключения: компактно, без лишних dict на клиента.
+
+    queue — исходящие сообщения [key, payload]; pending — ещё не отправленные
+    сообщения с ключом конфляции (тип, символ), чтобы заменить их новым значением.
+    """
+
+    __slots__ = (
+        "websocket", "connection_id", "channels", "symbols", "encoding", "compress",
+        "queue", "pending", "wakeup", "writer", "lag_since", "sent", "dropped", "conflated",
+        "last_event", "holding", "held", "hold_timer"
+    )
+
+    def __init__(self, websocket: WebSocket, connection_id: int):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.channels: set[str] = set()
+        self.symbols: set[str] = set()
+        self.encoding = ENCODING_JSON
+        self.compress = False
+        self.queue: deque = deque()
+        self.pending: dict = {}
+        self.wakeup = asyncio.Event()
+        self.writer: asyncio.Task | None = None
+        self.lag_since: float | None = None
+        self.sent = 0
+        self.dropped = 0
+        self.conflated = 0
+        # ID последнего события стрима, поставленного клиенту; события стрима
+        # уходят клиенту строго по возрастанию ID
+        self.last_event: tuple[int, int] | None = None
+        # Пока идёт досылка пропущенного, живые события стрима ждут в held
+        self.holding = True
+        self.held: list = []
+        self.hold_timer: asyncio.TimerHandle | None = None
+
+    def to_dict(self) -> dict:
+        return {"channels": sorted(self.channels), "symbols": sorted(self.symbols)}
+
 
 class ConnectionManager:
+    """Подключения и индекс подписок: символ/канал → множество подключений.
+
+    Клиенты без подписки на символы лежат в unfiltered и получают все события,
+    подписанные на символы — только события своих символов. Получатели события
+    находятся по индексу, без проверки каждого подключения.
+    """
+
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.clients: dict[WebSocket, ClientState] = {}
         self.connection_count = 0
-        self.subscriptions = {}  # {websocket: {"channels": [], "symbols": []}}
+        self.unfiltered: set[WebSocket] = set()
+        self.by_symbol: dict[str, set[WebSocket]] = {}
+        self.by_channel: dict[str, set[WebSocket]] = {}
+        self.dropped = 0
+        self.conflated = 0
+        self.evicted = 0
+
+    @property
+    def active_connections(self):
+        return self.clients.keys()
 
     async def connect(self, websocket: WebSocket):
         try:
             await websocket.accept()
-            self.active_connections.append(websocket)
             self.connection_count += 1
-            self.subscriptions[websocket] = {"channels": [], "symbols": []}
-            logger.info(f"Client connected. Total connections: {len(self.active_connections)}")
+            client = ClientState(websocket, self.connection_count)
+            client.encoding = negotiate_encoding(websocket.query_params.get("encoding"))
+            client.compress = websocket.query_params.get("compress", "").lower() in ("1", "true")
+            self.clients[websocket] = client
+            self.unfiltered.add(websocket)
+            logger.info(f"Client connected. Total connections: {len(self.clients)}")
 
             # Отправляем приветственное сообщение
-            await websocket.send_text(json.dumps({
+            await self._send_now(client, {
                 "type": "welcome",
                 "message": "Connected to WebSocket server",
-                "connection_id": self.connection_count
-            }))
+                "connection_id": self.connection_count,
+                "encoding": client.encoding,
+                "encodings": list(ENCODERS),
+                "compress": client.compress,
+                "compress_threshold": COMPRESS_THRESHOLD
+            })
+            if client.encoding != ENCODING_JSON:
+                await self._send_now(client, schema_message(client.encoding))
+            client.writer = asyncio.create_task(self._writer(client))
+            client.hold_timer = asyncio.get_running_loop().call_later(HOLD_TIMEOUT, self.release_held, client)
         except Exception as e:
             logger.error(f"Error accepting connection: {e}")
             raise
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-            if websocket in self.subscriptions:
-                del self.subscriptions[websocket]
-            logger.info(f"Client disconnected. Total connections: {len(self.active_connections)}")
+        client = self.clients.pop(websocket, None)
+        if client is None:
+            return
+
+        if client.writer is not None and client.writer is not asyncio.current_task():
+            client.writer.cancel()
+        if client.hold_timer is not None:
+            client.hold_timer.cancel()
+        self.unfiltered.discard(websocket)
+        for symbol in client.symbols:
+            self._discard(self.by_symbol, symbol, websocket)
+        for channel in client.channels:
+            self._discard(self.by_channel, channel, websocket)
+        logger.info(f"Client disconnected. Total connections: {len(self.clients)}")
+
+    @staticmethod
+    def _discard(index: dict, key: str, websocket: WebSocket):
+        connections = index.get(key)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                del index[key]
 
     def add_subscription(self, websocket: WebSocket, channel: str, symbols: list = None):
         """Добавить подписку клиента на канал и символы"""
-        if websocket in self.subscriptions:
-            if channel not in self.subscriptions[websocket]["channels"]:
-                self.subscriptions[websocket]["channels"].append(channel)
-
-            if symbols:
-                for symbol in symbols:
-                    if symbol not in self.subscriptions[websocket]["symbols"]:
-                        self.subscriptions[websocket]["symbols"].append(symbol.upper())
-
-            logger.info(f"Client subscribed to {channel}, symbols: {symbols}")
-
-    def remove_subscription(self, websocket: WebSocket, channel: str):
-        """Удалить подписку клиента"""
-        if websocket in self.subscriptions and channel in self.subscriptions[websocket]["channels"]:
-            self.subscriptions[websocket]["channels"].remove(channel)
-            logger.info(f"Client unsubscribed from {channel}")
-
-    def should_send_to_client(self, websocket: WebSocket, event_data: dict) -> bool:
-        """Проверить, должен ли клиент получать это событие"""
-        if websocket not in self.subscriptions:
-            return True  # Отправляем всем, если нет подписок
+        client = self.clients.get(websocket)
+        if client is None:
+            return
 
-        client_subs = self.subscriptions[websocket]
-        event_symbol = event_data.get("symbol", "").upper()
-        event_type = event_data.get("type", "")
+        if channel not in client.channels:
+            client.channels.add(channel)
+            self.by_channel.setdefault(channel, set()).add(websocket)
 
-        # Если у клиента нет подписок, отправляем все grid события
-        if not client_subs["channels"] and not client_subs["symbols"]:
-            return True
+        for symbol in symbols or []:
+            symbol = symbol.upper()
+            if symbol not in client.symbols:
+                client.symbols.add(symbol)
+                self.by_symbol.setdefault(symbol, set()).add(websocket)
 
-        # Если клиент подписан на символы, проверяем символ события
-        if client_subs["symbols"] and event_symbol:
-            return event_symbol in client_subs["symbols"]
+        if client.symbols:
+            self.unfiltered.discard(websocket)
 
-        # Если клиент подписан на каналы grid-trade, отправляем все grid события
-        if "grid-trade" in client_subs["channels"]:
-            return True
+        logger.info(f"Client subscribed to {channel}, symbols: {symbols}")
 
-        # Для остальных каналов тоже отправляем (пока не реализована детальная логика)
-        if client_subs["channels"]:
-            return True
+    def remove_subscription(self, websocket: WebSocket, channel: str, symbols: list = None):
+        """Удалить подписку клиента"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return
 
-        return True  # По умолчанию отправляем
+        if channel in client.channels:
+            client.channels.discard(channel)
+            self._discard(self.by_channel, channel, websocket)
+            logger.info(f"Client unsubscribed from {channel}")
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
+        for symbol in symbols or []:
+            symbol = symbol.upper()
+            if symbol in client.symbols:
+                client.symbols.discard(symbol)
+                self._discard(self.by_symbol, symbol, websocket)
+
+        if not client.symbols:
+            self.unfiltered.add(websocket)
+
+    def recipients(self, symbol: str = ""):
+        """Подключения, которые должны получить событие по символу"""
+        if not symbol:
+            return list(self.clients)
+        subscribed = self.by_symbol.get(symbol.upper())
+        if not subscribed:
+            return list(self.unfiltered)
+        return [*self.unfiltered, *subscribed]
+
+    @staticmethod
+    async def _send_now(client: ClientState, data: dict):
+        payload = Outbound(data).encode(client.encoding, client.compress)
+        if isinstance(payload, bytes):
+            await client.websocket.send_bytes(payload)
+        else:
+            await client.websocket.send_text(payload)
+
+    def set_encoding(self, websocket: WebSocket, requested: str) -> str:
+        """Сменить кодировку клиента; для компактных кодировок досылаем схему"""
+        client = self.clients.get(websocket)
+        if client is None:
+            return ENCODING_JSON
+        encoding = negotiate_encoding(requested)
+        if encoding != client.encoding:
+            client.encoding = encoding
+            if encoding != ENCODING_JSON:
+                self.enqueue(client, Outbound(schema_message(encoding)))
+        return encoding
+
+    def set_compress(self, websocket: WebSocket, enabled: bool) -> bool:
+        client = self.clients.get(websocket)
+        if client is None:
+            return False
+        client.compress = enabled
+        return enabled
+
+    def enqueue(self, client: ClientState, message: Outbound, key=None):
+        """Поставить сообщение в очередь клиента, не дожидаясь отправки"""
+        if key is not None:
+            entry = client.pending.get(key)
+            if entry is not None:
+                # Клиент ещё не получил предыдущее значение — заменяем его последним
+                entry[1] = message
+                client.conflated += 1
+                self.conflated += 1
+                return
+
+        depth = len(client.queue)
+        if depth >= MAX_QUEUE_SIZE:
+            client.dropped += 1
+            self.dropped += 1
+        else:
+            entry = [key, message]
+            client.queue.append(entry)
+            if key is not None:
+                client.pending[key] = entry
+            client.wakeup.set()
+
+        if depth < LAG_THRESHOLD:
+            client.lag_since = None
+        elif client.lag_since is None:
+            client.lag_since = time.monotonic()
+        elif time.monotonic() - client.lag_since > LAG_GRACE:
+            asyncio.create_task(self.evict(client, "slow consumer"))
+
+    async def _writer(self, client: ClientState):
+        """Единственная задача, которая пишет в сокет клиента"""
+        websocket = client.websocket
         try:
-            await websocket.send_text(message)
+            while True:
+                if not client.queue:
+                    client.wakeup.clear()
+                    client.lag_since = None
+                    await client.wakeup.wait()
+                    continue
+
+                key, _ = entry = client.queue.popleft()
+                if key is not None:
+                    client.pending.pop(key, None)
+
+                payload = entry[1].encode(client.encoding, client.compress)
+                if isinstance(payload, bytes):
+                    send = websocket.send_bytes(payload)
+                else:
+                    send = websocket.send_text(payload)
+                await asyncio.wait_for(send, timeout=SEND_TIMEOUT)
+                client.sent += 1
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"Error sending personal message: {e}")
+            logger.warning(f"Error sending to connection {client.connection_id}: {e}")
             self.disconnect(websocket)
 
-    async def broadcast(self, message: str):
-        if not self.active_connections:
-            logger.debug("No active connections to broadcast to")
+    async def evict(self, client: ClientState, reason: str):
+        """Отключить клиента, который не успевает читать сообщения"""
+        if client.websocket not in self.clients:
             return
-
+        self.evicted += 1
+        logger.warning(
+            f"Evicting connection {client.connection_id}: {reason}, "
+            f"queue={len(client.queue)}, dropped={client.dropped}"
+        )
+        self.disconnect(client.websocket)
         try:
-            event_data = json.loads(message)
-        except json.JSONDecodeError:
-            event_data = {"type": "unknown", "symbol": ""}
-
-        logger.info(f"Broadcasting {event_data.get('type', 'unknown')} event to clients")
-        disconnected = []
-        sent_count = 0
-
-        for connection in self.active_connections.copy():
-            try:
-                # Проверяем, нужно ли отправлять событие этому клиенту
-                if self.should_send_to_client(connection, event_data):
-                    await connection.send_text(message)
-                    sent_count += 1
-                else:
-                    logger.debug(f"Skipping client - not subscribed to {event_data.get('symbol', 'N/A')}")
-            except Exception as e:
-                logger.warning(f"Error broadcasting to connection: {e}")
-                disconnected.append(connection)
-
-        logger.info(f"Message sent to {sent_count}/{len(self.active_connections)} clients")
+            await client.websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason=reason)
+        except Exception:
+            pass
+
+    async def send_personal_message(self, message: dict | str, websocket: WebSocket):
+        client = self.clients.get(websocket)
+        if client is not None:
+            if isinstance(message, str):
+                self.enqueue(client, Outbound.from_text(message))
+            else:
+                self.enqueue(client, Outbound(message))
+
+    async def broadcast(self, message: Outbound | str, symbol: str = "", event_type: str = "unknown",
+                        event_id: str | None = None):
+        """Разослать сообщение подписанным клиентам.
+
+        Сообщение кодируется не более одного раза на кодировку и кладётся
+        в очереди клиентов; в сокеты пишут их writer-задачи, так что медленный
+        клиент не задерживает остальных. События стрима (event_id) идут клиенту
+        по возрастанию ID: во время досылки они придерживаются, а уже
+        досланные через replay_events повторно не отправляются.
+        """
+        if isinstance(message, str):
+            message = Outbound.from_text(message)
+
+        targets = self.recipients(symbol)
+        if not targets:
+            logger.debug("No active connections to broadcast to")
+            return
 
-        # Удаляем отключенные соединения
-        for conn in disconnected:
-            self.disconnect(conn)
+        key = (event_type, symbol) if event_type in CONFLATE_TYPES else None
+        stream_id = _stream_id(event_id) if event_id else None
+        clients = self.clients
+        for websocket in targets:
+            client = clients.get(websocket)
+            if client is None:
+                continue
+            if stream_id is not None:
+                if client.holding:
+                    # Идёт досылка — отправим после неё, чтобы не нарушить порядок
+                    if len(client.held) < MAX_QUEUE_SIZE:
+                        client.held.append((stream_id, message, key))
+                    else:
+                        client.dropped += 1
+                        self.dropped += 1
+                    continue
+                if client.last_event is not None and client.last_event >= stream_id:
+                    continue
+                client.last_event = stream_id
+            self.enqueue(client, message, key)
+
+        logger.debug(f"{event_type} queued for {len(targets)}/{len(clients)} clients")
+
+    def publish_channel(self, channel: str, message: Outbound | str, symbol: str = "", key=None):
+        """Разослать сообщение только подписчикам канала (с учётом фильтра по символам).
+
+        Сообщения с одним key конфлируются: медленный клиент получит последнее значение.
+        """
+        subscribers = self.by_channel.get(channel)
+        if not subscribers:
+            return
+        if isinstance(message, str):
+            message = Outbound.from_text(message)
+
+        symbol = symbol.upper()
+        for websocket in subscribers:
+            client = self.clients.get(websocket)
+            if client is not None and (not client.symbols or symbol in client.symbols):
+                self.enqueue(client, message, key)
+
+    def hold(self, client: ClientState):
+        """Придержать живые события стрима на время досылки"""
+        if client.hold_timer is not None:
+            client.hold_timer.cancel()
+            client.hold_timer = None
+        client.holding = True
+
+    def release_held(self, client: ClientState):
+        """Отправить придержанные события, которых клиент ещё не получил, по порядку"""
+        if client.hold_timer is not None:
+            client.hold_timer.cancel()
+            client.hold_timer = None
+        held, client.held = client.held, []
+        client.holding = False
+        for stream_id, message, key in held:
+            if client.last_event is not None and stream_id <= client.last_event:
+                continue
+            client.last_event = stream_id
+            self.enqueue(client, message, key)
+
+    def queue_stats(self) -> dict:
+        depths = [len(client.queue) for client in self.clients.values()]
+        return {
+            "total_depth": sum(depths),
+            "max_depth": max(depths, default=0),
+            "lagging_clients": sum(1 for depth in depths if depth >= LAG_THRESHOLD),
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "evicted": self.evicted
+        }
 
 
 manager = ConnectionManager()
@@ -164,133 +541,392 @@ async def init_redis():
         return None
 
 
-async def redis_listener():
-    """Слушает Redis и рассылает сообщения всем подключенным клиентам"""
-    global redis_client
+async def broadcast_event(event_data: dict, event_id: str | None = None):
+    """Отформатировать событие и разослать его подписанным клиентам"""
+    await manager.broadcast(
+        encode_event(event_data, event_id),
+        symbol=event_data.get("symbol", ""),
+        event_type=event_data.get("type", "unknown"),
+        event_id=event_id
+    )
 
+
+async def events_consumer():
+    """Читает стрим событий и рассылает клиентам этого воркера.
+
+    Простой XREAD от последнего доставленного ID: все воркеры получают все
+    события, а в Redis не остаётся состояния, которое надо убирать за упавшими
+    воркерами. При ошибке чтение продолжается с того же ID, без пропусков.
+    """
     if not redis_client:
-        logger.info("Redis not available, skipping Redis listener")
+        logger.info("Redis not available, skipping events consumer")
         return
 
-    try:
-        pubsub = redis_client.pubsub()
-        # Подписываемся на канал events (тот же что использует ваш API)
-        await pubsub.subscribe("events")
-        logger.info("Redis listener started, subscribed to 'events' channel")
+    await drop_legacy_groups()
 
-        async for message in pubsub.listen():
-            if message['type'] == 'message':
-                try:
-                    # Парсим событие из Redis
-                    event_data = json.loads(message['data'])
-                    event_type = event_data.get('type', 'unknown')
+    last_id = None
+    while True:
+        try:
+            if last_id is None:
+                # Старт — с текущего конца стрима; более ранние события клиенты дочитают сами
+                latest = await redis_client.xrevrange(EVENTS_STREAM, count=1)
+                last_id = latest[0][0] if latest else "0-0"
+                logger.info(f"Events consumer started: stream '{EVENTS_STREAM}' after {last_id}")
 
-                    logger.info(f"Received Redis event: {event_type} for {event_data.get('symbol', 'N/A')}")
+            response = await redis_client.xread({EVENTS_STREAM: last_id}, count=100, block=5000)
+            entries = response[0][1] if response else []
 
-                    # Обрабатываем разные типы событий
-                    formatted_event = await format_event_for_clients(event_data)
+            for event_id, fields in entries:
+                last_id = event_id
+                try:
+                    event_data = json.loads(fields["event"])
+                    logger.debug(f"Received event {event_id}: {event_data.get('type')} for {event_data.get('symbol', 'N/A')}")
+                    await broadcast_event(event_data, event_id)
+                except Exception as e:
+                    logger.error(f"Error processing event {event_id}: {e}")
 
-                    if formatted_event:
-                        await manager.broadcast(json.dumps(formatted_event))
-                    else:
-                        logger.warning(f"Event {event_type} was not formatted for clients")
+        except asyncio.CancelledError:
+            logger.info("Events consumer cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Events consumer error: {e}")
+            # Ждем перед повторной попыткой
+            await asyncio.sleep(5)
 
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing Redis message: {e}")
-                    # Отправляем как есть, если не можем распарсить
-                    await manager.broadcast(message['data'])
-                except Exception as e:
-                    logger.error(f"Error processing Redis event: {e}")
 
-    except asyncio.CancelledError:
-        logger.info("Redis listener cancelled")
-        raise
+async def drop_legacy_groups():
+    """Удалить consumer group'ы ws:{host}:{pid}, оставшиеся от прежней схемы чтения"""
+    try:
+        groups = await redis_client.xinfo_groups(EVENTS_STREAM)
+    except ResponseError:
+        # Стрима ещё нет
+        return
     except Exception as e:
-        logger.error(f"Redis listener error: {e}")
-        # Ждем перед повторной попыткой
-        await asyncio.sleep(5)
+        logger.warning(f"Error listing event stream groups: {e}")
+        return
+
+    for group in groups:
+        name = group["name"]
+        if name.startswith("ws:"):
+            try:
+                await redis_client.xgroup_destroy(EVENTS_STREAM, name)
+                logger.info(f"Dropped legacy consumer group {name}")
+            except Exception as e:
+                logger.warning(f"Error dropping consumer group {name}: {e}")
+
+
+async def broadcast_listener():
+    """Слушает готовые сообщения для клиентов всех воркеров и рыночные данные"""
+    if not redis_client:
+        return
+
+    while True:
+        try:
+            pubsub = redis_client.pubsub()
+            await pubsub.subscribe(BROADCAST_CHANNEL, MARKET_CHANNEL)
+            logger.info(f"Broadcast listener subscribed to '{BROADCAST_CHANNEL}', '{MARKET_CHANNEL}'")
+
+            async for message in pubsub.listen():
+                if message['type'] != 'message':
+                    continue
+                if message['channel'] == MARKET_CHANNEL:
+                    channel, _, rest = message['data'].partition("\n")
+                    series, _, payload = rest.partition("\n")
+                    manager.publish_channel(channel, payload, series.partition(":")[0], key=(channel, series))
+                else:
+                    event_type, _, payload = message['data'].partition("\n")
+                    await manager.broadcast(payload, event_type=event_type)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Broadcast listener error: {e}")
+            await asyncio.sleep(5)
+
+
+async def replay_events(websocket: WebSocket, last_event_id: str) -> dict:
+    """Досылает клиенту события после last_event_id с учётом его подписок.
+
+    На время досылки живые события стрима для клиента придерживаются и
+    отправляются после неё, только новее последнего досланного, — клиент
+    получает события строго по порядку ID.
+    """
+    client = manager.clients.get(websocket)
+    if not redis_client or client is None:
+        return {"replayed": 0, "resync_required": True}
+
+    try:
+        requested = _stream_id(last_event_id)
+    except ValueError:
+        return {"replayed": 0, "resync_required": True}
+
+    manager.hold(client)
+    try:
+        try:
+            first = await redis_client.xrange(EVENTS_STREAM, count=1)
+            entries = await redis_client.xrange(EVENTS_STREAM, min=f"({last_event_id}", count=MAX_REPLAY + 1)
+        except Exception as e:
+            logger.warning(f"Error replaying events from {last_event_id}: {e}")
+            return {"replayed": 0, "resync_required": True}
+
+        # Стрим обрезан дальше позиции клиента или пропущено больше, чем досылаем
+        resync_required = bool(first) and _stream_id(first[0][0]) > requested
+        if len(entries) > MAX_REPLAY:
+            entries = entries[:MAX_REPLAY]
+            resync_required = True
+
+        replayed = 0
+        for event_id, fields in entries:
+            stream_id = _stream_id(event_id)
+            if client.last_event is not None and stream_id <= client.last_event:
+                # Клиент уже получил более новые события: дослать это — нарушить порядок
+                if stream_id > requested:
+                    resync_required = True
+                continue
+            client.last_event = stream_id
+            event_data = json.loads(fields["event"])
+            symbol = event_data.get("symbol", "").upper()
+            if client.symbols and symbol and symbol not in client.symbols:
+                continue
+            manager.enqueue(client, encode_event(event_data, event_id))
+            replayed += 1
+
+        return {"replayed": replayed, "resync_required": resync_required}
+    finally:
+        manager.release_held(client)
+
+
+def _stream_id(event_id: str) -> tuple[int, int]:
+    ms, _, seq = event_id.partition("-")
+    return int(ms), int(seq or 0)
+
+
+class EventEncoder:
+    """Предкомпилированный формат одного типа события.
+
+    fields — поля события в фиксированном порядке, values(data) возвращает их
+    значения. В JSON событие уходит словарём, в компактных кодировках — массивом
+    [code, symbol, timestamp, server_time, event_id, *values] по схеме,
+    которую клиент получает в сообщении schema.
+    """
+
+    __slots__ = ("event_type", "code", "fields", "values", "message", "compact")
+
+    def __init__(self, event_type: str, code, fields: tuple, values, message, compact: dict = None):
+        self.event_type = event_type
+        self.code = code
+        self.fields = fields
+        self.values = values
+        self.message = message
+        # Поля, которые в компактном виде передаются свёрнутыми (например, уровни грида)
+        self.compact = tuple((compact or {}).get(field) for field in fields)
+
+    def compact_values(self, values: tuple) -> list:
+        return [fn(value) if fn else value for fn, value in zip(self.compact, values)]
+
 
+EVENT_ENCODERS: dict[str, EventEncoder] = {}
+COMPACT_HEADER = ["code", "symbol", "timestamp", "server_time", "event_id"]
+LEVEL_FIELDS = ["buy_price", "buy_quantity", "sell_price", "sell_quantity", "triggered", "status"]
 
-async def format_event_for_clients(event_data: dict) -> dict:
-    """Форматирует события для отправки клиентам"""
+
+def register_event(event_type: str, fields: tuple, values, message, compact: dict = None):
+    EVENT_ENCODERS[event_type] = EventEncoder(
+        event_type, len(EVENT_ENCODERS) + 1, fields, values, message, compact
+    )
+
+
+def _compact_levels(levels) -> list:
+    """Уровни грида массивами по LEVEL_FIELDS вместо вложенных словарей"""
+    if not levels:
+        return []
+    return [
+        [
+            level.get("buy", {}).get("price"),
+            level.get("buy", {}).get("quantity"),
+            level.get("sell", {}).get("price"),
+            level.get("sell", {}).get("quantity"),
+            level.get("triggered", False),
+            level.get("status", "")
+        ]
+        for level in levels
+    ]
+
+
+register_event(
+    "grid-started",
+    ("status", "levels_count", "monitoring"),
+    lambda data: ("active", data.get('levels_count', 0), data.get('monitoring', True)),
+    lambda symbol, data: f"Grid trading started for {symbol}"
+)
+register_event(
+    "grid-stopped",
+    ("status", "monitoring"),
+    lambda data: ("inactive", data.get('monitoring', False)),
+    lambda symbol, data: f"Grid trading stopped for {symbol}"
+)
+register_event(
+    "grid-settings-updated",
+    ("levels_count", "levels"),
+    lambda data: (data.get('levels_count', 0), data.get('levels', [])),
+    lambda symbol, data: f"Grid settings updated for {symbol}",
+    compact={"levels": _compact_levels}
+)
+register_event(
+    "grid-level-triggered",
+    ("level_index", "side", "trigger_status"),
+    lambda data: (data.get('level_index'), data.get('side'), data.get('status', 'triggered')),
+    lambda symbol, data: f"Grid level triggered for {symbol}"
+)
+register_event(
+    "grid-default-created",
+    ("levels",),
+    lambda data: (data.get('levels', []),),
+    lambda symbol, data: f"Default grid created for {symbol}",
+    compact={"levels": _compact_levels}
+)
+register_event(
+    "grid-status-requested",
+    ("is_active", "has_live_grid", "grid_data"),
+    lambda data: (data.get('is_active', False), data.get('has_live_grid', False), data.get('grid_data')),
+    lambda symbol, data: f"Grid status for {symbol}"
+)
+register_event(
+    "test-event",
+    ("test",),
+    lambda data: (True,),
+    lambda symbol, data: data.get('message', 'Test event')
+)
+
+# Для неизвестных событий отправляем данные как есть; code в компактном виде — имя типа
+UNKNOWN_FIELDS = ("raw_data",)
+
+
+def encode_event(event_data: dict, event_id: str | None = None) -> "Outbound":
+    """Форматирует событие для отправки клиентам во всех кодировках"""
     event_type = event_data.get('type', 'unknown')
     symbol = event_data.get('symbol', '')
     timestamp = event_data.get('timestamp', '')
-    data = event_data.get('data', {})
+    data = event_data.get('data') or {}
+    server_time = asyncio.get_event_loop().time()
+
+    encoder = EVENT_ENCODERS.get(event_type)
+    if encoder is not None:
+        fields = encoder.fields
+        values = encoder.values(data)
+        message = encoder.message(symbol, data)
+        compact = [encoder.code, symbol, timestamp, server_time, event_id, *encoder.compact_values(values)]
+    else:
+        fields = UNKNOWN_FIELDS
+        values = (data,)
+        message = f"Unknown event: {event_type}"
+        compact = [event_type, symbol, timestamp, server_time, event_id, data]
 
     # Базовый формат для всех событий
     formatted = {
         "type": event_type,
         "symbol": symbol,
         "timestamp": timestamp,
-        "server_time": asyncio.get_event_loop().time()
+        "server_time": server_time,
+        "message": message
     }
+    formatted.update(zip(fields, values))
+    if event_id:
+        formatted["event_id"] = event_id
 
-    # Специальное форматирование для разных типов событий
-    if event_type == 'grid-started':
-        formatted.update({
-            "message": f"Grid trading started for {symbol}",
-            "status": "active",
-            "levels_count": data.get('levels_count', 0),
-            "monitoring": data.get('monitoring', True)
-        })
+    return Outbound(formatted, compact)
 
-    elif event_type == 'grid-stopped':
-        formatted.update({
-            "message": f"Grid trading stopped for {symbol}",
-            "status": "inactive",
-            "monitoring": data.get('monitoring', False)
-        })
 
-    elif event_type == 'grid-settings-updated':
-        formatted.update({
-            "message": f"Grid settings updated for {symbol}",
-            "levels_count": data.get('levels_count', 0),
-            "levels": data.get('levels', [])
-        })
+def schema_message(encoding: str) -> dict:
+    """Схема компактных событий, отправляется клиенту при выборе кодировки"""
+    return {
+        "type": "schema",
+        "encoding": encoding,
+        "header": COMPACT_HEADER,
+        "events": {
+            str(encoder.code): {"type": encoder.event_type, "fields": list(encoder.fields)}
+            for encoder in EVENT_ENCODERS.values()
+        },
+        "unknown_fields": list(UNKNOWN_FIELDS),
+        "level_fields": LEVEL_FIELDS
+    }
 
-    elif event_type == 'grid-level-triggered':
-        formatted.update({
-            "message": f"Grid level triggered for {symbol}",
-            "level_index": data.get('level_index'),
-            "side": data.get('side'),
-            "trigger_status": data.get('status', 'triggered')
-        })
 
-    elif event_type == 'grid-default-created':
-        formatted.update({
-            "message": f"Default grid created for {symbol}",
-            "levels": data.get('levels', [])
-        })
+async def publish_broadcast(payload: str, event_type: str):
+    """Разослать сообщение клиентам всех воркеров (или только своим без Redis)"""
+    if redis_client:
+        try:
+            await redis_client.publish(BROADCAST_CHANNEL, f"{event_type}\n{payload}")
+            return
+        except Exception as e:
+            logger.error(f"Error publishing broadcast, sending locally: {e}")
+    await manager.broadcast(payload, event_type=event_type)
 
-    elif event_type == 'grid-status-requested':
-        formatted.update({
-            "message": f"Grid status for {symbol}",
-            "is_active": data.get('is_active', False),
-            "has_live_grid": data.get('has_live_grid', False),
-            "grid_data": data.get('grid_data')
-        })
 
-    elif event_type == 'test-event':
-        formatted.update({
-            "message": data.get('message', 'Test event'),
-            "test": True
-        })
+def local_stats() -> dict:
+    return {
+        "worker": WORKER_ID,
+        "active_connections": len(manager.active_connections),
+        "total_connections": manager.connection_count,
+        "queues": manager.queue_stats(),
+        "symbols": {symbol: len(conns) for symbol, conns in manager.by_symbol.items()},
+        "channels": {channel: len(conns) for channel, conns in manager.by_channel.items()},
+        "updated_at": time.time()
+    }
 
-    else:
-        # Для неизвестных событий отправляем как есть
-        formatted.update({
-            "message": f"Unknown event: {event_type}",
-            "raw_data": data
-        })
 
-    return formatted
+async def heartbeat():
+    """Периодически публикует статистику воркера в Redis"""
+    while True:
+        try:
+            await redis_client.hset(WORKERS_KEY, WORKER_ID, json.dumps(local_stats()))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Error publishing worker stats: {e}")
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def cluster_stats() -> list[dict]:
+    """Статистика всех живых воркеров; свои данные всегда свежие"""
+    stats = {WORKER_ID: local_stats()}
+    if not redis_client:
+        return list(stats.values())
+
+    try:
+        raw = await redis_client.hgetall(WORKERS_KEY)
+    except Exception as e:
+        logger.warning(f"Error reading worker stats: {e}")
+        return list(stats.values())
+
+    now = time.time()
+    stale = []
+    for worker_id, data in raw.items():
+        if worker_id == WORKER_ID:
+            continue
+        item = json.loads(data)
+        if now - item.get("updated_at", 0) > WORKER_TTL:
+            stale.append(worker_id)
+        else:
+            stats[worker_id] = item
+
+    if stale:
+        await redis_client.hdel(WORKERS_KEY, *stale)
+    return list(stats.values())
+
+
+def _sum_counts(stats: list[dict], field: str) -> dict:
+    total = {}
+    for item in stats:
+        for key, count in item.get(field, {}).items():
+            total[key] = total.get(key, 0) + count
+    return total
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
-    global redis_task, redis_client
+    global redis_task, broadcast_task, heartbeat_task, redis_client
 
     logger.info("Starting WebSocket server...")
 
@@ -299,8 +935,10 @@ async def lifespan(app: FastAPI):
 
     # Запускаем Redis listener только если Redis доступен
     if redis_client:
-        redis_task = asyncio.create_task(redis_listener())
-        logger.info("Redis listener task started")
+        redis_task = asyncio.create_task(events_consumer())
+        broadcast_task = asyncio.create_task(broadcast_listener())
+        heartbeat_task = asyncio.create_task(heartbeat())
+        logger.info(f"Redis listener task started (worker {WORKER_ID})")
     else:
         logger.info("Server started without Redis")
 
@@ -309,6 +947,12 @@ async def lifespan(app: FastAPI):
     # Shutdown
     logger.info("Shutting down WebSocket server...")
 
+    if heartbeat_task:
+        heartbeat_task.cancel()
+
+    if broadcast_task:
+        broadcast_task.cancel()
+
     if redis_task:
         redis_task.cancel()
         try:
@@ -317,6 +961,10 @@ async def lifespan(app: FastAPI):
             logger.info("Redis listener task cancelled")
 
     if redis_client:
+        try:
+            await redis_client.hdel(WORKERS_KEY, WORKER_ID)
+        except Exception:
+            pass
         await redis_client.close()
         logger.info("Redis connection closed")
 
@@ -359,13 +1007,11 @@ async def websocket_endpoint(websocket: WebSocket):
 
             except asyncio.TimeoutError:
                 # Отправляем ping для поддержания соединения
-                try:
-                    await websocket.send_text(
-                        json.dumps({"type": "ping", "timestamp": asyncio.get_event_loop().time()}))
-                    logger.debug("Sent ping to client")
-                except Exception as e:
-                    logger.error(f"Error sending ping: {e}")
+                if websocket not in manager.clients:
                     break
+                await manager.send_personal_message(
+                    {"type": "ping", "timestamp": asyncio.get_event_loop().time()}, websocket)
+                logger.debug("Sent ping to client")
 
     except WebSocketDisconnect:
         logger.info("Client disconnected normally")
@@ -382,20 +1028,20 @@ async def handle_message(message: dict, websocket: WebSocket):
     logger.info(f"Handling message type: {message_type}")
 
     if message_type == 'ping':
-        await manager.send_personal_message(json.dumps({
+        await manager.send_personal_message({
             "type": "pong",
             "timestamp": asyncio.get_event_loop().time()
-        }), websocket)
+        }, websocket)
 
     elif message_type == 'pong':
         logger.debug("Received pong from client")
 
     elif message_type == 'echo':
-        await manager.send_personal_message(json.dumps({
+        await manager.send_personal_message({
             "type": "echo_response",
             "data": message.get('data', ''),
             "timestamp": asyncio.get_event_loop().time()
-        }), websocket)
+        }, websocket)
 
     elif message_type == 'broadcast_test':
         # Тестовый broadcast для всех клиентов
@@ -404,7 +1050,7 @@ async def handle_message(message: dict, websocket: WebSocket):
             "message": message.get('message', 'Test broadcast'),
             "timestamp": asyncio.get_event_loop().time()
         })
-        await manager.broadcast(test_message)
+        await publish_broadcast(test_message, "test_broadcast")
 
     elif message_type == 'subscribe':
         # Подписка на определенные данные/символы
@@ -414,33 +1060,50 @@ async def handle_message(message: dict, websocket: WebSocket):
         # Сохраняем подписки клиента
         manager.add_subscription(websocket, channel, symbols)
 
-        await manager.send_personal_message(json.dumps({
+        subscription_result = {
             "type": "subscription_result",
             "channel": channel,
             "symbols": symbols,
             "result": True,
             "message": f"Subscribed to {channel} for symbols: {symbols}"
-        }), websocket)
+        }
+
+        # Клиент может выбрать компактную кодировку и сжатие крупных сообщений при подписке
+        if 'encoding' in message:
+            subscription_result["encoding"] = manager.set_encoding(websocket, message['encoding'])
+        if 'compress' in message:
+            subscription_result["compress"] = manager.set_compress(websocket, bool(message['compress']))
+
+        # Переподключившийся клиент получает только пропущенные события
+        last_event_id = message.get('last_event_id')
+        if last_event_id:
+            subscription_result.update(await replay_events(websocket, last_event_id))
+        else:
+            client = manager.clients.get(websocket)
+            if client is not None and client.holding:
+                manager.release_held(client)
+
+        await manager.send_personal_message(subscription_result, websocket)
 
     elif message_type == 'unsubscribe':
         # Отписка от данных
         channel = message.get('channel', 'default')
-        manager.remove_subscription(websocket, channel)
+        manager.remove_subscription(websocket, channel, message.get('symbols'))
 
-        await manager.send_personal_message(json.dumps({
+        await manager.send_personal_message({
             "type": "unsubscription_result",
             "channel": channel,
             "result": True,
             "message": f"Unsubscribed from {channel}"
-        }), websocket)
+        }, websocket)
 
     else:
         # Отправляем обратно неизвестное сообщение
-        await manager.send_personal_message(json.dumps({
+        await manager.send_personal_message({
             "type": "unknown_message",
             "original": message,
             "timestamp": asyncio.get_event_loop().time()
-        }), websocket)
+        }, websocket)
 
 
 @app.get("/")
@@ -466,11 +1129,32 @@ async def health_check():
     else:
         redis_status = "not_configured"
 
+    stats = await cluster_stats()
+    queues = [item["queues"] for item in stats]
+
     return {
         "status": "healthy",
-        "active_connections": len(manager.active_connections),
+        "worker": WORKER_ID,
+        "workers": len(stats),
+        "active_connections": sum(item["active_connections"] for item in stats),
         "redis_status": redis_status,
-        "total_connections": manager.connection_count
+        "total_connections": sum(item["total_connections"] for item in stats),
+        "queues": {
+            "total_depth": sum(q["total_depth"] for q in queues),
+            "max_depth": max(q["max_depth"] for q in queues),
+            "lagging_clients": sum(q["lagging_clients"] for q in queues),
+            "dropped": sum(q["dropped"] for q in queues),
+            "conflated": sum(q["conflated"] for q in queues),
+            "evicted": sum(q["evicted"] for q in queues)
+        },
+        "per_worker": [
+            {
+                "worker": item["worker"],
+                "active_connections": item["active_connections"],
+                "queues": item["queues"]
+            }
+            for item in stats
+        ]
     }
 
 
@@ -483,26 +1167,34 @@ async def broadcast_message(message: dict):
         "timestamp": asyncio.get_event_loop().time()
     })
 
-    await manager.broadcast(broadcast_data)
+    await publish_broadcast(broadcast_data, "api_broadcast")
 
+    stats = await cluster_stats()
     return {
         "status": "success",
         "message": "Message broadcasted",
-        "active_connections": len(manager.active_connections)
+        "active_connections": sum(item["active_connections"] for item in stats)
     }
 
 
 @app.get("/subscriptions")
 async def get_subscriptions():
-    """Получить информацию о текущих подписках"""
+    """Получить информацию о текущих подписках.
+
+    Подробный список — по подключениям этого воркера, счётчики — по всем воркерам.
+    """
     subs_info = {}
-    for ws, subs in manager.subscriptions.items():
-        # Используем id WebSocket как ключ (не очень красиво, но для отладки подойдет)
-        subs_info[f"connection_{id(ws)}"] = subs
+    for client in manager.clients.values():
+        subs_info[f"connection_{client.connection_id}"] = client.to_dict()
 
+    stats = await cluster_stats()
     return {
-        "active_connections": len(manager.active_connections),
-        "subscriptions": subs_info
+        "worker": WORKER_ID,
+        "workers": len(stats),
+        "active_connections": sum(item["active_connections"] for item in stats),
+        "subscriptions": subs_info,
+        "symbols": _sum_counts(stats, "symbols"),
+        "channels": _sum_counts(stats, "channels")
     }
 
 
@@ -538,11 +1230,13 @@ async def test_grid_event(
     }
 
     try:
-        result = await redis_client.publish("events", json.dumps(event_data))
+        event_id = await redis_client.xadd(
+            EVENTS_STREAM, {"event": json.dumps(event_data)}, maxlen=EVENTS_MAXLEN, approximate=True
+        )
         return {
             "status": "success",
             "event_sent": event_data,
-            "subscribers_notified": result
+            "event_id": event_id
         }
     except Exception as e:
         return {"error": str(e)}
@@ -551,11 +1245,25 @@ async def test_grid_event(
 if __name__ == "__main__":
     import uvicorn
 
-    logger.info("Starting WebSocket server directly...")
-    uvicorn.run(
-        app,
-        host="0.0.0.0",
-        port=8001,
-        log_level="info",
-        access_log=True
-    )
\ No newline at end of file
+    logger.info(f"Starting WebSocket server directly ({WS_WORKERS} workers)...")
+    if WS_WORKERS > 1:
+        # Воркеры uvicorn делят один слушающий сокет на порту 8001,
+        # для этого приложение передаётся строкой импорта
+        uvicorn.run(
+            f"{__spec__.name if __spec__ else 'ws_server'}:app",
+            host="0.0.0.0",
+            port=8001,
+            workers=WS_WORKERS,
+            ws_per_message_deflate=False,
+            log_level="info",
+            access_log=True
+        )
+    else:
+        uvicorn.run(
+            app,
+            host="0.0.0.0",
+            port=8001,
+            ws_per_message_deflate=False,
+            log_level="info",
+            access_log=True
+        )
\ No newline at end of file
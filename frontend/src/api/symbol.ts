@@ -1,9 +1,3 @@
-export async function getPrice(symbol: string): Promise<number> {
-  const res = await fetch(`/api/price?symbol=${symbol}`)
-  const json = await res.json()
-  return parseFloat(json?.price ?? 0)
-}
-
 export async function getGridStatus(symbol: string): Promise<string> {
   const res = await fetch(`/api/grid-trade?symbol=${symbol}`)
   const json = await res.json()
@@ -26,4 +20,14 @@ export async function stopGrid(symbol: string): Promise<void> {
   await fetch(`/api/grid-trade/stop?symbol=${symbol}`, {
     method: 'POST',
   })
-}
\ No newline at end of file
+}
+
+export async function getPrices(symbols: string[]): Promise<Record<string, number | null>> {
+  const res = await fetch(`/api/prices?symbols=${symbols.join(',')}`)
+  const json = await res.json()
+  const prices: Record<string, number | null> = {}
+  for (const [symbol, price] of Object.entries(json?.prices ?? {})) {
+    prices[symbol] = price == null ? null : parseFloat(price as string)
+  }
+  return prices
+}
@@ -1,7 +1,6 @@
 import { useEffect, useState } from 'react'
 import { useWebSocket } from '../websocket/WebSocketClient'
 import {
-  getPrice,
   getGridStatus,
   getGrid,
   startGrid,
@@ -14,10 +13,11 @@ import ExportLogsButton from './ExportLogsButton'
 
 interface Props {
   symbol: string
+  // Цена приходит от родителя: цены всех карточек — одним запросом /api/prices
+  price?: number | null
 }
 
-export default function SymbolCard({ symbol }: Props) {
-  const [price, setPrice] = useState(0)
+export default function SymbolCard({ symbol, price }: Props) {
   const [status, setStatus] = useState('—')
   const [grid, setGrid] = useState([])
   const [logs, setLogs] = useState([])
@@ -30,7 +30,6 @@ export default function SymbolCard({ symbol }: Props) {
   const symbolEvents = getGridEvents(symbol)
 
   useEffect(() => {
-    getPrice(symbol).then(setPrice)
     getGridStatus(symbol).then(setStatus)
     getGrid(symbol).then(setGrid)
     getLogs(symbol).then(setLogs)
@@ -118,7 +117,7 @@ export default function SymbolCard({ symbol }: Props) {
       </div>
 
       <p className="text-sm text-gray-400 mt-2">
-        Price: <span className="text-white">${price.toFixed(2)}</span>
+        Price: <span className="text-white">${(price ?? 0).toFixed(2)}</span>
       </p>
 
       {/* WebSocket status info */}
@@ -1,14 +1,25 @@
+import { useEffect, useState } from 'react'
 import SymbolCard from '../components/SymbolCard'
 import SymbolsList from '../components/SymbolsList'
+import { getPrices } from '../api/symbol'
+
+const SYMBOLS = ['BTCUSDT', 'ETHUSDT']
 
 export default function Dashboard() {
+  const [prices, setPrices] = useState<Record<string, number | null>>({})
+
+  useEffect(() => {
+    getPrices(SYMBOLS).then(setPrices)
+  }, [])
+
   return (
     <div className="p-4 grid grid-cols-1 md:grid-cols-2 xl:grid-cols-3 gap-4">
         <h1>Dashboard</h1>
         <SymbolsList />
 
-      <SymbolCard symbol="BTCUSDT" />
-      <SymbolCard symbol="ETHUSDT" />
+      {SYMBOLS.map((symbol) => (
+        <SymbolCard key={symbol} symbol={symbol} price={prices[symbol]} />
+      ))}
     </div>
   )
 }